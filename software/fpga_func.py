@@ -2,19 +2,32 @@
 This is the top-level program.
 """
 
+import itertools
 import logging
 import time
 import sys
 import time
+from functools import partial
+
+import numpy as np
 
 # Sanity check to make sure Python interpreter is with the compatible version with `OK` package
 assert sys.version_info.major == 3 and sys.version_info.minor == 5, "OK FrontPanel only complies with Python 3.5"
 
 from fpga_host.cmd_parser import CmdlineParser
+from fpga_host.config_cache import ConfigCache
 from fpga_host.fpga_tester import FPGATester
 from fpga_host.logger import setup_logger
 from fpga_host.transmission_data import TransData
 from fpga_host.data_gen import DataGen
+from fpga_host.fifo_program import FifoProgram
+from fpga_host.device_pool import DevicePool, frontpanel_device, sim_device
+from fpga_host.offset_calibration import CalibrationTable, ColumnStats
+from fpga_host.sim_device import LatencyModel, SimFrontPanel
+from fpga_host.sweep_patterns import AppendRandom, PlusF, PlusOne, PlusOneEach
+from fpga_host.sweep_pipeline import SweepPipeline
+from fpga_host.transaction_log import TransactionReplay
+from fpga_host.wait_policy import POLICIES
 
 DEBUG = True  # Knob to bypass the error w/o FPGA
 
@@ -30,33 +43,108 @@ path_act = 'DataOut/Activation.txt'
 # Main Function
 # ----------------------------------------------------#
 class FpgaFunc:
+    SWEEP_BLOCK = 250  # Cycles taken at once from the activations of `sweep`, a multiple of the MAC batch size
+
     def __init__(self):
         self.args = CmdlineParser().parse()
-        self.fpga_tester = FPGATester(self.args.fpga_bit, debug=DEBUG)
+        device = None
+        if self.args.sim:
+            device = SimFrontPanel(getattr(LatencyModel, self.args.sim_latency)(),
+                                   mac_trigger=self.args.sim_mac_trigger)
+        config_cache = ConfigCache(self.args.config_cache) if self.args.config_cache else None
+        self.fpga_tester = FPGATester(self.args.fpga_bit, debug=DEBUG, device=device,
+                                      endpoint_stats=self.args.endpoint_stats, record=self.args.record,
+                                      config_cache=config_cache)
+        self.fpga_tester.set_pipe_block_size("FIFOA_IN_DATA", self.args.fifoa_block)
+        self.fpga_tester.set_pipe_block_size("FIFOB_OUT_DATA", self.args.fifob_block)
+        if self.args.usb_worker:
+            self.fpga_tester.start_usb_worker()
         self.logger = logging.getLogger('CIM_Process')
-        self.trans = TransData(self.fpga_tester)
+        self.trans = TransData(self.fpga_tester, POLICIES[self.args.wait_policy](),
+                               weight_cache_bytes=self.args.weight_cache_kb * 1024)
+        self.calibration = CalibrationTable(self.args.calibration) if self.args.calibration else None
+        self.pipeline = SweepPipeline(self.args.pipeline_depth) if self.args.pipeline_depth > 0 else None
+        self.pool = None
+        if self.args.boards > 0:
+            self.pool = self.device_pool(self.args.boards)
+
+    def device_pool(self, boards):
+        """Pool of the first `boards` boards attached to the host (simulated boards with --sim)"""
+        if self.args.sim:
+            serials = ["SIM{:05d}".format(i) for i in range(boards)]
+            device_factory = partial(sim_device, latency=getattr(LatencyModel, self.args.sim_latency)(),
+                                     mac_trigger=self.args.sim_mac_trigger)
+            serials = DevicePool.enumerate(SimFrontPanel(bus=serials))
+        else:
+            serials = DevicePool.enumerate()
+            device_factory = frontpanel_device
+        assert len(serials) >= boards, "Only {} boards attached.".format(len(serials))
+        return DevicePool(serials[:boards], device_factory, self.args, debug=DEBUG)
     # ----------------------------------------------------#  
     # Initial and Reset FPGA Host and logic
     # ----------------------------------------------------#  
     def fpga_init(self):
+        if self.pool is not None:
+            self.pool.start()                       # Each worker initializes and resets its own board
+            return
         # Initialize and configure FPGA
         self.fpga_tester.initialize_device()
         # Reset and update all the signals 
         self.trans.reset_host()
         # Reset Chip
         self.trans.reset_chip()
+        # Column offsets of the decoder: calibration of the chip if any, else the built-in ones
+        if self.calibration is not None and self.chip_id() is None:
+            self.logger.warning("Board without serial number: built-in column offsets, give --chip_id to use "
+                                "the calibration table.")
+        elif self.calibration is not None:
+            offsets = self.calibration.lookup(self.chip_id())
+            self.logger.info("Chip {}: {} column offsets.".format(
+                self.chip_id(), "built-in" if offsets is None else "calibrated"))
+            self.trans.load_offsets(offsets)
+
+    def chip_id(self):
+        """Key of the chip in the calibration table: --chip_id, else the serial number of the board,
+        None for a board without serial number (boards must not share one entry)"""
+        if self.args.chip_id:
+            return self.args.chip_id
+        return str(self.fpga_tester.serial) if self.fpga_tester.serial else None
     # ----------------------------------------------------#
     # Run the FPGA Host
     # ----------------------------------------------------#
     def run_host(self): 
         """Here we call the following fuctions to do data tx and computing"""
-        self.access_reg()
-        # for _ in range(50):
-        #     self.mac_offset_measure()
-        # self.offset_compen()
-        self.edges()
-        # self.plus_one()
-        # self.act_shift_append()
+        try:
+            if self.pool is None:
+                self.access_reg()           # Device pool: every worker sets up its own board
+            # for _ in range(50):
+            #     self.mac_offset_measure()   # Single board only
+            # self.offset_compen()
+            self.edges()
+            # self.plus_one()
+            # self.act_shift_append()
+            # self.pipe_mode_benchmark()      # Single board only
+        finally:
+            if self.pool is not None:
+                self.pool.stop()            # Also on failure: the workers would keep the process alive
+        if self.pool is not None:
+            return                          # Every worker logs the statistics of its own board
+        self.trans.wait_policy.log_stats()
+        self.trans.weight_cache.log_stats()
+        self.trans.shadow.log_stats()
+        if self.trans.theory_tracker is not None:
+            self.trans.theory_tracker.log_stats()
+        if self.pipeline is not None:
+            self.pipeline.log_stats()
+        self.fpga_tester.stats.log_stats()
+        self.fpga_tester.stop_usb_worker()
+        self.fpga_tester.stop_recording()
+
+    def replay(self, path):
+        """Re-issue a recorded transaction log on the device as fast as possible: the pure USB cost of the
+        recorded run, without host-side processing"""
+        self.fpga_tester.initialize_device()
+        return TransactionReplay(path).replay(self.fpga_tester.device, sync=self.args.replay_sync)
 
     def mac_offset_measure(self):
         """Measure the offset of each column, full0 and fullF weights"""
@@ -64,99 +152,131 @@ class FpgaFunc:
         # weights = DataGen.array_fullzeros(512)
         weights = DataGen.array_fullff(512)
         outputs = []
-        self.cim_processing(activations,weights,outputs)     
-        outputs_theory = self.trans.output_theory(activations, weights)
+        outputs_theory = self.cim_processing(activations, weights, outputs,
+                                             host_work=lambda: self.trans.output_theory(activations, weights))
         print(outputs)
         print('Theory: {} '.format(outputs_theory))
         with open(path_out,'a') as filea:
                 filea.write("%s\n" % outputs)
         
+    def calibrate_offsets(self, samples):
+        """Measure the offset of each column over `samples` MACs (full0 activations and fullF weights as in
+        `mac_offset_measure`) by batches, keeping streaming statistics only, and store the median of each
+        column as the calibration of the chip, used by the decoder from now on"""
+        assert samples > 0 and self.pool is None and self.calibration is not None, "invalid inputs"
+        assert self.chip_id() is not None, "Board without serial number, give --chip_id to store its calibration."
+        self.access_reg()
+        activations = DataGen.act_pulsecompen(DataGen.array_fullzeros(32))
+        weights = DataGen.array_fullff(512)
+        stats = ColumnStats(seed=self.args.seed)
+        batch_size = self.trans.batch_size()
+        start = time.perf_counter()
+        for begin in range(0, samples, batch_size):
+            count = min(batch_size, samples - begin)
+            outdata_re, _ = self.trans.mac_batch([activations] * count, weights if begin == 0 else bytearray(0))
+            stats.update(self.trans.decode_raw(outdata_re))   # Theory outputs are 0: raw outputs are the offsets
+        offsets = self.calibration.store(self.chip_id(), stats)
+        changed = np.count_nonzero(offsets != self.trans.offsets)
+        self.trans.load_offsets(offsets)
+        self.logger.info("Chip {}: {} MACs in {:.2f} s, {} column offsets changed, std up to {:.2f}.".format(
+            self.chip_id(), stats.count, time.perf_counter() - start, changed, stats.std().max()))
+        return offsets
+
     def offset_compen(self):
         """64 cycles operation: each time append a 4'b1111 on activations
         """
-        activations = DataGen.array_fullzeros(32)
         weights = DataGen.array_fullzeros(512)
         # weights = DataGen.array_fullff(512)
-        # Weights are modified to 0 later, so keep the weights for theory data calculation
-        weights_theory = weights.copy()
-        outputs = []
-        for _ in range(65): # from 64 of 0 to 64 of 4'b1111: 65 cycles
-            self.cim_processing(activations,weights,outputs)     
-            outputs_theory = self.trans.output_theory(activations, weights_theory)
-            print(outputs)
-            print('Theory: {} '.format(outputs_theory))
-            activations = DataGen.act_plus_f(activations)
-            weights.clear()                         # Clear weight data
-            with open(path_out,'a') as filea:
-                filea.write("%s\n" % outputs)
-            with open(path_outtheory,'a') as fileb:
-                fileb.write("%s\n" % outputs_theory)
-            self.clear_act_reg()                    # Clear activation flag
+        pattern = PlusF(65)  # from 64 of 0 to 64 of 4'b1111: 65 cycles
+        self.sweep(weights, pattern.vectors(), persist=self.persist_outputs)
         
     def edges(self):
-        activations = DataGen.array_fullzeros(32)
         weights = DataGen.array_fullzeros(512)
         # weights = DataGen.array_fullff(512)
-        outputs = []
-        for _ in range(16): # from 64 of 0 to 64 of 4'b1111: 16 cycles
-            self.cim_processing(activations,weights,outputs)     
-            outputs_theory = self.trans.output_theory(activations, weights)
-            print(outputs)
-            print('Theory: {} '.format(outputs_theory))
-            activations = DataGen.act_plusone_each(activations)
-            with open(path_out,'a') as filea:
-                filea.write("%s\n" % outputs)
-            with open(path_outtheory,'a') as fileb:
-                fileb.write("%s\n" % outputs_theory)
+        pattern = PlusOneEach(17)
+
+        def persist(index, outputs, outputs_theory):
+            self.persist_outputs(index, outputs, outputs_theory)
             with open(path_act,'a') as file_act:
-                file_act.write("%s\n" % activations)
+                file_act.write("%s\n" % pattern.vector(index + 1))   # Activations of the next cycle
+        # from 64 of 0 to 64 of 4'b1111: 16 cycles, the weights written with every cycle (skipped while
+        # loaded) and the activation flag never cleared in between, as this test has always run
+        self.sweep(weights, itertools.islice(pattern.vectors(), 16), persist=persist,
+                   weights_each_cycle=True, clear_act=False)
     
     def plus_one(self):
-        activations = DataGen.array_fullzeros(32)
         # weights = DataGen.array_fullzeros(512)
         weights = DataGen.array_fullff(512)
-        weights_calcu = weights.copy()
-        outputs = []
-        for _ in range(961): # from 64 of 0 to 64 of 4'b1111: 961 cycles
-            self.cim_processing(activations,weights,outputs)     
-            outputs_theory = self.trans.output_theory(activations, weights_calcu)
-            print(outputs)
-            print('Theory: {} '.format(outputs_theory))
-            #activations.reverse()
-            activations = DataGen.act_plus_one(activations)
-            #activations.reverse()
-            weights.clear()
-            with open(path_out,'a') as filea:
-                filea.write("%s\n" % outputs)
-            with open(path_outtheory,'a') as fileb:
-                fileb.write("%s\n" % outputs_theory)
-            self.clear_act_reg()
+        pattern = PlusOne(961)  # from 64 of 0 to 64 of 4'b1111: 961 cycles
+        self.sweep(weights, pattern.vectors(), persist=self.persist_outputs)
 
     def act_shift_append(self):
-        activations = DataGen.array_constant(32, 255)
-        weights = DataGen.array_random(512)
+        pattern = AppendRandom(131, start=DataGen.array_constant(32, 255), seed=self.args.seed)
+        self.logger.warning('Random sweep seed: {}'.format(pattern.seed))
+        weights = DataGen.array_random(512, np.random.default_rng([pattern.seed]))
         with open(path_wei,'a') as filew:
             filew.write("%s\n" % weights)
-        weights_theory = weights.copy() # keep weights for theory calculation
-        outputs = []
-        outputs_scale = []
-        for _ in range(130): # append act data from all 0 to 64 act (65 cycles)
-            self.cim_processing(activations,weights,outputs)   
-            self.clear_act_reg()                    # Clear activation flag  
-            self.cim_processing_scale(activations,weights,outputs_scale)        
-            outputs_theory = self.trans.output_theory(activations, weights_theory)
-            
-            activations = DataGen.act_append_random(activations)
-            weights.clear()                         # Clear weight data
+        cycles = len(pattern) - 1  # The last vector is only persisted, as the next activations of the last cycle
+        plain = []  # Outputs and theory outputs of the last plain MAC
+
+        def persist(index, outputs, outputs_theory):
+            if index % 2 == 0:
+                plain[:] = [outputs, outputs_theory]
+                return
             with open(path_out,'a') as fout:
-                fout.write("%s\n" % outputs)
+                fout.write("%s\n" % plain[0])
             with open(path_out_scale,'a') as fout_s:
-                fout_s.write("%s\n" % outputs_scale)
+                fout_s.write("%s\n" % outputs)
             with open(path_outtheory,'a') as fout_theory:
-                fout_theory.write("%s\n" % outputs_theory)
+                fout_theory.write("%s\n" % plain[1])
             with open(path_act,'a') as file_act:
-                file_act.write("%s\n" % activations)
-            self.clear_act_reg()                    # Clear activation flag
+                file_act.write("%s\n" % pattern.vector(index // 2 + 1))
+        # Each cycle runs the plain MAC then the MAC with scaled activations
+        self.sweep(weights, (act for act in itertools.islice(pattern.vectors(), cycles) for _ in range(2)),
+                   scaled=[False, True] * cycles, persist=persist)
+
+    def persist_outputs(self, index, outputs, outputs_theory):
+        """Print the outputs of one sweep cycle and its theory outputs, and append them to the output files"""
+        print(outputs)
+        print('Theory: {} '.format(outputs_theory))
+        with open(path_out,'a') as filea:
+            filea.write("%s\n" % outputs)
+        with open(path_outtheory,'a') as fileb:
+            fileb.write("%s\n" % outputs_theory)
+
+    def pipe_mode_benchmark(self, repeat=20):
+        """Time weight loads into FIFOA and output drains from FIFOB with the plain pipe and block pipes
+        """
+        weights = DataGen.array_random(512)
+        activations = DataGen.array_random(32)
+        for block_size in (0, 16, 64, 256, 1024, 4096):
+            self.fpga_tester.set_pipe_block_size("FIFOA_IN_DATA", block_size)
+            elapsed = 0
+            for _ in range(repeat):
+                self.clear_aw_reg()
+                start = time.perf_counter()
+                self.trans.write_weights(weights)
+                elapsed += time.perf_counter() - start
+                # Let FIFOA drain before the next load
+                self.trans.wait_policy.wait('weights_loaded', lambda: self.fpga_tester.sta_chip() & 0x2)
+            self.logger.critical('FIFOA block size {}: {:.3f} ms per weight load'.format(
+                block_size, elapsed / repeat * 1e3))
+        for block_size in (0, 16, 32, 64, 320):
+            self.fpga_tester.set_pipe_block_size("FIFOB_OUT_DATA", block_size)
+            elapsed = 0
+            for _ in range(repeat):
+                self.clear_act_reg()
+                self.trans.write_activations(activations)
+                self.trans.mac_assert_finish()
+                self.trans.fetch_output()
+                self.trans.wait_policy.wait('fifob_full', self.fpga_tester.fifob_progfull)
+                start = time.perf_counter()
+                self.fpga_tester.fifo_read(bytearray(320))
+                elapsed += time.perf_counter() - start
+            self.logger.critical('FIFOB block size {}: {:.3f} ms per output drain'.format(
+                block_size, elapsed / repeat * 1e3))
+        self.fpga_tester.set_pipe_block_size("FIFOA_IN_DATA", self.args.fifoa_block)
+        self.fpga_tester.set_pipe_block_size("FIFOB_OUT_DATA", self.args.fifob_block)
     # ----------------------------------------------------#
     # Function for One cycle of MAC Operation 
     # ----------------------------------------------------#
@@ -164,65 +284,163 @@ class FpgaFunc:
         """Access inner registers of the chip
         """
         self.trans.reset_host()
-        # Prepare the bytearray to be written into FIFOA
-        w_to_reg=bytearray(0)
-        self.trans.wdata_fifoa_append(0x14,0x0090,w_to_reg)  # Set Start Bit to 9
-        self.trans.wdata_fifoa_append(0x00,0x0003,w_to_reg)  # Clear status of Chip
-        self.trans.wdata_fifoa_append(0x2C,0x0003,w_to_reg)  # Enable weight and actvation writing
-        self.trans.wdata_fifoa_append(0x00,0x0003,w_to_reg)  # Clear status of Chip 
-        self.trans.rdata_fifob_append(0x00,w_to_reg)         # 2x32bit in FIFOB
-        self.trans.rdata_fifob_append(0x10,w_to_reg)   
-        self.trans.rdata_fifob_append(0x14,w_to_reg) 
-        self.trans.rdata_fifob_append(0x2C,w_to_reg)  
-        # Pipe data into inner regs
-        self.trans.pipe_data_in(w_to_reg)
-        # Read out data from those address
+        # Write inner regs, the writes the chip shadow proves to be no-ops are dropped
+        self.trans.write_regs([(0x14, 0x0090),     # Set Start Bit to 9
+                               (0x00, 0x0003),     # Clear status of Chip
+                               (0x2C, 0x0003),     # Enable weight and actvation writing
+                               (0x00, 0x0003)])    # Clear status of Chip
+        # Read out data from those address: compiled once
+        r_from_reg = FifoProgram.constant("access_reg", self.access_reg_program)
+        self.trans.pipe_data_in(r_from_reg.data)
         self.trans.pipe_data_out(num=4) 
         # Number of regs to be read, num must be even numbers
+    @classmethod
+    def access_reg_program(cls):
+        program = FifoProgram()
+        program.read(0x00)              # 2x32bit in FIFOB
+        program.read(0x10)
+        program.read(0x14)
+        program.read(0x2C)
+        return program
+
     def clear_act_reg(self):
-        self.trans.reset_host()
-        w_to_reg=bytearray(0)
-        self.trans.wdata_fifoa_append(0x00,0x0001,w_to_reg)  # Clear status of Activation ready
-        self.trans.wdata_fifoa_append(0x00,0x0001,w_to_reg)  # Clear status of Activation ready
-        # Pipe data into inner regs
-        self.trans.pipe_data_in(w_to_reg)
+        self.trans.clear_act_reg()
         
     def clear_aw_reg(self):
         self.trans.reset_host()
-        w_to_reg=bytearray(0)
-        self.trans.wdata_fifoa_append(0x00,0x0003,w_to_reg)  # Clear status of Activation ready
-        self.trans.wdata_fifoa_append(0x00,0x0003,w_to_reg)  # Clear status of Activation ready
-        # Pipe data into inner regs
-        self.trans.pipe_data_in(w_to_reg)
+        self.trans.clear_status(0x0003)         # Clear status of Activation and Weight ready
     # ----------------------------------------------------#
-    def cim_processing(self, activations:bytearray, weights:bytearray, outputs:list):
+    def cim_processing(self, activations:bytearray, weights:bytearray, outputs:list, host_work=None):
         """One cycle of MAC Operation
+        host_work: optional callable (e.g. theory computation) run while the pipe transfers are in flight,
+        its result is returned
         """
-        self.trans.update_wires()
-        if len(weights) !=0:
-            self.trans.write_weights(weights)               # Write weights only when new weight data is avaliable
-        activations_new= DataGen.act_pulsecompen(activations)
-        self.trans.write_activations(activations_new)           # Write activations
-        self.trans.mac_assert_finish() 
-        outdata_re = self.trans.get_640b_out()
+        outdata_re, result = self.trans.mac_cycle(DataGen.act_pulsecompen(activations), weights,
+                                                  fused=self.args.fused_mac, host_work=host_work)
         self.trans.decode_out(outdata_re, outputs)
+        return result
+    # ----------------------------------------------------#
+    def sweep(self, weights:bytearray, activations, scaled=None, persist=None, weights_each_cycle=False,
+              clear_act=True):
+        """One MAC cycle per activation vector, sharded across the device pool if any, else on this board.
+        By default, weights are written with the first cycle only and the activation flag is cleared after
+        every cycle
+        activations: activation vectors in cycle order, a list or a lazy iterable (e.g. `SweepPattern.vectors()`),
+        generated SWEEP_BLOCK cycles at a time, or one by one ahead of the board by the sweep pipeline
+        scaled: optional list of flags, True to run the cycle with scaled activations (`cim_processing_scale`)
+        persist: optional callable(index, outputs, outputs_theory) called for every cycle in cycle order,
+        overlapped with the next cycles by the sweep pipeline if any (`sweep_pipelined`)
+        weights_each_cycle: write the weights with every cycle (skipped by `TransData.write_weights` while loaded)
+        clear_act: clear the activation flag after every cycle
+        Return the lists of outputs and theory outputs (None for scaled cycles) in cycle order
+        """
+        # The batch sequence: weights once, activation flag cleared after every vector
+        batched = self.args.batch_mac and not any(scaled or ()) and not weights_each_cycle and clear_act
+        if self.pool is None and not batched and self.pipeline is not None:
+            return self.sweep_pipelined(weights, activations, scaled, persist, weights_each_cycle, clear_act)
+        outputs_list, theory_list = [], []
+        vectors = iter(activations)
+        for begin in itertools.count(0, self.SWEEP_BLOCK):
+            block = list(itertools.islice(vectors, self.SWEEP_BLOCK))
+            if not block:
+                break
+            block_scaled = [False] * len(block) if scaled is None else scaled[begin:begin + len(block)]
+            block_outputs, block_theory = self.sweep_block(weights, block, block_scaled, begin == 0, batched,
+                                                           weights_each_cycle, clear_act)
+            if persist is not None:
+                for i, (outputs, outputs_theory) in enumerate(zip(block_outputs, block_theory)):
+                    persist(begin + i, outputs, outputs_theory)
+            outputs_list.extend(block_outputs)
+            theory_list.extend(block_theory)
+        return outputs_list, theory_list
+
+    def sweep_block(self, weights:bytearray, activations_list:list, scaled:list, first:bool, batched:bool,
+                    weights_each_cycle=False, clear_act=True):
+        """The cycles of one block of `sweep`, `first` for the block starting at cycle 0
+        Return the lists of outputs and theory outputs of the block
+        """
+        weights_theory = weights.copy()
+        # Theory outputs of all the cycles in one matrix product
+        theory = lambda: [None if scaled[i] else list(outputs_theory) for i, outputs_theory
+                          in enumerate(self.trans.theory_batch(activations_list, weights_theory))]
+        if self.pool is not None:
+            # Weights loaded with the first cycle of every board (skipped while loaded)
+            return self.pool.run(weights, activations_list, scaled, host_work=theory,
+                                 weights_each_cycle=weights_each_cycle, clear_act=clear_act)
+        if batched:
+            return self.sweep_batched(weights if first else bytearray(0), activations_list, host_work=theory)
+        theory_list = theory()
+        outputs_list = []
+        for i, activations in enumerate(activations_list):
+            outputs = []
+            cycle_weights = weights if (first and i == 0) or weights_each_cycle else bytearray(0)
+            if scaled[i]:
+                self.cim_processing_scale(activations, cycle_weights, outputs)
+            else:
+                self.cim_processing(activations, cycle_weights, outputs)
+            if clear_act:
+                self.clear_act_reg()                    # Clear activation flag
+            outputs_list.append(outputs)
+        return outputs_list, theory_list
+
+    def sweep_pipelined(self, weights:bytearray, activations, scaled=None, persist=None,
+                        weights_each_cycle=False, clear_act=True):
+        """`sweep` on the `SweepPipeline`: activations encoded ahead of the board, MAC cycles run on this
+        thread, outputs decoded, theory computed and persisted behind it, all three overlapped
+        Return the lists of outputs and theory outputs as `sweep`
+        """
+        weights_theory = weights.copy()
+        is_scaled = lambda index: scaled is not None and scaled[index]
+
+        def encode(index, activations):
+            return DataGen.act_encode(activations, is_scaled(index))
+
+        def device(index, encoded):
+            activations_new, scale_factor = encoded
+            cycle_weights = weights if index == 0 or weights_each_cycle else bytearray(0)
+            outdata_re, _ = self.trans.mac_cycle(activations_new, cycle_weights, fused=self.args.fused_mac)
+            if clear_act:
+                self.clear_act_reg()                # Clear activation flag
+            return np.array(outdata_re, dtype=np.uint8), scale_factor  # Copy: readback buffers are reused
+
+        def finish(index, activations, data):
+            outdata_re, scale_factor = data
+            outputs = self.trans.decode_cycle(outdata_re, scale_factor)  # Divided by the scaling factor if any
+            if is_scaled(index):
+                print('Scale: {} '.format(scale_factor))
+                outputs_theory = None
+            else:
+                outputs_theory = self.trans.output_theory(activations, weights_theory)
+            if persist is not None:
+                persist(index, outputs, outputs_theory)
+            return outputs, outputs_theory
+
+        results = self.pipeline.run(activations, encode, device, finish)
+        return [outputs for outputs, _ in results], [outputs_theory for _, outputs_theory in results]
+
+    def sweep_batched(self, weights:bytearray, activations_list:list, host_work=None):
+        """`sweep` by batches of `TransData.batch_size()` MAC cycles, each batch drained from FIFOB at once
+        host_work: optional callable run while the chip processes the first batch, its result is returned
+        Return the list of outputs in cycle order and the host_work result
+        """
+        outputs_list, result = [], None
+        batch_size = self.trans.batch_size()
+        for begin in range(0, len(activations_list), batch_size):
+            batch = activations_list[begin:begin + batch_size]
+            outdata_re, batch_result = self.trans.mac_batch(
+                DataGen.act_pulsecompen_batch(batch), weights if begin == 0 else bytearray(0),
+                host_work=host_work if begin == 0 else None)
+            outputs_list.extend(self.trans.decode_batch(outdata_re).tolist())
+            result = batch_result if begin == 0 else result
+        return outputs_list, result
     # ----------------------------------------------------#
     def cim_processing_scale(self, activations:bytearray, weights:bytearray, outputs:list):
         """One cycle of MAC Operation with activation scaling
         """
-        self.trans.update_wires()
-        # if len(weights) !=0:
-        #     self.trans.write_weights(weights)           # Write weights only when new weight data is avaliable
-        activations_new, scale_factor = DataGen.act_scale(activations)
+        activations_new, scale_factor = DataGen.act_encode(activations, scaled=True)
         print('Scale: {} '.format(scale_factor))   
-        self.trans.write_activations(activations_new)     # Write activations
-
-        self.trans.mac_assert_finish() 
-
-        outdata_re = self.trans.get_640b_out()
-        self.trans.decode_out(outdata_re, outputs)        # After offset compensation, divide by the scaling factor
-        for i in range(64):
-            outputs[i] = (outputs[i]/scale_factor)
+        outdata_re, _ = self.trans.mac_cycle(activations_new, weights, fused=self.args.fused_mac)
+        outputs[:] = self.trans.decode_cycle(outdata_re, scale_factor)  # Offsets compensated, divided by the scale
     # ----------------------------------------------------#
     
 # ----------------------------------------------------#
@@ -233,6 +451,13 @@ if __name__ == "__main__":
     setup_logger('CIM_Process', logging.INFO)
     # (2) Instantiate the main control class
     fpga_main = FpgaFunc()
-    # FPGA: Initialization
-    fpga_main.fpga_init()
-    fpga_main.run_host()
+    if fpga_main.args.replay is not None:
+        fpga_main.replay(fpga_main.args.replay)
+    elif fpga_main.args.calibrate > 0:
+        assert fpga_main.pool is None, "Calibration runs on a single board, without --boards."
+        fpga_main.fpga_init()
+        fpga_main.calibrate_offsets(fpga_main.args.calibrate)
+    else:
+        # FPGA: Initialization
+        fpga_main.fpga_init()
+        fpga_main.run_host()
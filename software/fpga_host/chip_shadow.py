@@ -0,0 +1,135 @@
+"""
+This module exports the host-side shadow of the chip inner registers (cfg_digiblk), used to drop the
+indirect writes which provably leave the chip unchanged.
+"""
+
+import logging
+
+
+class ChipShadow:
+    """
+    What the host knows of the chip state from the writes it piped into FIFOA:
+    the plain RW registers, the W1C status flags known to be clear, and the weights loaded since sta_wei
+    was last cleared. Everything is unknown until the first chip reset (`reset`).
+    A write is piped into FIFOA only when it may change the chip state (see `redundant`).
+    """
+
+    # Inner register addresses, see `cfg_digiblk.v`
+    STATUS = 0x00
+    CONFIG_W = 0x10
+    CONFIG_R = 0x14
+    CTRL_TEST = 0x28
+    CTRL_IN = 0x2C
+    WEIGHT = 0x30
+    ACTIVATION = 0x34
+    # Reset value and writable bits of the plain RW registers
+    RW_REGS = {
+        CONFIG_W: (0x0211, 0x0733),
+        CONFIG_R: (0x0090, 0x77FF),
+        CTRL_TEST: (0x0000, 0x000F),
+        CTRL_IN: (0x0000, 0x0003),
+    }
+    STA_ACT = 0x1
+    STA_WEI = 0x2
+    WRITE_BYTES = 16  # FIFOA bytes of one indirect write
+
+    def __init__(self):
+        self.logger = logging.getLogger('CIM_Process')
+        self.elided_writes = 0
+        self.elided_bytes = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget everything: e.g. after raw FIFOA data the shadow could not follow."""
+        self.regs = {addr: None for addr in self.RW_REGS}  # None: unknown value
+        self.status_clear = 0                               # STATUS flags known to be 0
+        self.weights = None                                 # Key of the weights loaded while sta_wei is set
+
+    def reset(self):
+        """The chip was reset: every register holds its reset value."""
+        self.regs = {addr: reset for addr, (reset, _) in self.RW_REGS.items()}
+        self.status_clear = self.STA_ACT | self.STA_WEI
+        self.weights = None
+
+    # ----------------------------------------------------#
+    # Queries
+    # ----------------------------------------------------#
+    def redundant(self, ind_addr:int, ind_data:int):
+        """
+        True if writing `ind_data` into `ind_addr` is a no-op: a RW register already holding the value
+        (no edge on the load/test enables either), or W1C flags already clear.
+        Weight and activation writes are never redundant, an activation load starts a MAC.
+        """
+        if ind_addr in self.RW_REGS:
+            return self.regs[ind_addr] == ind_data & self.RW_REGS[ind_addr][1]
+        if ind_addr == self.STATUS:
+            return ind_data & (self.STA_ACT | self.STA_WEI) & ~self.status_clear == 0
+        return False
+
+    def weights_loaded(self, key):
+        """True if the weights of `key` are in the array and sta_wei is still set: loading them again is a no-op."""
+        return key is not None and self.weights == key
+
+    def elide(self, nbytes=WRITE_BYTES):
+        """Account FIFOA bytes not sent thanks to the shadow."""
+        self.elided_writes += 1
+        self.elided_bytes += nbytes
+
+    # ----------------------------------------------------#
+    # Updates, once the writes are piped into FIFOA
+    # ----------------------------------------------------#
+    def write(self, ind_addr:int, ind_data:int):
+        """Apply one indirect write."""
+        if ind_addr == self.STATUS:  # W1C
+            self.status_clear |= ind_data & (self.STA_ACT | self.STA_WEI)
+            if ind_data & self.STA_WEI:
+                self.weights = None
+        elif ind_addr in self.RW_REGS:
+            self.regs[ind_addr] = ind_data & self.RW_REGS[ind_addr][1]
+            if ind_addr in (self.CTRL_IN, self.CTRL_TEST):
+                # Loads enabled or test patterns started: the macro may raise sta_wei/sta_act on its own
+                self.status_clear = 0
+            if ind_addr == self.CTRL_TEST and ind_data != 0:  # Test patterns shifted into the arrays
+                self.weights = None
+        elif ind_addr == self.WEIGHT:  # Partial load, may complete one
+            self.weights = None
+            self.status_clear &= ~self.STA_WEI
+        elif ind_addr == self.ACTIVATION:
+            self.status_clear &= ~self.STA_ACT
+        else:  # CTRL_DBG shifts and forced triggers, unknown addresses
+            self.weights = None
+            self.status_clear = 0
+
+    def load_weights(self, key):
+        """Apply a full weight load (256 words) of the weights of `key`."""
+        loadw_vld = self.regs[self.CTRL_IN]
+        self.weights = key if loadw_vld is not None and loadw_vld & 0x1 else None
+        self.status_clear &= ~self.STA_WEI
+
+    def load_activations(self):
+        """Apply a full activation load (16 words), which starts a MAC."""
+        self.status_clear &= ~self.STA_ACT
+
+    def observe(self, data):
+        """
+        Apply the indirect writes found in raw FIFOA data (see `DataGen.indir_write`).
+        Data without any write operation is skipped at once.
+        """
+        if data.find(b"\x03\x01\x01\x00") < 0:  # Operation word of an indirect write
+            return
+        itf = {}  # Interface registers: 0x02 address, 0x03 data LSB, 0x04 data MSB
+        for i in range(0, len(data) - 3, 4):
+            value, itf_addr, write = data[i], data[i + 1], data[i + 2]
+            if not write:
+                continue
+            if itf_addr in (0x02, 0x03, 0x04):
+                itf[itf_addr] = value
+            elif itf_addr == 0x01 and value & 0x3 == 0x3:
+                if len(itf) < 3:  # Interface registers written by earlier data
+                    self.invalidate()
+                else:
+                    self.write(itf[0x02], (itf[0x04] << 8) | itf[0x03])
+
+    def log_stats(self):
+        self.logger.info('Chip shadow: {} writes elided, {} FIFOA bytes saved'.format(
+            self.elided_writes, self.elided_bytes))
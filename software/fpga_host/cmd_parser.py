@@ -3,6 +3,11 @@ This module exports the command line options parser of the program.
 """
 
 import argparse
+import os
+
+# Calibration table next to the program, whatever the working directory
+CALIBRATION_TABLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 ".offset_calibration.json")
 
 
 class CmdlineParser:
@@ -15,9 +20,59 @@ class CmdlineParser:
 
         self.parser.add_argument("--fpga_bit", type=str, default="/d/FPGA_BITFILE/BitFile1002/fpga_top_w_chip.bit",
                                  help="Path of FPGA bit stream file.")
+        self.parser.add_argument("--config_cache", type=str, default="",
+                                 help="Cache of the bitstream loaded per board, the FPGA is configured only when it "
+                                      "does not already run --fpga_bit (verified by the BUILD_ID wire-out, a "
+                                      "bitstream without it is always configured). Empty string: no cache, only "
+                                      "the PLL is loaded and the FPGA must be configured beforehand.")
         self.parser.add_argument("--log_level", type=str, default="INFO",
                                  choices=['NOTSET', 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                                  help="Setup logging level for program.")
+        self.parser.add_argument("--sim", action="store_true",
+                                 help="Run against the simulated FrontPanel device instead of the XEM6310.")
+        self.parser.add_argument("--sim_latency", type=str, default="ideal", choices=["ideal", "xem6310"],
+                                 help="Latency model of the simulated device.")
+        self.parser.add_argument("--sim_mac_trigger", action="store_true",
+                                 help="Simulated bitstream provides the MAC_DONE trigger-out.")
+        self.parser.add_argument("--wait_policy", type=str, default="ewma", choices=["spin", "backoff", "ewma"],
+                                 help="Polling policy of the waits on MAC done and FIFOB status.")
+        self.parser.add_argument("--usb_worker", action="store_true",
+                                 help="Run pipe transfers on a USB worker thread, overlapped with host computation.")
+        self.parser.add_argument("--fused_mac", action="store_true",
+                                 help="Send weights, activations and output reads of a MAC cycle in one pipe write.")
+        self.parser.add_argument("--batch_mac", action="store_true",
+                                 help="Run sweeps by batches of MAC cycles accumulated in FIFOB, one drain per batch.")
+        self.parser.add_argument("--pipeline_depth", type=int, default=0,
+                                 help="Run sweeps on a three-stage pipeline (encode, board, decode and persist) "
+                                      "with queues of this many cycles, 2 for double buffering (0: in series).")
+        self.parser.add_argument("--boards", type=int, default=0,
+                                 help="Shard sweeps across this many boards, one worker process each (0: single board).")
+        self.parser.add_argument("--endpoint_stats", action="store_true",
+                                 help="Record call counts, bytes and latency histograms per FPGA endpoint.")
+        self.parser.add_argument("--seed", type=int, default=None,
+                                 help="Seed of the random sweep patterns and weights, to reproduce a run.")
+        self.parser.add_argument("--record", type=str, default=None,
+                                 help="Record every endpoint operation into this binary transaction log.")
+        self.parser.add_argument("--replay", type=str, default=None,
+                                 help="Replay this transaction log as fast as possible instead of running the tests.")
+        self.parser.add_argument("--replay_sync", action="store_true",
+                                 help="During replay, wait for the status values the recorded waits ended on.")
+        self.parser.add_argument("--calibration", type=str, default=CALIBRATION_TABLE,
+                                 help="Table of the column offsets per chip, loaded by the output decoder, next to "
+                                      "fpga_func.py by default. Empty string: use the built-in offsets.")
+        self.parser.add_argument("--chip_id", type=str, default=None,
+                                 help="Chip of the calibration table, the board serial number by default "
+                                      "(always the board serial for the boards of --boards). A board without "
+                                      "serial number needs it to use the table.")
+        self.parser.add_argument("--calibrate", type=int, default=0,
+                                 help="Measure the column offsets over this many MACs and store them into "
+                                      "--calibration instead of running the tests.")
+        self.parser.add_argument("--weight_cache_kb", type=int, default=4096,
+                                 help="Memory cap (kB) of the cache of encoded weight streams, 0 disables it.")
+        self.parser.add_argument("--fifoa_block", type=int, default=0,
+                                 help="Block size (bytes) of block-pipe writes to FIFOA, 0 uses the plain pipe.")
+        self.parser.add_argument("--fifob_block", type=int, default=0,
+                                 help="Block size (bytes) of block-pipe reads from FIFOB, 0 uses the plain pipe.")
         # self.parser.add_argument("--config_file", type=str, default="../hardware/verilog/config.vh",
         #                          help="Generate RTL config file.")
         # self.parser.add_argument("--sim_path", type=str, default="../hardware/sim",
@@ -0,0 +1,74 @@
+"""
+This module exports the configuration cache remembering, per board serial, the bitstream loaded into the FPGA
+and the PLL state, so that a board already running the requested bitstream is not configured again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+
+class ConfigCache:
+    """JSON file of {serial: {"bitfile", "sha256", "pll", "signature", "time"}} entries."""
+
+    PLL_DEFAULT = "default"  # PLL loaded with the settings stored in EEPROM (`LoadDefaultPLLConfiguration`)
+
+    def __init__(self, path):
+        """
+        :param path: path of the JSON cache file, created on the first configuration.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.path = path
+        self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except ValueError:
+            self.logger.warning("Configuration cache {} is corrupted, starting a new one.".format(self.path))
+            return {}
+
+    def save(self, serial):
+        """Write the entry of `serial` (removed if no longer cached), merged with the entries other processes saved."""
+        entries = self.load()
+        entries.pop(serial, None)
+        if self.entries.get(serial) is not None:
+            entries[serial] = self.entries[serial]
+        self.entries = entries
+        temp_path = "{}.{}".format(self.path, os.getpid())
+        with open(temp_path, "w") as cache_file:
+            json.dump(entries, cache_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)  # Atomic: the device pool workers share the file
+
+    @classmethod
+    def bitfile_digest(cls, bitfile):
+        """SHA-256 of the bitstream file, None if the file does not exist."""
+        if not os.path.isfile(bitfile):
+            return None
+        digest = hashlib.sha256()
+        with open(bitfile, "rb") as bit:
+            for chunk in iter(lambda: bit.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def lookup(self, serial, digest):
+        """Cached entry of the board if it was configured with the bitstream of `digest`, else None."""
+        entry = self.entries.get(serial)
+        if entry is None or digest is None or entry.get("sha256") != digest:
+            return None
+        return entry
+
+    def store(self, serial, bitfile, digest, signature):
+        """Record that the board runs the bitstream `digest` (read back `signature`) with the default PLL."""
+        self.entries[serial] = {"bitfile": os.path.abspath(bitfile), "sha256": digest, "pll": self.PLL_DEFAULT,
+                                "signature": signature, "time": datetime.now().isoformat()}
+        self.save(serial)
+
+    def invalidate(self, serial):
+        if self.entries.pop(serial, None) is not None:
+            self.save(serial)
@@ -4,7 +4,14 @@ This module export data generator to generate different data patterns for testin
 
 import random
 import math
+
+import numpy as np
 class DataGen:
+    # FIFOA words of one indirect write (see `indir_write`): address, data LSB, data MSB, operation
+    INDIR_WRITE_TEMPLATE = np.array([[0x00, 0x02, 1, 0],
+                                     [0x00, 0x03, 1, 0],
+                                     [0x00, 0x04, 1, 0],
+                                     [0x03, 0x01, 1, 0]], dtype=np.uint8)
     # ----------------------------------------------------#
     # Bytearray Data Generation 
     # ----------------------------------------------------#
@@ -16,22 +23,19 @@ class DataGen:
     @classmethod
     def array_fullff(cls, size: int):
         """Generate an array full of FF"""
-        data = bytearray([255])
-        for _ in range(1, size):
-            data.append(255)
-        return data
+        return cls.array_constant(max(size, 1), 255)
 
     @classmethod
     def array_constant(cls, size: int, value: int):
         """Generate an array full of A constant"""
-        data = bytearray()
-        for _ in range(0, size):  # Append the left (size-1) values
-            data.append(value)
-        return data
+        return bytearray([value]) * size
     
     @classmethod
-    def array_random(cls, size: int):
-        """Generate an array full of random value"""
+    def array_random(cls, size: int, rng=None):
+        """Generate an array full of random value
+        rng: optional seeded `numpy.random.Generator`, the `random` module by default"""
+        if rng is not None:
+            return bytearray(rng.integers(0x0C, 0xFF, size, dtype=np.uint8, endpoint=True).tobytes())
         data = bytearray(0)
         for _ in range(0, size):
             data.append(random.randint(0x0C,0xFF))  
@@ -90,46 +94,74 @@ class DataGen:
         """Return:
         the scaled activation bytearray 
         the float data: scaling factor"""
-        act_list = cls.array_to_list(act_array)               
-        act_max = max(act_list)   
-        if act_max == 0:
-            scale_value = 1
-        else:        
-            scale_value = int(15/ act_max)
-            if scale_value < 1:
-                scale_value = 1
-        for i in range(len(act_list)):
-            act_list[i] = act_list[i]*scale_value
-            if act_list[i] > 6:
-                act_list[i] -= 1
-        act_new = cls.list_to_array(act_list)
-        return act_new, scale_value
+        act_new, scale_value = cls.act_scale_batch([act_array])
+        return bytearray(act_new[0].tobytes()), int(scale_value[0])
     
     @classmethod    
     def act_pulsecompen(cls, act_array:bytearray):
         """Return:
         the scaled activation bytearray 
         the float data: scaling factor"""
-        act_list = cls.array_to_list(act_array)  
-        for i in range(len(act_list)):
-            if act_list[i] > 6:
-                act_list[i] -= 1
-        act_new = cls.list_to_array(act_list)
-        return act_new
+        return bytearray(cls.act_pulsecompen_batch([act_array])[0].tobytes())
+
+    @classmethod
+    def act_encode(cls, act_array:bytearray, scaled=False):
+        """Activations as sent to the chip: scaled (`act_scale`) or only pulse-compensated (`act_pulsecompen`)
+        Return the bytearray and the scaling factor, None when not scaled"""
+        if scaled:
+            return cls.act_scale(act_array)
+        return cls.act_pulsecompen(act_array), None
+
+    @classmethod
+    def act_scale_batch(cls, batch):
+        """
+        `act_scale` of N activation vectors at once: every vector multiplied by int(15 / its max activation)
+        (1 for a zero vector), then pulse-compensated
+        Return the (N, 32) uint8 scaled vectors and the (N,) scaling factors
+        """
+        act_list = cls.unpack_nibbles(batch)
+        act_max = act_list.max(axis=1)
+        scale_value = np.where(act_max == 0, 1, 15 // np.maximum(act_max, 1))  # int(15 / max) >= 1
+        act_list = act_list * scale_value[:, None].astype(np.uint8)
+        act_list -= act_list > 6
+        return cls.pack_nibbles(act_list), scale_value
+
+    @classmethod
+    def act_pulsecompen_batch(cls, batch):
+        """`act_pulsecompen` of N activation vectors at once, every activation above 6 minus 1
+        Return the (N, 32) uint8 compensated vectors"""
+        act_list = cls.unpack_nibbles(batch)
+        act_list -= act_list > 6
+        return cls.pack_nibbles(act_list)
     # ---------------------------------------------------------- #
     @classmethod    
     def array_to_list(cls, in_array:bytearray):
         """Convert a bytearray to a double-length list"""
-        act_list = [cls.access_halfbyte(in_array,i) for i in range(0, len(in_array)*8, 4)]
-        return act_list
+        return cls.unpack_nibbles([in_array])[0].tolist()
     @classmethod    
     def list_to_array(cls, in_list:list):
         """Convert a list to a half-length bytearray """
-        out_array = bytearray(0)
-        for i in range(0,len(in_list),2):
-            data = in_list[i]*16 +in_list[i+1]
-            out_array.append(data)
-        return out_array
+        return bytearray(cls.pack_nibbles(np.array([in_list], dtype=np.uint8))[0].tobytes())
+
+    @classmethod
+    def unpack_nibbles(cls, batch):
+        """
+        Nibble codec: N packed vectors (2 activations per byte, high nibble first) to activations
+        batch: sequence of bytes-like vectors of the same length, or an (N, bytes) uint8 array
+        Return a new (N, 2 x bytes) uint8 array
+        """
+        if isinstance(batch, np.ndarray):
+            packed = batch.astype(np.uint8, copy=False).reshape(len(batch), -1)
+        else:
+            packed = np.frombuffer(b"".join(bytes(vector) for vector in batch), dtype=np.uint8)
+            packed = packed.reshape(len(batch), -1) if len(batch) else packed.reshape(0, 0)
+        return np.stack([packed >> 4, packed & 0xF], axis=2).reshape(len(packed), 2 * packed.shape[1])
+
+    @classmethod
+    def pack_nibbles(cls, act_list):
+        """Inverse of `unpack_nibbles`: (N, 2 x bytes) activations of 4 bits to an (N, bytes) uint8 array"""
+        act_list = np.asarray(act_list, dtype=np.uint8)
+        return (act_list[:, 0::2] << 4) | act_list[:, 1::2]
     @classmethod  
     def access_halfbyte(cls, data, num):
         base = int(num // 8)
@@ -177,6 +209,37 @@ class DataGen:
         send_waddr.extend(send_w_oper)
         return send_waddr
     
+    @classmethod
+    def indir_write_stream(cls, ind_addr:int, data):
+        """
+        Vectorized `indir_write` of every 16-bit big-endian word of `data` to the same inner register:
+        the 512-byte weights give the 4096-byte FIFOA stream, the 32-byte activations 256 bytes.
+        Return a bytearray, byte-identical to appending `indir_write` word by word
+        """
+        return bytearray(cls.indir_write_batch(ind_addr, [data]).data)
+
+    @classmethod
+    def indir_write_batch(cls, ind_addr:int, batch):
+        """
+        `indir_write_stream` of many vectors of the same length at once, validated once for the batch
+        batch: sequence of bytes-like vectors, or a (vectors, bytes) uint8 array
+        Return a (vectors, 8 x bytes) uint8 array, row i is the FIFOA stream of vector i
+        """
+        assert 0 <= ind_addr <= 0xFF, "invalid inputs"
+        if isinstance(batch, np.ndarray):
+            data = batch.astype(np.uint8, copy=False)
+        else:
+            data = np.frombuffer(b"".join(bytes(vector) for vector in batch), dtype=np.uint8)
+            data = data.reshape(len(batch), -1) if len(batch) else data.reshape(0, 0)
+        assert data.ndim == 2 and data.shape[1] % 2 == 0, "Vectors must have the same, even, length."
+        words = data.reshape(data.shape[0], -1, 2)                          # [MSB, LSB] of each 16-bit word
+        stream = np.empty(words.shape[:2] + cls.INDIR_WRITE_TEMPLATE.shape, dtype=np.uint8)
+        stream[...] = cls.INDIR_WRITE_TEMPLATE
+        stream[:, :, 0, 0] = ind_addr
+        stream[:, :, 1, 0] = words[:, :, 1]
+        stream[:, :, 2, 0] = words[:, :, 0]
+        return stream.reshape(data.shape[0], -1)
+
     @classmethod
     def indir_read(cls, ind_addr:int):
         """
@@ -0,0 +1,220 @@
+"""
+This module shards the MAC cycles of a sweep across several boards attached to the host,
+with one worker process per board.
+"""
+
+import logging
+import multiprocessing
+import queue
+import traceback
+try:
+    import ok
+except ImportError:  # FrontPanel SDK not available, only simulated devices can be pooled
+    ok = None
+
+from fpga_host.config_cache import ConfigCache
+from fpga_host.data_gen import DataGen
+from fpga_host.fpga_tester import FPGATester
+from fpga_host.logger import setup_logger
+from fpga_host.offset_calibration import CalibrationTable
+from fpga_host.sim_device import SimFrontPanel
+from fpga_host.transmission_data import TransData
+from fpga_host.wait_policy import POLICIES
+
+
+def frontpanel_device(serial):
+    """Device factory of the real boards, the board is opened by serial in `FPGATester.initialize_device`."""
+    return ok.okCFrontPanel()
+
+
+def sim_device(serial, latency=None, mac_trigger=False):
+    """Device factory of simulated boards, use `functools.partial` to bind the latency model."""
+    return SimFrontPanel(latency, serial=serial, mac_trigger=mac_trigger)
+
+
+class BoardWorker:
+    """One board driven by its own worker process: the MAC cycle of `FpgaFunc` on one FPGATester."""
+
+    def __init__(self, serial, device_factory, args, debug=False):
+        """
+        :param serial: serial number of the board.
+        :param device_factory: picklable callable returning the FrontPanel-like device of a serial.
+        :param args: parsed command line options (bit file, wait policy, pipe block sizes, fused MAC, calibration).
+        :param debug: debug flag of `FPGATester`.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.serial = serial
+        config_cache = ConfigCache(args.config_cache) if args.config_cache else None
+        self.fpga_tester = FPGATester(args.fpga_bit, debug=debug, device=device_factory(serial),
+                                      endpoint_stats=args.endpoint_stats, config_cache=config_cache)
+        self.fpga_tester.set_pipe_block_size("FIFOA_IN_DATA", args.fifoa_block)
+        self.fpga_tester.set_pipe_block_size("FIFOB_OUT_DATA", args.fifob_block)
+        self.trans = TransData(self.fpga_tester, POLICIES[args.wait_policy](),
+                               weight_cache_bytes=args.weight_cache_kb * 1024)
+        self.fused_mac = args.fused_mac
+        self.calibration = CalibrationTable(args.calibration) if args.calibration else None
+
+    def fpga_init(self):
+        if self.fpga_tester.initialize_device(self.serial) is None:
+            raise RuntimeError("Board {} could not be initialized".format(self.serial))
+        self.trans.reset_host()
+        self.trans.reset_chip()
+        if self.calibration is not None and self.serial:
+            self.trans.load_offsets(self.calibration.lookup(self.serial))  # Chip of a pool board: its serial
+        self.config_reg()
+
+    def config_reg(self):
+        """Register setup of `FpgaFunc.access_reg`, without reading the registers back"""
+        self.trans.reset_host()
+        self.trans.write_regs([(0x14, 0x0090),     # Set Start Bit to 9
+                               (0x00, 0x0003),     # Clear status of Chip
+                               (0x2C, 0x0003),     # Enable weight and actvation writing
+                               (0x00, 0x0003)])    # Clear status of Chip
+
+    def cim_processing(self, activations, weights, scaled, clear_act=True):
+        """One cycle of MAC operation (`TransData.mac_cycle`), followed by clearing the activation flag
+        weights: written only when not empty, as in `FpgaFunc.cim_processing`
+        scaled: scale the activations (`DataGen.act_scale`) and divide the outputs by the scaling factor
+        clear_act: clear the activation flag after the cycle
+        """
+        activations_new, scale_factor = DataGen.act_encode(activations, scaled)
+        outdata, _ = self.trans.mac_cycle(activations_new, weights, fused=self.fused_mac)
+        outputs = self.trans.decode_cycle(outdata, scale_factor)
+        if clear_act:
+            self.trans.clear_act_reg()
+        return outputs
+
+    @classmethod
+    def run(cls, serial, device_factory, args, debug, tasks, results):
+        """
+        Entry of the worker process: initialize the board, then run the cycles of `tasks` until a None task.
+        Tasks are (cycle index, activations, weights, scaled, clear_act), results are (serial, cycle index, outputs),
+        with the index None once the board is ready and the outputs replaced by a traceback on failure.
+        """
+        if not logging.getLogger('CIM_Process').handlers:  # Spawned process: no logger inherited
+            setup_logger('CIM_Process', args.log_level)
+        index = None
+        try:
+            board = cls(serial, device_factory, args, debug)
+            board.fpga_init()
+            results.put((serial, None, None))
+            for index, activations, weights, scaled, clear_act in iter(tasks.get, None):
+                results.put((serial, index, board.cim_processing(activations, weights, scaled, clear_act)))
+            board.trans.wait_policy.log_stats()
+            board.trans.weight_cache.log_stats()
+            board.fpga_tester.stats.log_stats()
+        except Exception:
+            results.put((serial, index, traceback.format_exc()))
+
+
+class DevicePool:
+    """Pool of boards, one worker process each. The cycles of a sweep are split into contiguous
+    chunks, one per board, and the outputs are merged back in cycle order.
+    `stop` must be called once done, also on failure (or use the pool as a context manager)."""
+
+    RESULT_POLL = 1.0    # Seconds between two checks that the workers are alive, while waiting for a result
+    JOIN_TIMEOUT = 5.0   # Seconds given to a worker to exit on `stop` before it is terminated
+
+    def __init__(self, serials, device_factory, args, debug=False):
+        """
+        :param serials: serial numbers of the boards to use, see `enumerate`.
+        :param device_factory: picklable callable returning the device of a serial,
+                               `frontpanel_device` or a `functools.partial` of `sim_device`.
+        :param args: parsed command line options passed to every `BoardWorker`.
+        :param debug: debug flag of the `FPGATester` of every board.
+        """
+        assert len(serials) > 0, "Empty device pool."
+        self.logger = logging.getLogger('CIM_Process')
+        self.serials = list(serials)
+        self.device_factory = device_factory
+        self.args = args
+        self.debug = debug
+        self.tasks = {}
+        self.results = None
+        self.workers = []
+
+    @classmethod
+    def enumerate(cls, device=None):
+        """Serial numbers of all the boards attached to the host, listed through `device` (a FrontPanel by default)."""
+        device = ok.okCFrontPanel() if device is None else device
+        return [device.GetDeviceListSerial(i) for i in range(device.GetDeviceCount())]
+
+    def start(self):
+        """Start one worker process per board and wait until every board is initialized."""
+        self.results = multiprocessing.Queue()
+        for serial in self.serials:
+            self.tasks[serial] = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=BoardWorker.run, name="board-{}".format(serial),
+                                             args=(serial, self.device_factory, self.args, self.debug,
+                                                   self.tasks[serial], self.results))
+            worker.start()
+            self.workers.append(worker)
+        try:
+            for _ in self.serials:
+                self._get_result()
+        except Exception:
+            self.stop()
+            raise
+        self.logger.info("Device pool ready with {} boards: {}".format(len(self.serials), self.serials))
+
+    def stop(self):
+        """Stop the worker processes, those still alive after JOIN_TIMEOUT seconds (e.g. busy with the cycles
+        queued before a failure) are terminated."""
+        for task_queue in self.tasks.values():
+            task_queue.put(None)
+        for worker in self.workers:
+            worker.join(self.JOIN_TIMEOUT)
+            if worker.is_alive():
+                self.logger.warning("Worker {} did not stop, terminated.".format(worker.name))
+                worker.terminate()
+                worker.join()
+        self.workers = []
+        self.tasks = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def _get_result(self):
+        """Next result of any worker, RuntimeError if a board failed or a worker exited without result."""
+        while True:
+            try:
+                serial, index, outputs = self.results.get(timeout=self.RESULT_POLL)
+                break
+            except queue.Empty:
+                dead = [worker.name for worker in self.workers if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError("Workers {} exited".format(", ".join(dead)))
+        if isinstance(outputs, str):
+            self.logger.critical("Board {} failed at cycle {}:\n{}".format(serial, index, outputs))
+            raise RuntimeError("Board {} failed".format(serial))
+        return index, outputs
+
+    def run(self, weights, activations_list, scaled=None, host_work=None, weights_each_cycle=False, clear_act=True):
+        """
+        Run one MAC cycle per activation vector, all with the same weights.
+        :param weights: weights of the sweep, written once on every board.
+        :param activations_list: activation vectors of the sweep, in cycle order.
+        :param scaled: optional list of flags, True to run the cycle with scaled activations.
+        :param host_work: optional callable run while the boards are busy, its result is returned.
+        :param weights_each_cycle: write the weights with every cycle instead of once per board.
+        :param clear_act: clear the activation flag after every cycle.
+        :return: (list of the outputs in cycle order, result of `host_work`).
+        """
+        num = len(activations_list)
+        scaled = [False] * num if scaled is None else scaled
+        chunk = max(1, -(-num // len(self.serials)))  # Ceiling division: contiguous cycles per board
+        for index in range(num):
+            first = index % chunk == 0  # Weights are loaded with the first cycle of every chunk
+            self.tasks[self.serials[index // chunk]].put(
+                (index, bytes(activations_list[index]), bytes(weights) if first or weights_each_cycle else b"",
+                 scaled[index], clear_act))
+        result = host_work() if host_work is not None else None
+        outputs_list = [None] * num
+        for _ in range(num):
+            index, outputs = self._get_result()
+            outputs_list[index] = outputs
+        return outputs_list, result
@@ -0,0 +1,103 @@
+"""
+This module exports the per-endpoint instrumentation of FPGATester: call counts, bytes moved and latency histograms.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class EndpointCounter:
+    """Counters of one endpoint, latencies binned in power-of-two microsecond buckets."""
+
+    BUCKETS = 24  # Bucket k holds latencies in [2^(k-1), 2^k) us, the last one everything above ~4 s
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * self.BUCKETS
+
+    def record(self, nbytes, elapsed):
+        self.calls += 1
+        self.bytes += nbytes
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.histogram[min(int(elapsed * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound (seconds) of the bucket holding the `fraction` percentile."""
+        rank = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return (1 << bucket) * 1e-6
+        return self.max
+
+
+class EndpointStats:
+    """
+    Per-endpoint counters of FPGATester, keyed by ADDR_MAP name. Costs one attribute check when disabled.
+    Thread safe: with --usb_worker the endpoints are accessed from the USB worker and the calling thread.
+    """
+
+    def __init__(self, names, enabled=False):
+        """
+        :param names: {address: ADDR_MAP name} of the endpoints.
+        :param enabled: start recording immediately.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.names = names
+        self.enabled = enabled
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Return a start timestamp for `record`, None when disabled."""
+        return time.perf_counter() if self.enabled else None
+
+    def record(self, addr, nbytes, start):
+        """
+        Account one call which started at `start` (no-op for a None start).
+        :param addr: address of the endpoint, or the name of an update spanning several endpoints.
+        """
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        name = self.names.get(addr, addr)
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = EndpointCounter()
+            counter.record(nbytes, elapsed)
+
+    @contextmanager
+    def scope(self, name):
+        """Record the whole block as one call of `name`, to compare a host function with its endpoint accesses."""
+        start = self.start()
+        try:
+            yield
+        finally:
+            self.record(name, 0, start)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+
+    def log_stats(self):
+        """Log the counters of every endpoint, the most time consuming first."""
+        with self.lock:
+            counters = sorted(self.counters.items(), key=lambda item: -item[1].total)
+        for name, counter in counters:
+            self.logger.info('Endpoint {}: {} calls, {} bytes, total {:.3f} ms, mean {:.1f} us, '
+                             'p50 < {:.0f} us, p99 < {:.0f} us, max {:.1f} us'.format(
+                                 name, counter.calls, counter.bytes, counter.total * 1e3,
+                                 counter.total / counter.calls * 1e6, counter.percentile(0.5) * 1e6,
+                                 counter.percentile(0.99) * 1e6, counter.max * 1e6))
+            self.logger.info('Endpoint {} histogram (us: calls): {}'.format(
+                name, ', '.join('<{}: {}'.format(1 << bucket, count)
+                                for bucket, count in enumerate(counter.histogram) if count)))
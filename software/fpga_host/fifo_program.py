@@ -0,0 +1,91 @@
+"""
+This module exports the FIFOA program builder: indirect reads and writes of the chip registers composed into
+one buffer, with named slots patched in place and constant programs compiled once and shared.
+"""
+
+import numpy as np
+
+from fpga_host.data_gen import DataGen
+
+
+class FifoProgram:
+    """
+    FIFOA command stream built from indirect register accesses (see `DataGen.indir_write`/`indir_read`).
+    `data` is the bytearray piped into FIFOA. Slots mark variable words which `patch` rewrites in place.
+    """
+
+    ACCESS_BYTES = 16  # Bytes of one indirect access: 4 FIFOA words of 32 bits
+    _constants = {}   # Interned constant programs, {name: FifoProgram}
+
+    def __init__(self):
+        self.data = bytearray(0)
+        self.slots = {}  # {name: (offset, number of 16-bit words)}
+
+    def __len__(self):
+        return len(self.data)
+
+    # ----------------------------------------------------#
+    # Building
+    # ----------------------------------------------------#
+    def write(self, ind_addr:int, ind_data:int=0, slot=None):
+        """Append an indirect write of a 16-bit value, `slot` names it for `patch`"""
+        assert 0 <= ind_addr <= 0xFF and 0 <= ind_data <= 0xFFFF, "invalid inputs"
+        if slot is not None:
+            self.slots[slot] = (len(self.data), 1)
+        self.data.extend(DataGen.indir_write(ind_addr, ind_data))
+        return self
+
+    def stream(self, ind_addr:int, data, slot=None):
+        """Append indirect writes of every 16-bit big-endian word of `data` (e.g. weights, activations)"""
+        if slot is not None:
+            self.slots[slot] = (len(self.data), len(data) // 2)
+        self.data.extend(DataGen.indir_write_stream(ind_addr, data))
+        return self
+
+    def read(self, ind_addr:int, count:int=1):
+        """Append `count` indirect reads, each pushes 2 words (MSB then LSB) into FIFOB"""
+        assert 0 <= ind_addr <= 0xFF, "invalid inputs"
+        self.data.extend(DataGen.indir_read(ind_addr) * count)
+        return self
+
+    def extend(self, program):
+        """Append another program, its slots are kept with their offsets shifted"""
+        for name, (offset, words) in program.slots.items():
+            self.slots[name] = (len(self.data) + offset, words)
+        self.data.extend(program.data)
+        return self
+
+    # ----------------------------------------------------#
+    # Patching
+    # ----------------------------------------------------#
+    def patch(self, slot, value):
+        """
+        Rewrite the data bytes of a slot in place.
+        :param slot: name given to `write` (value: 16-bit integer) or `stream` (value: bytes of the same length).
+        """
+        offset, words = self.slots[slot]
+        if isinstance(value, int):
+            assert words == 1 and 0 <= value <= 0xFFFF, "invalid inputs"
+            self.data[offset + 4] = value & 0xFF   # Data LSB, see `DataGen.indir_write`
+            self.data[offset + 8] = value >> 8     # Data MSB
+            return self
+        assert len(value) == 2 * words, "Slot {} holds {} bytes.".format(slot, 2 * words)
+        stream = np.frombuffer(self.data, dtype=np.uint8, count=words * self.ACCESS_BYTES, offset=offset)
+        stream = stream.reshape(words, self.ACCESS_BYTES)
+        value = np.frombuffer(bytes(value), dtype=np.uint8).reshape(words, 2)
+        stream[:, 4] = value[:, 1]
+        stream[:, 8] = value[:, 0]
+        return self
+
+    # ----------------------------------------------------#
+    # Interned constant programs
+    # ----------------------------------------------------#
+    @classmethod
+    def constant(cls, name, build):
+        """
+        Constant program compiled once by `build()` and shared by reference afterwards.
+        The returned program must not be patched nor extended.
+        """
+        if name not in cls._constants:
+            cls._constants[name] = build()
+        return cls._constants[name]
@@ -4,12 +4,22 @@ This module directly control the signal and data flow to and out of FPGA
 import getpass
 import logging
 import sys
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum
-import ok
+from types import SimpleNamespace
 
-SUCCESS = ok.okCFrontPanel.NoError  # Alias for `SUCCESS` constant
+from fpga_host.config_cache import ConfigCache
+from fpga_host.endpoint_stats import EndpointStats
+from fpga_host.transaction_log import TransactionRecorder
+try:
+    import ok
+except ImportError:  # FrontPanel SDK not available, only a simulated device can be driven
+    ok = None
+
+SUCCESS = ok.okCFrontPanel.NoError if ok is not None else 0  # Alias for `SUCCESS` constant
 
 
 class EndpointType(Enum):
@@ -40,37 +50,64 @@ class FPGATester:
         ("STA_CHIP", AddrMapEntry(EndpointType.WIRE_OUT, 0x27)),  # Status of CIM chip
         ("FIFOB_EMPTY", AddrMapEntry(EndpointType.WIRE_OUT, 0x37)), # 1 means FIFOB is empty
         ("FIFOB_PROG_FULL", AddrMapEntry(EndpointType.WIRE_OUT, 0x38)), # 1 means FIFOB is full
+        ("BUILD_ID", AddrMapEntry(EndpointType.WIRE_OUT, 0x3F)),  # Bitstream signature, 0 if not provided
         ("SPI_CONFIG", AddrMapEntry(EndpointType.TRIGGER_IN, 0x47)),  # Config SPI Master
+        ("MAC_DONE", AddrMapEntry(EndpointType.TRIGGER_OUT, 0x67)),  # Bit 0 fires on the rising edge of sta_act
         ("FIFOA_IN_DATA", AddrMapEntry(EndpointType.PIPE_IN, 0x87)),    # data into FIFO_A
         ("FIFOB_OUT_DATA", AddrMapEntry(EndpointType.PIPE_OUT, 0xA7)),    # data from FIFO_B
     ])
+    # Status record of all `wire_out` endpoints latched by one `UpdateWireOuts`, fields in ADDR_MAP order
+    WireOutStatus = namedtuple("WireOutStatus", [name.lower() for name, entry in ADDR_MAP.items()
+                                                 if entry.type == EndpointType.WIRE_OUT])
+    ADDR_NAMES = {entry.address: name for name, entry in ADDR_MAP.items()}  # Reverse lookup of ADDR_MAP
     W_BYTES = 64
     R_BYTES = 16
 
-    def __init__(self, fpga_bit_file, debug=False):
+    def __init__(self, fpga_bit_file, debug=False, device=None, endpoint_stats=False, record=None,
+                 config_cache=None):
         """
         Constructor of FPGA tester.
         :param fpga_bit_file: path of the fpga bitstream file.
         :param debug: optional flag for debug purpose due to the lack of FPGA device.
+        :param device: optional FrontPanel-like device (e.g. `SimFrontPanel`), a real `okCFrontPanel` by default.
+        :param endpoint_stats: record call counts, bytes and latency histograms per endpoint (see `stats`).
+        :param record: optional path of a binary log recording every endpoint operation (see `TransactionReplay`).
+        :param config_cache: optional `ConfigCache`, the bitstream is then downloaded only when the board
+        does not already run it. Without it only the PLL is loaded, the FPGA must be configured beforehand.
         """
         self.logger = logging.getLogger('CIM_Process')
         self.debug = debug
-        self.device = ok.okCFrontPanel()
+        self.device = ok.okCFrontPanel() if device is None else device
+        if record is not None:
+            self.device = TransactionRecorder(self.device, record)
         self.bitfile = fpga_bit_file
+        self.config_cache = config_cache
+        self.serial = None  # Serial number of the opened board
+        # Wire-in bookkeeping as {addr: (mask, value)}: bits staged but not yet updated, and bits known in FPGA
+        self._wire_in_pending = {}
+        self._wire_in_latched = {}
+        self._wire_in_batch_depth = 0
+        # Block size (bytes) of the pipe endpoints using block-pipe transfers, {addr: block_size}
+        self.pipe_block_size = {}
+        # Dedicated USB worker thread for the GIL-releasing pipe calls, and its transfers not yet waited for
+        self._usb_worker = None
+        self._usb_pending = deque()
+        # Per-endpoint instrumentation, can be switched with `stats.enabled` at any time
+        self.stats = EndpointStats(self.ADDR_NAMES, endpoint_stats)
     # ------------- Device Initialization -------------#
-    def initialize_device(self):
+    def initialize_device(self, serial=""):
         """
         Initialize FPGA device and sanity check the connection of FPGA.
-        :param fpga_bit_file: filename of FPGA bitstream.
+        :param serial: serial number of the board to open, the first available device by default.
         :return: reference to the Opal Kelly FrontPanel-enabled device.
         """
-        if self.device.OpenBySerial("") != SUCCESS:  # Open the first available device
+        if self.device.OpenBySerial(serial) != SUCCESS:  # Open the first available device by default
             self.logger.critical("A device could not be opened. Is one connected?")
             if not self.debug:
                 return None
 
         # Get some general information about the device
-        device_info = ok.okTDeviceInfo()
+        device_info = ok.okTDeviceInfo() if ok is not None else SimpleNamespace()
         if self.device.GetDeviceInfo(device_info) != SUCCESS:
             self.logger.critical("Unable to retrieve device information.")
             if not self.debug:
@@ -79,18 +116,19 @@ class FPGATester:
         self.logger.info("Firmware version: {}.{}".format(device_info.deviceMajorVersion,
                                                           device_info.deviceMinorVersion))
         self.logger.info("Serial Number: {}".format(device_info.serialNumber))
+        self.serial = device_info.serialNumber
         self.logger.info("Device ID: {}".format(device_info.deviceID))
 
-        self.device.LoadDefaultPLLConfiguration()  # Config PLL with settings stored in EEPROM
+        self._wire_in_latched.clear()  # Wire-in values in FPGA are unknown until written again
     # ------------------------------------------------------------- #
     #   Download Xilinx config bit-file to FPGA
-    #   Comment this part after configure FPGA with the bit file
-    # ------------------------------------------------------------- #
-        # if self.device.ConfigureFPGA(self.bitfile) != SUCCESS: 
-        #     self.logger.critical("Failed to config FPGA with bitstream file {}.".format(self.bitfile))
-        #     if not self.debug:
-        #         return None
+    #   Only when the board does not already run it (configuration cache)
     # ------------------------------------------------------------- #
+        if self.config_cache is None:
+            self.device.LoadDefaultPLLConfiguration()  # Config PLL with settings stored in EEPROM
+        elif not self.configure_device(device_info.serialNumber):
+            if not self.debug:
+                return None
     # ------------------------------------------------------------- #
         if self.device.IsFrontPanelEnabled() != True: # This line is always showed on during testing
             self.logger.critical("okHostInterface is not installed in the FPGA configuration.")
@@ -98,6 +136,52 @@ class FPGATester:
                 return None
 
         return True
+    def configure_device(self, serial):
+        """
+        Load the PLL and download the bitstream, unless the configuration cache shows that the board already
+        runs it: same bitfile hash, FrontPanel enabled and the same BUILD_ID signature read back.
+        A 0 signature (bitstream without BUILD_ID) cannot tell two builds apart: the board is always configured,
+        and once the cache knows the bitstream drives no BUILD_ID, without reading it back.
+        :param serial: serial number of the opened board.
+        :return: True if the board runs the bitstream (or the bitfile is not available), False on failure.
+        """
+        digest = ConfigCache.bitfile_digest(self.bitfile)
+        if digest is None:
+            self.logger.warning("Bitstream file {} not found, keep the FPGA configuration.".format(self.bitfile))
+            self.device.LoadDefaultPLLConfiguration()  # Config PLL with settings stored in EEPROM
+            return True
+        entry = self.config_cache.lookup(serial, digest)
+        if entry is not None and not entry["signature"]:  # Known to drive no BUILD_ID: nothing to verify
+            return self.load_bitstream(serial)
+        if entry is not None and self.device.IsFrontPanelEnabled() and \
+                self.read_wire_out(self.ADDR_MAP["BUILD_ID"].address) == entry["signature"]:
+            self.logger.info("Board {} already runs {}, skip PLL and FPGA configuration.".format(serial, self.bitfile))
+            return True
+        if not self.load_bitstream(serial):
+            return False
+        signature = self.read_wire_out(self.ADDR_MAP["BUILD_ID"].address)
+        self.config_cache.store(serial, self.bitfile, digest, signature)
+        if not signature:
+            self.logger.warning("Bitstream {} drives no BUILD_ID, the board will be configured on every start."
+                                .format(self.bitfile))
+        return True
+
+    def load_bitstream(self, serial):
+        """Load the PLL and download the bitstream, the cache entry of the board dropped on failure."""
+        self.device.LoadDefaultPLLConfiguration()  # Config PLL with settings stored in EEPROM
+        if self.device.ConfigureFPGA(self.bitfile) != SUCCESS:
+            self.logger.critical("Failed to config FPGA with bitstream file {}.".format(self.bitfile))
+            self.config_cache.invalidate(serial)
+            return False
+        self.logger.info("Board {} configured with {}.".format(serial, self.bitfile))
+        return True
+
+    def stop_recording(self):
+        """Close the transaction log, if recording."""
+        if isinstance(self.device, TransactionRecorder):
+            self.wait_usb_idle()
+            self.device.close()
+            self.device = self.device.device
     # ------------------------------------------------------------- #
     #    Functions to control FPGA data flow
     # ------------------------------------------------------------- #
@@ -136,20 +220,43 @@ class FPGATester:
         """Threshold value of FIFOB Prog Full"""
         self.write_wire_in(self.ADDR_MAP["FIFOB_THRESH"].address, value, mask=0xFFFF)
 
-    def fifob_empty(self):
+    def fifob_empty(self, status=None):
         """Find out if FIFO_B is empty, return True or False"""
         # True means fifob is not empty, false means fifob is empty
+        if status is not None:
+            return status.fifob_empty == 1
         return self.read_wire_out(self.ADDR_MAP["FIFOB_EMPTY"].address) == 1
 
-    def fifob_progfull(self):
+    def fifob_progfull(self, status=None):
         """Find out if FIFO_B has got all the outputs, return True or False"""
         # True means fifob is not empty, false means fifob is full
+        if status is not None:
+            return status.fifob_prog_full == 1
         return self.read_wire_out(self.ADDR_MAP["FIFOB_PROG_FULL"].address) == 1
     
-    def sta_chip(self):
+    def sta_chip(self, status=None):
         """Find out if the status of chip, sta_wei and sta_act"""
         # True means fifob is not empty, false means fifob is full
+        if status is not None:
+            return status.sta_chip
         return self.read_wire_out(self.ADDR_MAP["STA_CHIP"].address)
+
+    def mac_done(self):
+        """Find out if the chip finished a MAC since the last check, using the MAC_DONE trigger"""
+        return self.read_trigger_out(self.ADDR_MAP["MAC_DONE"].address, mask=0x01)
+
+    def snapshot_wire_outs(self):
+        """
+        Latch all `wire_out` endpoints with a single `UpdateWireOuts`.
+        :return: `WireOutStatus` record, can be passed as `status` to `fifob_empty`/`fifob_progfull`/`sta_chip`.
+        """
+        start = self.stats.start()
+        self._settle()
+        self.device.UpdateWireOuts()
+        status = self.WireOutStatus._make(self.device.GetWireOutValue(self.ADDR_MAP[name.upper()].address)
+                                          for name in self.WireOutStatus._fields)
+        self.stats.record("UpdateWireOuts", 4 * len(status), start)
+        return status
     # ------------------------------------------------------------- #
     #     Pipe in and Pipe out a bunch of data
     # ------------------------------------------------------------- #
@@ -159,21 +266,84 @@ class FPGATester:
     def fifo_read(self,fifob_odata):    
         self.read_pipe_out(self.ADDR_MAP["FIFOB_OUT_DATA"].address, fifob_odata)
 
+    def submit_fifo_write(self, fifodata):
+        return self.submit_pipe_in(self.ADDR_MAP["FIFOA_IN_DATA"].address, fifodata)
+
+    def submit_fifo_read(self, fifob_odata):
+        return self.submit_pipe_out(self.ADDR_MAP["FIFOB_OUT_DATA"].address, fifob_odata)
+
+    def set_pipe_block_size(self, name, block_size):
+        """
+        Select the transfer mode of a pipe endpoint.
+        :param name: name of a `pipe_in`/`pipe_out` endpoint in ADDR_MAP.
+        :param block_size: 0 for the plain pipe, otherwise bytes per block of the block pipe (multiple of 16,
+        up to 16384). Transfers whose length is not a multiple of the block size use the plain pipe.
+        """
+        entry = self.ADDR_MAP[name]
+        assert entry.type in (EndpointType.PIPE_IN, EndpointType.PIPE_OUT), "{} is not a pipe".format(name)
+        assert block_size == 0 or (block_size % 16 == 0 and block_size <= 16384), "Invalid block size provided."
+        if block_size:
+            self.pipe_block_size[entry.address] = block_size
+        else:
+            self.pipe_block_size.pop(entry.address, None)
+
     # ------------------------------------------------------------- #
     #      Write and read Endpoints 
     # ------------------------------------------------------------- #
+    @contextmanager
+    def wire_in_batch(self):
+        """
+        Stage every `write_wire_in` issued inside the block and update them with as few `UpdateWireIns`
+        as possible. A write touching bits already staged (e.g. the edges of a reset pulse) and any other
+        endpoint access flush the staged values first, so the FPGA still sees the writes in program order.
+        """
+        self._wire_in_batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._wire_in_batch_depth -= 1
+            if self._wire_in_batch_depth == 0:
+                self.flush_wire_ins()
+
+    def flush_wire_ins(self):
+        """Send all staged wire-in values to FPGA with one `UpdateWireIns`."""
+        if not self._wire_in_pending:
+            return
+        start = self.stats.start()
+        self.wait_usb_idle()
+        self.device.UpdateWireIns()
+        self.stats.record("UpdateWireIns", 4 * len(self._wire_in_pending), start)
+        for addr, (mask, value) in self._wire_in_pending.items():
+            known_mask, known_value = self._wire_in_latched.get(addr, (0, 0))
+            self._wire_in_latched[addr] = (known_mask | mask, (known_value & ~mask) | (value & mask))
+        self._wire_in_pending.clear()
+
      # Write Wire In
     def write_wire_in(self, addr, value, mask=0x01):   
         """
         Helper to write the specified value to the `wire_in` endpoint in FPGA.
+        The write is skipped when the masked bits already hold the value in FPGA.
         :param addr: 8-bit address of the `wire_in`.
         :param value: 32-bit integer of value to be written into.
         :param mask: 32-bit mask applied to the write value (1 bit LSB by default).
         """
         # Detect value and mask is proper
         assert 0 <= value <= 2 ** 32 - 1 and 0 <= mask <= 2 ** 32 - 1
+        start = self.stats.start()
+        pending_mask, pending_value = self._wire_in_pending.get(addr, (0, 0))
+        if pending_mask & mask:  # Keep the edge: the previous level must reach FPGA first
+            self.flush_wire_ins()
+            pending_mask, pending_value = 0, 0
+        known_mask, known_value = self._wire_in_latched.get(addr, (0, 0))
+        if mask & ~known_mask == 0 and (value ^ known_value) & mask == 0:
+            self.stats.record(addr, 0, start)
+            return
+        self.wait_usb_idle()
         self.device.SetWireInValue(addr, value, mask)
-        self.device.UpdateWireIns()
+        self._wire_in_pending[addr] = (pending_mask | mask, (pending_value & ~mask) | (value & mask))
+        if self._wire_in_batch_depth == 0:
+            self.flush_wire_ins()
+        self.stats.record(addr, 4, start)
 
     # Read Wire Out
     def read_wire_out(self, addr):                       
@@ -182,8 +352,12 @@ class FPGATester:
         :param addr: 8-bit address of the `wire_out`.
         :return: 32-bit `wire_out` data.
         """
+        start = self.stats.start()
+        self._settle()
         self.device.UpdateWireOuts()
-        return self.device.GetWireOutValue(addr)
+        value = self.device.GetWireOutValue(addr)
+        self.stats.record(addr, 4, start)
+        return value
     
     # Write Trigger In
     def write_trigger_in(self, addr, bit):
@@ -194,7 +368,25 @@ class FPGATester:
         :return: NoError - Operation completed successfully.
         """
         assert 0 <= bit <= 2 ** 32 - 1
+        start = self.stats.start()
+        self._settle()
         self.device.ActivateTriggerIn(addr, bit)
+        self.stats.record(addr, 0, start)
+
+    # Read Trigger Out
+    def read_trigger_out(self, addr, mask):
+        """
+        Helper to check the `Trigger_out` endpoint in FPGA.
+        :param addr: 8-bit address of the `Trigger_out`.
+        :param mask: mask of the trigger bits to check.
+        :return: True if any of the masked triggers fired since the previous update.
+        """
+        start = self.stats.start()
+        self._settle()
+        self.device.UpdateTriggerOuts()
+        triggered = self.device.IsTriggered(addr, mask)
+        self.stats.record(addr, 0, start)
+        return triggered
 
     # Write Pipe In
     def write_pipe_in(self, addr, data):
@@ -204,7 +396,8 @@ class FPGATester:
         :param data: data of type bytearray to be written to `pipe` endpoint.
         the 'data' parameter is mutable type bytearray
         """
-        self.device.WriteToPipeIn(addr, data)
+        self._settle()
+        self._pipe_in(addr, data)
 
     # Read Pipe Out
     def read_pipe_out(self, addr, data):
@@ -213,4 +406,91 @@ class FPGATester:
         :param addr: 8-bit address of the `pipe_out`.
         :param data: read data will be placed (change in-place) in the data.    
         """
-        self.device.ReadFromPipeOut(addr, data)
\ No newline at end of file
+        self._settle()
+        self._pipe_out(addr, data)
+
+    def _pipe_in(self, addr, data, threaded=False):
+        """Write a pipe with the block or plain transfer selected for `addr`, `threaded` uses the `Thr` calls"""
+        start = self.stats.start()
+        block_size = self.pipe_block_size.get(addr, 0)
+        if block_size and len(data) % block_size == 0:
+            write = self.device.WriteToBlockPipeInThr if threaded else self.device.WriteToBlockPipeIn
+            result = write(addr, block_size, data)
+        else:
+            write = self.device.WriteToPipeInThr if threaded else self.device.WriteToPipeIn
+            result = write(addr, data)
+        self.stats.record(addr, len(data), start)
+        return result
+
+    def _pipe_out(self, addr, data, threaded=False):
+        """Read a pipe with the block or plain transfer selected for `addr`, `threaded` uses the `Thr` calls"""
+        start = self.stats.start()
+        block_size = self.pipe_block_size.get(addr, 0)
+        if block_size and len(data) % block_size == 0:
+            read = self.device.ReadFromBlockPipeOutThr if threaded else self.device.ReadFromBlockPipeOut
+            result = read(addr, block_size, data)
+        else:
+            read = self.device.ReadFromPipeOutThr if threaded else self.device.ReadFromPipeOut
+            result = read(addr, data)
+        self.stats.record(addr, len(data), start)
+        return result
+
+    # ------------------------------------------------------------- #
+    #      Overlapped pipe transfers on the USB worker thread
+    # ------------------------------------------------------------- #
+    def start_usb_worker(self):
+        """Start the dedicated USB worker thread running the GIL-releasing (`Thr`) pipe calls."""
+        if self._usb_worker is None:
+            self._usb_worker = ThreadPoolExecutor(max_workers=1)
+
+    def stop_usb_worker(self):
+        """Wait for the queued transfers and stop the USB worker thread."""
+        if self._usb_worker is not None:
+            self.wait_usb_idle()
+            self._usb_worker.shutdown()
+            self._usb_worker = None
+
+    def wait_usb_idle(self):
+        """Block until every submitted transfer completed, re-raising the error of a failed one."""
+        while self._usb_pending:
+            self._usb_pending.popleft().result()
+
+    def submit_pipe_in(self, addr, data):
+        """
+        Queue a `pipe_in` transfer on the USB worker thread (run immediately if the worker is not started).
+        Transfers run in submission order, any synchronous endpoint access waits for them first.
+        :param addr: 8-bit address of the `pipe_in`.
+        :param data: bytearray to be written, must not be modified until the transfer completed.
+        :return: `concurrent.futures.Future` of the device return code.
+        """
+        return self._submit(self._pipe_in, addr, data)
+
+    def submit_pipe_out(self, addr, data):
+        """
+        Queue a `pipe_out` transfer on the USB worker thread (run immediately if the worker is not started).
+        :param addr: 8-bit address of the `pipe_out`.
+        :param data: bytearray filled in-place, valid once the transfer completed.
+        :return: `concurrent.futures.Future` of the device return code.
+        """
+        return self._submit(self._pipe_out, addr, data)
+
+    def _submit(self, transfer, addr, data):
+        if self._wire_in_pending:
+            self.flush_wire_ins()
+        if self._usb_worker is None:
+            future = Future()
+            try:
+                future.set_result(transfer(addr, data))
+            except Exception as error:
+                future.set_exception(error)
+            return future
+        while self._usb_pending and self._usb_pending[0].done():
+            self._usb_pending.popleft().result()
+        future = self._usb_worker.submit(transfer, addr, data, True)
+        self._usb_pending.append(future)
+        return future
+
+    def _settle(self):
+        """Complete the queued transfers and the staged wire-ins before a synchronous endpoint access."""
+        self.wait_usb_idle()
+        self.flush_wire_ins()
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+This module exports the streaming offset calibration of the 64 output columns: running statistics of the
+offset-measurement MACs, and the versioned table of the column offsets per chip loaded by the decoder.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+
+
+class ColumnStats:
+    """
+    Streaming statistics of the raw outputs of every column, without storing the outputs:
+    Welford mean and variance (merged batch by batch), median estimated on a uniform reservoir sample.
+    """
+
+    def __init__(self, columns=64, reservoir=1024, seed=None):
+        """
+        :param columns: number of output columns.
+        :param reservoir: outputs kept per column for the median.
+        :param seed: seed of the reservoir sampling.
+        """
+        self.count = 0
+        self.mean = np.zeros(columns)
+        self.m2 = np.zeros(columns)                     # Sum of the squared deviations from the mean
+        self.sample = np.zeros((reservoir, columns))    # Reservoir, the same outputs kept for every column
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, batch):
+        """Account an (N, columns) batch of outputs"""
+        batch = np.asarray(batch, dtype=float).reshape(-1, len(self.mean))
+        size, total = len(batch), self.count + len(batch)
+        if size == 0:
+            return
+        # Welford: the mean and M2 of the batch merged into the running ones
+        delta = batch.mean(axis=0) - self.mean
+        self.m2 += ((batch - batch.mean(axis=0)) ** 2).sum(axis=0) + delta ** 2 * self.count * size / total
+        self.mean += delta * size / total
+        # Reservoir (algorithm R): output i replaces a random slot with probability reservoir / (i + 1)
+        fill = max(0, min(size, len(self.sample) - self.count))
+        self.sample[self.count:self.count + fill] = batch[:fill]
+        slots = self.rng.integers(0, np.arange(self.count + fill, total) + 1)
+        for i in np.flatnonzero(slots < len(self.sample)):
+            self.sample[slots[i]] = batch[fill + i]
+        self.count = total
+
+    def variance(self):
+        return self.m2 / max(self.count - 1, 1)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    def median(self):
+        return np.median(self.sample[:min(self.count, len(self.sample))], axis=0)
+
+
+class CalibrationTable:
+    """
+    JSON file of {chip_id: {"version", "revision", "offsets", "mean", "std", "samples", "time"}} entries.
+    "version" is the format of the entry, "revision" counts the calibrations of the chip.
+    """
+
+    VERSION = 1
+    COLUMNS = 64
+
+    def __init__(self, path):
+        """
+        :param path: path of the JSON table, created on the first calibration.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.path = path
+        self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as table_file:
+                return json.load(table_file)
+        except ValueError:
+            self.logger.warning("Calibration table {} is corrupted, starting a new one.".format(self.path))
+            return {}
+
+    def save(self, chip_id):
+        """Write the entry of `chip_id`, merged with the entries other processes saved."""
+        entries = self.load()
+        entries[chip_id] = self.entries[chip_id]
+        self.entries = entries
+        temp_path = "{}.{}".format(self.path, os.getpid())
+        with open(temp_path, "w") as table_file:
+            json.dump(entries, table_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)  # Atomic: the device pool workers share the file
+
+    def lookup(self, chip_id):
+        """Offsets of the chip as a 64-entry int16 array from [0] to [63], None if not calibrated."""
+        entry = self.entries.get(chip_id)
+        if entry is None:
+            return None
+        if entry.get("version") != self.VERSION or len(entry.get("offsets", ())) != self.COLUMNS:
+            self.logger.warning("Calibration of chip {} has an unsupported format, ignored.".format(chip_id))
+            return None
+        return np.array(entry["offsets"], dtype=np.int16)
+
+    def store(self, chip_id, stats):
+        """
+        Record the offsets of the chip from the `ColumnStats` of its offset measurements: the median of every
+        column, rounded to an even number (the output LSB weighs 2).
+        :return: the offsets, as returned by `lookup`.
+        """
+        offsets = (2 * np.round(stats.median() / 2)).astype(np.int16)
+        previous = self.entries.get(chip_id, {})
+        self.entries[chip_id] = {"version": self.VERSION, "revision": previous.get("revision", 0) + 1,
+                                 "offsets": offsets.tolist(), "mean": np.round(stats.mean, 3).tolist(),
+                                 "std": np.round(stats.std(), 3).tolist(), "samples": stats.count,
+                                 "time": datetime.now().isoformat()}
+        self.save(chip_id)
+        return offsets
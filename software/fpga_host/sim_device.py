@@ -0,0 +1,462 @@
+"""
+This module implements a pure-Python stand-in of the Opal Kelly FrontPanel device,
+modelling the XEM6310 bitstream (wires, triggers, FIFOA/FIFOB) and the CIM chip behind SPI/I2C.
+It exposes the same methods as `ok.okCFrontPanel` that `FPGATester` relies on.
+"""
+import logging
+import time
+from collections import Counter, deque, namedtuple
+
+import numpy as np
+
+from fpga_host.fpga_tester import FPGATester
+
+# Error codes, same values as `ok.okCFrontPanel.*`
+NO_ERROR = 0
+DEVICE_NOT_OPEN = -8
+INVALID_BLOCK_SIZE = -10
+
+_LatencyFields = namedtuple("LatencyModel", ["wire_in", "wire_out", "trigger_in", "trigger_out",
+                                             "pipe_setup", "pipe_byte", "itf_word", "mac", "pipe_block",
+                                             "pll", "configure"])
+
+
+class LatencyModel(_LatencyFields):
+    """
+    Per-transaction latency (seconds) of the simulated device, all zeros means an ideal device.
+    wire_in/wire_out/trigger_in/trigger_out: cost of one Update*/Activate* USB transaction.
+    pipe_setup/pipe_byte: fixed and per-byte cost of one pipe transfer.
+    itf_word: time the FPGA spends on one 32-bit FIFOA command (SPI/I2C access to the chip).
+    mac: time between the last activation word and `sta_act` being raised.
+    pipe_block: extra cost of every block of a block-pipe transfer.
+    pll/configure: duration of `LoadDefaultPLLConfiguration` and `ConfigureFPGA`.
+    """
+    __slots__ = ()
+
+    def __new__(cls, wire_in=0.0, wire_out=0.0, trigger_in=0.0, trigger_out=0.0,
+                pipe_setup=0.0, pipe_byte=0.0, itf_word=0.0, mac=0.0, pipe_block=0.0, pll=0.0, configure=0.0):
+        return super().__new__(cls, wire_in, wire_out, trigger_in, trigger_out,
+                               pipe_setup, pipe_byte, itf_word, mac, pipe_block, pll, configure)
+
+    @classmethod
+    def ideal(cls):
+        """No latency at all, measures host-side cost only."""
+        return cls()
+
+    @classmethod
+    def xem6310(cls):
+        """Rough figures of a XEM6310 on USB 3.0 with the SPI master (not calibrated on a board)."""
+        return cls(wire_in=50e-6, wire_out=50e-6, trigger_in=50e-6, trigger_out=50e-6,
+                   pipe_setup=150e-6, pipe_byte=3e-9, itf_word=20e-6, mac=20e-6, pipe_block=2e-6,
+                   pll=10e-3, configure=0.5)
+
+
+class SimChip:
+    """Behavioural model of the CIM chip inner registers (cfg_digiblk) and the 64x64 MAC array."""
+
+    # Inner register addresses, see `cfg_digiblk.v`
+    STATUS = 0x00
+    CONFIG_W = 0x10
+    CONFIG_R = 0x14
+    CTRL_TEST = 0x28
+    CTRL_IN = 0x2C
+    WEIGHT = 0x30
+    ACTIVATION = 0x34
+    DOUT = 0x38
+    # Reset value and writable bits of the plain RW registers
+    RW_REGS = {
+        CONFIG_W: (0x0211, 0x0733),
+        CONFIG_R: (0x0090, 0x77FF),
+        CTRL_TEST: (0x0000, 0x000F),
+        CTRL_IN: (0x0000, 0x0003),
+    }
+    NUM_WEIGHT_WORDS = 256  # 4096 bits / 16 bits
+    NUM_ACT_WORDS = 16      # 256 bits / 16 bits
+    NUM_DOUT_WORDS = 40     # 640 bits / 16 bits
+
+    def __init__(self, column_offsets=None, noise_std=0.0, seed=None):
+        """
+        :param column_offsets: optional 64 raw-column offsets added to every MAC result.
+        :param noise_std: standard deviation of the gaussian noise added to every MAC result.
+        :param seed: seed of the noise generator.
+        """
+        self.column_offsets = np.zeros(64) if column_offsets is None else np.asarray(column_offsets, dtype=float)
+        self.noise_std = noise_std
+        self.rng = np.random.RandomState(seed)
+        self.reset()
+
+    def reset(self):
+        """Asynchronous reset (rst_n low)."""
+        self.regs = {addr: reset for addr, (reset, _) in self.RW_REGS.items()}
+        self.regs[self.WEIGHT] = 0
+        self.regs[self.ACTIVATION] = 0
+        self.sta_wei = False
+        self.sta_act = False
+        self.weight_words = [0] * self.NUM_WEIGHT_WORDS
+        self.act_words = [0] * self.NUM_ACT_WORDS
+        self.dout_words = [0] * self.NUM_DOUT_WORDS
+        self.w_ptr = 0
+        self.a_ptr = 0
+        self.d_ptr = 0
+        self.mac_count = 0
+
+    def write(self, addr, data):
+        """Indirect write of 16-bit `data` into inner register `addr`.
+        :return: True when this write completes an activation load (a MAC is started).
+        """
+        if addr == self.STATUS:  # W1C
+            if data & 0x2:
+                self.sta_wei = False
+            if data & 0x1:
+                self.sta_act = False
+        elif addr in self.RW_REGS:
+            old = self.regs[addr]
+            self.regs[addr] = data & self.RW_REGS[addr][1]
+            if addr == self.CTRL_IN:  # Rising edge of load valid restarts the loading
+                if (data & 0x1) and not (old & 0x1):
+                    self.w_ptr = 0
+                if (data & 0x2) and not (old & 0x2):
+                    self.a_ptr = 0
+        elif addr == self.WEIGHT:
+            self.regs[addr] = data
+            if self.regs[self.CTRL_IN] & 0x1:
+                self.weight_words[self.w_ptr] = data
+                self.w_ptr = (self.w_ptr + 1) % self.NUM_WEIGHT_WORDS
+                if self.w_ptr == 0:
+                    self.sta_wei = True
+        elif addr == self.ACTIVATION:
+            self.regs[addr] = data
+            if self.regs[self.CTRL_IN] & 0x2:
+                self.act_words[self.a_ptr] = data
+                self.a_ptr = (self.a_ptr + 1) % self.NUM_ACT_WORDS
+                if self.a_ptr == 0:
+                    self.mac()
+                    return True
+        return False
+
+    def read(self, addr):
+        """Indirect read of the 16-bit inner register `addr`."""
+        addr &= 0xFC
+        if addr == self.STATUS:
+            return (self.sta_wei << 1) | self.sta_act
+        if addr == self.DOUT:
+            data = self.dout_words[self.d_ptr]
+            self.d_ptr = (self.d_ptr + 1) % self.NUM_DOUT_WORDS
+            return data
+        return self.regs.get(addr, 0)
+
+    def weights(self):
+        """Loaded weights as the 512-byte array used on the host side."""
+        return b"".join(word.to_bytes(2, "big") for word in self.weight_words)
+
+    def activations(self):
+        """Loaded activations as the 32-byte array used on the host side."""
+        return b"".join(word.to_bytes(2, "big") for word in self.act_words)
+
+    def mac(self):
+        """Compute the 64 column outputs and store them as 40 DOUT words in the bit-plane format."""
+        weight_bits = np.unpackbits(np.frombuffer(self.weights(), dtype=np.uint8)).reshape(64, 64)
+        weight_cal = weight_bits.astype(np.int32) * 2 - 1  # 0 representing -1 weight
+        act_bytes = np.frombuffer(self.activations(), dtype=np.uint8)
+        act_cal = np.stack((act_bytes >> 4, act_bytes & 0xF), axis=1).reshape(64).astype(np.int32)
+        column_out = np.dot(weight_cal.T, act_cal) + self.column_offsets
+        if self.noise_std:
+            column_out = column_out + self.rng.normal(0.0, self.noise_std, 64)
+        self.dout_words = self.encode_out(column_out)
+        self.d_ptr = 0
+        self.sta_act = True
+        self.mac_count += 1
+
+    @classmethod
+    def encode_out(cls, column_out):
+        """
+        Inverse of `TransData.decode_out` (without the offset subtraction): 64 outputs x 10 bits,
+        bit j of column i sits at bit j*64+i. Bit 0 is the sign, the 9 magnitude bits are inverted
+        for positive outputs and the LSB is worth 2.
+        """
+        half = np.clip(np.rint(np.asarray(column_out) / 2), -511, 511).astype(np.int32)
+        negative = half < 0
+        magnitude = np.where(negative, -half, ~half & 0x1FF)
+        planes = np.empty((10, 64), dtype=np.uint8)
+        planes[0] = negative
+        for j in range(1, 10):
+            planes[j] = (magnitude >> (9 - j)) & 1
+        out_bytes = np.packbits(planes.reshape(-1))
+        return [(int(out_bytes[k]) << 8) | int(out_bytes[k + 1]) for k in range(0, 80, 2)]
+
+
+class SimFrontPanel:
+    """Simulated `okCFrontPanel` running the fpga_top_w_chip bitstream with a CIM chip attached."""
+
+    FIFO_DEPTH = 2048  # 32-bit words, see FIFO_IN.xco
+    # Registers of the FPGA-side interface (itf2reg)
+    ITF_OPERATION = 0x01
+    ITF_ADDR = 0x02
+    ITF_WDATA_0B = 0x03
+    ITF_WDATA_1B = 0x04
+    ITF_RDATA_0B = 0x05
+    ITF_RDATA_1B = 0x06
+
+    def __init__(self, latency=None, serial="SIM00000", chip=None, mac_trigger=False, bus=None,
+                 configured=True, build_id=0):
+        """
+        :param latency: `LatencyModel` applied to every transaction (ideal device by default).
+        :param serial: serial number reported by the device.
+        :param chip: optional `SimChip` instance (e.g. with column offsets or noise).
+        :param mac_trigger: True if the bitstream provides the MAC_DONE trigger-out.
+        :param bus: serial numbers of all the simulated boards attached to the host (only this one by default).
+        :param configured: the FPGA already runs the bitstream (False models a board after power-up).
+        :param build_id: value of the BUILD_ID wire-out of the bitstream.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.latency = LatencyModel.ideal() if latency is None else latency
+        self.serial = serial
+        self.bus = [serial] if bus is None else list(bus)
+        self.chip = SimChip() if chip is None else chip
+        self.calls = Counter()  # Number of calls per FrontPanel method
+        self.is_open = False
+        addr = {name: entry.address for name, entry in FPGATester.ADDR_MAP.items()}
+        self.addr_sw_rst = addr["SW_RST"]
+        self.addr_chip_rst = addr["CHIP_RST"]
+        self.addr_fifob_thresh = addr["FIFOB_THRESH"]
+        self.addr_sta_chip = addr["STA_CHIP"]
+        self.addr_fifob_empty = addr["FIFOB_EMPTY"]
+        self.addr_fifob_prog_full = addr["FIFOB_PROG_FULL"]
+        self.addr_build_id = addr["BUILD_ID"]
+        self.configured = configured
+        self.build_id = build_id
+        self.addr_spi_config = addr["SPI_CONFIG"]
+        self.addr_mac_done = addr["MAC_DONE"]
+        self.mac_trigger = mac_trigger
+        self.addr_fifoa = addr["FIFOA_IN_DATA"]
+        self.addr_fifob = addr["FIFOB_OUT_DATA"]
+        self.wire_in_staged = {}
+        self.wire_in = {}
+        self.wire_out = {}
+        self.trigger_out = {}
+        self._mac_done_at = deque()  # Times of the pending sta_act rising edges
+        self.spi_configured = False
+        self.fifoa_overflow = 0
+        self.fifob_overflow = 0
+        self._reset_fpga()
+        self.chip.reset()
+        self._mac_ready_at = 0.0
+
+    # ------------------------------------------------------------- #
+    #    Internal model
+    # ------------------------------------------------------------- #
+    def _delay(self, seconds):
+        """Block for the modelled latency of one transaction.
+        :return: the time the transaction completes in the model (independent of sleep overshoot and GIL).
+        """
+        done = time.perf_counter() + seconds
+        if seconds > 0:
+            time.sleep(seconds)
+        return done
+
+    def _reset_fpga(self):
+        """SW_RST: clears both FIFOs and the tx control state machine."""
+        self.fifoa = deque()   # Pending FIFOA words as (completion time, word)
+        self.fifob = deque()   # FIFOB words
+        self.itf_regs = {self.ITF_OPERATION: 0, self.ITF_ADDR: 0, self.ITF_WDATA_0B: 0,
+                         self.ITF_WDATA_1B: 0, self.ITF_RDATA_0B: 0, self.ITF_RDATA_1B: 0}
+        self._itf_free_at = 0.0
+
+    def _advance(self, now):
+        """Let the FPGA consume every FIFOA command whose SPI/I2C access completed before `now`."""
+        while self.fifoa and self.fifoa[0][0] <= now:
+            done_at, word = self.fifoa.popleft()
+            self._exec_word(word, done_at)
+
+    def _exec_word(self, word, done_at):
+        """Execute one 32-bit FIFOA command: [7:0] data, [15:8] itf address, [16] write."""
+        data, itf_addr, write = word & 0xFF, (word >> 8) & 0xFF, (word >> 16) & 0x1
+        if write:
+            if itf_addr == self.ITF_OPERATION:
+                reg_ce, reg_we = (data >> 1) & 0x1, data & 0x1
+                reg_addr = self.itf_regs[self.ITF_ADDR]
+                if reg_ce and reg_we:
+                    reg_data = (self.itf_regs[self.ITF_WDATA_1B] << 8) | self.itf_regs[self.ITF_WDATA_0B]
+                    sta_act = self.chip.sta_act
+                    if self.chip.write(reg_addr, reg_data):
+                        self._mac_ready_at = done_at + self.latency.mac
+                        if not sta_act:
+                            self._mac_done_at.append(self._mac_ready_at)
+                elif reg_ce:
+                    reg_data = self.chip.read(reg_addr)
+                    self.itf_regs[self.ITF_RDATA_0B] = reg_data & 0xFF
+                    self.itf_regs[self.ITF_RDATA_1B] = reg_data >> 8
+                self.itf_regs[itf_addr] = 0  # reg_ce/reg_we are single-cycle pulses
+            elif itf_addr in self.itf_regs:
+                self.itf_regs[itf_addr] = data
+        else:
+            rdata = self.itf_regs.get(itf_addr, 0xAB)
+            if len(self.fifob) < self.FIFO_DEPTH:
+                self.fifob.append((itf_addr << 8) | rdata)  # FIFOB_IN = {16'd0, addr_byte, DataFromITF}
+            else:
+                self.fifob_overflow += 1
+
+    def _sta_chip(self, now):
+        sta_act = self.chip.sta_act and now >= self._mac_ready_at
+        return (self.chip.sta_wei << 1) | sta_act
+
+    # ------------------------------------------------------------- #
+    #    Device management
+    # ------------------------------------------------------------- #
+    def GetDeviceCount(self):
+        self.calls["GetDeviceCount"] += 1
+        return len(self.bus)
+
+    def GetDeviceListSerial(self, num):
+        return self.bus[num]
+
+    def OpenBySerial(self, serial=""):
+        self.calls["OpenBySerial"] += 1
+        if serial not in ("", self.serial):
+            return DEVICE_NOT_OPEN
+        self.is_open = True
+        return NO_ERROR
+
+    def IsOpen(self):
+        return self.is_open
+
+    def Close(self):
+        self.is_open = False
+
+    def GetSerialNumber(self):
+        return self.serial
+
+    def GetDeviceInfo(self, device_info):
+        self.calls["GetDeviceInfo"] += 1
+        device_info.productName = "XEM6310-LX45 (simulated)"
+        device_info.deviceMajorVersion = 1
+        device_info.deviceMinorVersion = 0
+        device_info.serialNumber = self.serial
+        device_info.deviceID = "SimFrontPanel"
+        return NO_ERROR
+
+    def LoadDefaultPLLConfiguration(self):
+        self.calls["LoadDefaultPLLConfiguration"] += 1
+        self._delay(self.latency.pll)
+        return NO_ERROR
+
+    def ConfigureFPGA(self, bitfile):
+        self.calls["ConfigureFPGA"] += 1
+        self._delay(self.latency.configure)
+        self.configured = True
+        self._reset_fpga()
+        self.chip.reset()
+        return NO_ERROR
+
+    def IsFrontPanelEnabled(self):
+        return self.configured
+
+    # ------------------------------------------------------------- #
+    #    Endpoints
+    # ------------------------------------------------------------- #
+    def SetWireInValue(self, addr, value, mask=0xFFFFFFFF):
+        self.calls["SetWireInValue"] += 1
+        old = self.wire_in_staged.get(addr, 0)
+        self.wire_in_staged[addr] = (old & ~mask) | (value & mask)
+        return NO_ERROR
+
+    def UpdateWireIns(self):
+        self.calls["UpdateWireIns"] += 1
+        self._advance(self._delay(self.latency.wire_in))
+        self.wire_in = dict(self.wire_in_staged)
+        if self.wire_in.get(self.addr_sw_rst, 0) & 0x1:  # Reset is active high
+            self._reset_fpga()
+        if not self.wire_in.get(self.addr_chip_rst, 0) & 0x1:  # Chip reset is active low
+            self.chip.reset()
+        return NO_ERROR
+
+    def UpdateWireOuts(self):
+        self.calls["UpdateWireOuts"] += 1
+        now = self._delay(self.latency.wire_out)
+        self._advance(now)
+        thresh = self.wire_in.get(self.addr_fifob_thresh, 0) & 0xFFFF
+        self.wire_out = {
+            self.addr_sta_chip: self._sta_chip(now),
+            self.addr_fifob_empty: int(not self.fifob),
+            self.addr_fifob_prog_full: int(len(self.fifob) >= thresh),
+            self.addr_build_id: self.build_id,
+        }
+        return NO_ERROR
+
+    def GetWireOutValue(self, addr):
+        return self.wire_out.get(addr, 0)
+
+    def UpdateTriggerOuts(self):
+        self.calls["UpdateTriggerOuts"] += 1
+        now = self._delay(self.latency.trigger_out)
+        self._advance(now)
+        fired = 0
+        while self._mac_done_at and self._mac_done_at[0] <= now:
+            self._mac_done_at.popleft()
+            fired = 0x01
+        self.trigger_out = {self.addr_mac_done: fired} if self.mac_trigger else {}
+        return NO_ERROR
+
+    def IsTriggered(self, addr, mask):
+        return bool(self.trigger_out.get(addr, 0) & mask)
+
+    def ActivateTriggerIn(self, addr, bit):
+        self.calls["ActivateTriggerIn"] += 1
+        self._delay(self.latency.trigger_in)
+        if addr == self.addr_spi_config and bit == 0:
+            self.spi_configured = True
+        return NO_ERROR
+
+    def _pipe_cost(self, length, block_size=0):
+        cost = self.latency.pipe_setup + length * self.latency.pipe_byte
+        if block_size:
+            cost += (length // block_size) * self.latency.pipe_block
+        return cost
+
+    def _pipe_in(self, addr, data, now):
+        self._advance(now)
+        if addr == self.addr_fifoa:
+            start = max(now, self._itf_free_at)
+            for i in range(0, len(data) - 3, 4):
+                if len(self.fifoa) >= self.FIFO_DEPTH:
+                    self.fifoa_overflow += 1
+                    continue
+                start += self.latency.itf_word
+                self.fifoa.append((start, int.from_bytes(data[i:i + 4], "little")))
+            self._itf_free_at = start
+            self._advance(now)
+        return len(data)
+
+    def _pipe_out(self, addr, data, now):
+        self._advance(now)
+        if addr == self.addr_fifob:
+            for i in range(0, len(data) - 3, 4):
+                word = self.fifob.popleft() if self.fifob else 0  # Underflow reads back zeros
+                data[i:i + 4] = word.to_bytes(4, "little")
+        return len(data)
+
+    def WriteToPipeIn(self, addr, data):
+        self.calls["WriteToPipeIn"] += 1
+        return self._pipe_in(addr, data, self._delay(self._pipe_cost(len(data))))
+
+    def ReadFromPipeOut(self, addr, data):
+        self.calls["ReadFromPipeOut"] += 1
+        return self._pipe_out(addr, data, self._delay(self._pipe_cost(len(data))))
+
+    def WriteToBlockPipeIn(self, addr, block_size, data):
+        self.calls["WriteToBlockPipeIn"] += 1
+        if block_size <= 0 or len(data) % block_size:
+            return INVALID_BLOCK_SIZE
+        return self._pipe_in(addr, data, self._delay(self._pipe_cost(len(data), block_size)))
+
+    def ReadFromBlockPipeOut(self, addr, block_size, data):
+        self.calls["ReadFromBlockPipeOut"] += 1
+        if block_size <= 0 or len(data) % block_size:
+            return INVALID_BLOCK_SIZE
+        return self._pipe_out(addr, data, self._delay(self._pipe_cost(len(data), block_size)))
+
+    # The GIL is released while the simulated transfer sleeps, the threaded calls behave the same
+    WriteToPipeInThr = WriteToPipeIn
+    ReadFromPipeOutThr = ReadFromPipeOut
+    WriteToBlockPipeInThr = WriteToBlockPipeIn
+    ReadFromBlockPipeOutThr = ReadFromBlockPipeOut
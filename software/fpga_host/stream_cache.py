@@ -0,0 +1,57 @@
+"""
+This module exports the LRU cache of encoded FIFOA streams, keyed by a digest of the raw data they encode.
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+
+
+class StreamCache:
+    """Content-addressed LRU cache of ready-to-send FIFOA streams (e.g. 4096-byte weight streams)."""
+
+    def __init__(self, max_bytes=4 << 20, name="weights"):
+        """
+        :param max_bytes: memory cap of the cached streams in bytes, 0 disables the cache.
+        :param name: name used in the logged statistics.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.max_bytes = max_bytes
+        self.name = name
+        self.streams = OrderedDict()  # {digest: stream}, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def digest(cls, data):
+        return hashlib.sha1(data).digest()
+
+    def get(self, key, data, encode):
+        """
+        Return the stream of `data`, calling `encode(data)` only on a miss.
+        The returned stream is shared: it must not be modified.
+        :param key: `digest(data)`, computed once by the caller (e.g. also to check the weights loaded in the chip).
+        """
+        stream = self.streams.get(key)
+        if stream is not None:
+            self.streams.move_to_end(key)
+            self.hits += 1
+            return stream
+        self.misses += 1
+        stream = encode(data)
+        if len(stream) <= self.max_bytes:
+            self.streams[key] = stream
+            self.nbytes += len(stream)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.streams.popitem(last=False)
+                self.nbytes -= len(evicted)
+        return stream
+
+    def clear(self):
+        self.streams.clear()
+        self.nbytes = 0
+
+    def log_stats(self):
+        self.logger.info('Stream cache {}: {} hits, {} misses, {} streams, {:.1f} kB of {:.1f} kB'.format(
+            self.name, self.hits, self.misses, len(self.streams), self.nbytes / 1024, self.max_bytes / 1024))
@@ -0,0 +1,156 @@
+"""
+This module exports lazy generators of the activation sweeps of `FpgaFunc`: the vectors of any cycle are computed
+directly from the cycle index, by vectorized chunks, the random ones from a seeded `numpy.random.Generator`.
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from fpga_host.data_gen import DataGen
+
+
+class SweepPattern(ABC):
+    """
+    Activation vectors of `cycles` MAC cycles, cycle k as 32 bytes (64 activations of 4 bits).
+    `chunks(start)` yields (chunk, 32) uint8 arrays from cycle `start` on, without generating the earlier cycles.
+    Subclasses define `nibbles`.
+    """
+
+    NIBBLES = 64
+
+    def __init__(self, cycles:int, chunk:int=64):
+        """
+        :param cycles: number of cycles of the sweep.
+        :param chunk: number of cycles generated at once.
+        """
+        assert cycles >= 0 and chunk > 0, "invalid inputs"
+        self.cycles = cycles
+        self.chunk = chunk
+
+    def __len__(self):
+        return self.cycles
+
+    def __iter__(self):
+        return self.chunks()
+
+    def block(self, begin:int, end:int):
+        """(end - begin, 32) uint8 array of the vectors of cycles [begin, end)"""
+        return DataGen.pack_nibbles(self.nibbles(np.arange(begin, end)))
+
+    @abstractmethod
+    def nibbles(self, cycles):
+        """(len(cycles), 64) activations of the cycle indices `cycles`"""
+
+    def vector(self, cycle:int):
+        """Vector of one cycle, as a bytearray (the `DataGen` format)"""
+        return bytearray(self.block(cycle, cycle + 1)[0].tobytes())
+
+    def chunks(self, start:int=0):
+        """Yield the vectors of cycles [start, cycles) by arrays of at most `chunk` cycles"""
+        for begin in range(start, self.cycles, self.chunk):
+            yield self.block(begin, min(begin + self.chunk, self.cycles))
+
+    def vectors(self, start:int=0):
+        """Yield the vectors of cycles [start, cycles) one by one, as bytearrays (the `DataGen` format)"""
+        for block in self.chunks(start):
+            for vector in block:
+                yield bytearray(vector.tobytes())
+
+    def to_list(self):
+        return list(self.vectors())
+
+
+class ShiftAppendPattern(SweepPattern):
+    """Every cycle shifts the activations by one nibble and appends a new one (`act_plus_f`, `act_append_random`)"""
+
+    def __init__(self, cycles:int, start=None, chunk:int=64):
+        """
+        :param start: vector of cycle 0, 32 zero bytes by default.
+        """
+        super().__init__(cycles, chunk)
+        start = bytearray(32) if start is None else start
+        self.start = DataGen.unpack_nibbles([start])[0]
+
+    @abstractmethod
+    def appended(self, first:int, count:int):
+        """`count` nibbles appended by cycles first, first+1, ... (cycle 0 appends nothing)"""
+
+    def nibbles(self, cycles):
+        # Cycle k is the 64-nibble window at k of: start vector, nibbles appended by cycles 1, 2, ...
+        lo, hi = int(cycles[0]), int(cycles[-1])
+        first = max(lo - self.NIBBLES + 1, 1)  # Earliest appended nibble in the window of cycle lo
+        stream = np.concatenate([self.start[min(lo, self.NIBBLES):], self.appended(first, hi - first + 1)])
+        index = (cycles - lo)[:, None] + np.arange(self.NIBBLES)[None, :]
+        return stream[index]
+
+
+class PlusF(ShiftAppendPattern):
+    """`DataGen.act_plus_f`: a 4'b1111 appended every cycle"""
+
+    def appended(self, first, count):
+        return np.full(count, 15, dtype=np.uint8)
+
+
+class AppendRandom(ShiftAppendPattern):
+    """`DataGen.act_append_random`: a random activation in [0, high] appended every cycle"""
+
+    STREAM_BLOCK = 256  # Appended nibbles drawn per generator, generator b seeded with (seed, b)
+
+    def __init__(self, cycles:int, start=None, seed=None, high:int=5, chunk:int=64):
+        """
+        :param seed: seed of the random activations, a fresh one if None (kept in `seed` to replay the run).
+        :param high: largest random activation.
+        """
+        super().__init__(cycles, start, chunk)
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.high = high
+
+    def appended(self, first, count):
+        if count == 0:  # Cycle 0 alone
+            return np.empty(0, dtype=np.uint8)
+        blocks = range((first - 1) // self.STREAM_BLOCK, (first + count - 2) // self.STREAM_BLOCK + 1)
+        stream = np.concatenate([np.random.default_rng([self.seed, block]).integers(
+            0, self.high + 1, self.STREAM_BLOCK, dtype=np.uint8) for block in blocks])
+        skip = (first - 1) % self.STREAM_BLOCK
+        return stream[skip:skip + count]
+
+
+class PlusOne(SweepPattern):
+    """
+    `DataGen.act_plus_one` from 32 zero bytes. The nibble sum modulo 15 grows by one every cycle, so the shift
+    happens every 15 cycles: cycle 15m+j holds m 4'b1111 followed by j (nothing for j = 0), low nibbles first.
+    """
+
+    def nibbles(self, cycles):
+        full, digit = np.divmod(cycles, 15)
+        end = self.NIBBLES - (digit > 0)                   # The 4'b1111 end before the last digit, if any
+        begin = end - np.minimum(full, end)
+        position = np.arange(self.NIBBLES)[None, :]
+        nibbles = np.where((position >= begin[:, None]) & (position < end[:, None]), 15, 0).astype(np.uint8)
+        nibbles[:, -1] += digit.astype(np.uint8)
+        return nibbles
+
+
+class PlusOneEach(SweepPattern):
+    """`DataGen.act_plusone_each`: 17 added to every byte below 255"""
+
+    def __init__(self, cycles:int, start=None, chunk:int=64):
+        """
+        :param start: vector of cycle 0, 32 zero bytes by default.
+        """
+        super().__init__(cycles, chunk)
+        self.start = np.frombuffer(bytes(bytearray(32) if start is None else start), dtype=np.uint8).astype(np.int64)
+
+    def nibbles(self, cycles):
+        return DataGen.unpack_nibbles(self.byte_vectors(cycles))
+
+    def block(self, begin, end):
+        return self.byte_vectors(np.arange(begin, end))  # Computed on bytes, no nibble round trip
+
+    def byte_vectors(self, cycles):
+        """(len(cycles), 32) uint8 vectors of the cycle indices `cycles`"""
+        steps = np.minimum(np.asarray(cycles)[:, None], -(-(255 - self.start) // 17))  # Increments until 255
+        block = self.start + 17 * steps
+        assert block.max() <= 255, "byte must be in range(0, 256)"
+        return block.astype(np.uint8)
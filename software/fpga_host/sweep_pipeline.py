@@ -0,0 +1,138 @@
+"""
+This module exports the pipelined sweep engine: the MAC cycles of a sweep flow through three stages connected
+by bounded queues, so that the board is kept busy while the host encodes the next vectors and decodes,
+checks and persists the previous outputs.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+_DONE = object()  # End of the cycles, sent down every queue
+
+
+class StageStats:
+    """Time one stage spent working, waiting for its input (starved) and for room in its output queue (blocked)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+    def run(self, work, *args):
+        start = time.perf_counter()
+        result = work(*args)
+        self.busy += time.perf_counter() - start
+        self.items += 1
+        return result
+
+    def get(self, source):
+        start = time.perf_counter()
+        item = source.get()
+        self.starved += time.perf_counter() - start
+        return item
+
+    def put(self, sink, item):
+        start = time.perf_counter()
+        sink.put(item)
+        self.blocked += time.perf_counter() - start
+
+
+class SweepPipeline:
+    """
+    Three stages, each cycle going through them in order:
+    encode (vector generation and encoding, worker thread) -> device (MAC cycle, on the calling thread, which
+    owns the board) -> host (decoding, theory and persisting, worker thread).
+    Queues hold `depth` cycles between stages: 2 double-buffers the device stage on both sides.
+    The host stage handles the cycles one by one in cycle order, so results come back in cycle order.
+    """
+
+    STAGES = ("encode", "device", "host")
+
+    def __init__(self, depth=2):
+        """
+        :param depth: cycles held by each queue between two stages.
+        """
+        assert depth > 0, "invalid inputs"
+        self.logger = logging.getLogger('CIM_Process')
+        self.depth = depth
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self.cycles = 0
+        self.elapsed = 0.0
+
+    def run(self, items, encode, device, finish):
+        """
+        Run one cycle per item of `items` (e.g. a lazy `SweepPattern`).
+        :param encode: encode(index, item), the data the device stage sends.
+        :param device: device(index, encoded), the data the host stage needs (e.g. the output bytes). It must
+                       not return buffers the next cycles reuse, such as the views of `TransData.get_640b_out`.
+        :param finish: finish(index, item, data), the result of the cycle.
+        :return: list of the results, in cycle order.
+        """
+        encoded, received = queue.Queue(self.depth), queue.Queue(self.depth)
+        stop = threading.Event()
+        errors, results = [], []
+        workers = [threading.Thread(target=self._encode, args=(items, encode, encoded, stop, errors),
+                                    name="sweep_encode"),
+                   threading.Thread(target=self._finish, args=(finish, received, results, errors),
+                                    name="sweep_host")]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        stats, cycle = self.stats["device"], None
+        try:
+            cycle = stats.get(encoded)
+            while cycle is not _DONE and not errors:  # Stop at the first failure of any stage
+                index, item, data = cycle
+                stats.put(received, (index, item, stats.run(device, index, data)))
+                cycle = stats.get(encoded)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            stop.set()
+            while cycle is not _DONE:  # Unblock the encode stage
+                cycle = encoded.get()
+            received.put(_DONE)
+            for worker in workers:
+                worker.join()
+        self.cycles += len(results)
+        self.elapsed += time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        return results
+
+    def _encode(self, items, encode, encoded, stop, errors):
+        stats = self.stats["encode"]
+        try:
+            for index, item in enumerate(items):
+                if stop.is_set():
+                    break
+                stats.put(encoded, (index, item, stats.run(encode, index, item)))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            encoded.put(_DONE)
+
+    def _finish(self, finish, received, results, errors):
+        stats = self.stats["host"]
+        for index, item, data in iter(lambda: stats.get(received), _DONE):
+            if errors:
+                continue  # Keep draining: the device stage must never block on a full queue
+            try:
+                results.append(stats.run(finish, index, item, data))
+            except Exception as error:
+                errors.append(error)
+
+    def log_stats(self):
+        """Occupancy of every stage: share of the sweep time spent working, starved and blocked"""
+        elapsed = max(self.elapsed, 1e-9)
+        self.logger.info('Sweep pipeline: {} cycles in {:.3f} s, queue depth {}'.format(
+            self.cycles, self.elapsed, self.depth))
+        for name in self.STAGES:
+            stats = self.stats[name]
+            self.logger.info('  {:<6}: {:5.1f}% busy, {:5.1f}% starved, {:5.1f}% blocked, {} cycles'.format(
+                name, 100 * stats.busy / elapsed, 100 * stats.starved / elapsed, 100 * stats.blocked / elapsed,
+                stats.items))
@@ -0,0 +1,66 @@
+"""
+This module exports the incremental theory tracker: expected outputs of consecutive MAC cycles with the same
+weights, updated from the activations which changed since the previous cycle.
+"""
+
+import logging
+
+import numpy as np
+
+from fpga_host.data_gen import DataGen
+
+
+class TheoryTracker:
+    """
+    Keep the previous activations and expected outputs. A cycle changing k activations costs a rank-k update
+    (k weight rows of 64), more than MAX_CHANGES changes (e.g. a shift of every nibble) a full product.
+    Every `resync_every` incremental updates, the outputs are recomputed in full and compared.
+    """
+
+    MAX_CHANGES = 16  # Above, the 64 x 64 product is cheaper than the rank-k update
+
+    def __init__(self, weight_matrix, resync_every=256):
+        """
+        :param weight_matrix: 64 by 64 weight array of +1/-1, row r multiplied by activation r
+                              (see `TransData.theory_weights`).
+        :param resync_every: incremental updates between two full recomputations.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.weights = np.asarray(weight_matrix, dtype=np.int64)
+        self.resync_every = resync_every
+        self.activations = None  # 64 activations of the last cycle
+        self.outputs = None      # Its 64 outputs, column order of the weight array (reversed on return)
+        self.since_resync = 0
+        self.incremental = 0
+        self.full = 0
+        self.mismatches = 0
+
+    def update(self, activations):
+        """Expected outputs of the next cycle, an int64 array from [0] to [63] as `TransData.output_theory`"""
+        new = DataGen.unpack_nibbles([activations])[0].astype(np.int64)
+        changed = None if self.activations is None else np.flatnonzero(new != self.activations)
+        if changed is None or len(changed) > self.MAX_CHANGES:
+            self.outputs = np.dot(new, self.weights)
+            self.full += 1
+        else:
+            self.outputs += np.dot(new[changed] - self.activations[changed], self.weights[changed])
+            self.incremental += 1
+            self.since_resync += 1
+        self.activations = new
+        if self.since_resync >= self.resync_every:
+            self.resync()
+        return self.outputs[::-1].copy()   # From [0] to [63]
+
+    def resync(self):
+        """Recompute the outputs in full, counting a mismatch if the incremental ones drifted"""
+        outputs = np.dot(self.activations, self.weights)
+        if not np.array_equal(outputs, self.outputs):
+            self.mismatches += 1
+            self.logger.error('Theory tracker out of sync after {} incremental updates'.format(self.since_resync))
+        self.outputs = outputs
+        self.full += 1
+        self.since_resync = 0
+
+    def log_stats(self):
+        self.logger.info('Theory tracker: {} incremental updates, {} full products, {} mismatches'.format(
+            self.incremental, self.full, self.mismatches))
@@ -0,0 +1,260 @@
+"""
+This module exports the recorder of the endpoint traffic of a FrontPanel device into a compact binary log,
+and the replay engine re-issuing a recorded log against a simulated device or a real board.
+"""
+
+import logging
+import struct
+import time
+from collections import namedtuple
+
+MAGIC = b"OKTRLOG1"
+# Every record: op code, microseconds since the previous record, endpoint address, argument, value,
+# followed by `value` payload bytes for the pipe operations
+RECORD = struct.Struct("<BIBII")
+
+# Op codes: argument and value of the record
+SET_WIRE_IN = 1          # mask, value
+UPDATE_WIRE_INS = 2
+UPDATE_WIRE_OUTS = 3
+GET_WIRE_OUT = 4         # -, value read
+ACTIVATE_TRIGGER_IN = 5  # bit, -
+UPDATE_TRIGGER_OUTS = 6
+IS_TRIGGERED = 7         # mask, result
+PIPE_IN = 8              # block size (0 for the plain pipe), length + payload written
+PIPE_OUT = 9             # block size (0 for the plain pipe), length + payload read
+PIPE_OPS = (PIPE_IN, PIPE_OUT)
+
+Transaction = namedtuple("Transaction", ["op", "time", "addr", "arg", "value", "data"])
+ReplayResult = namedtuple("ReplayResult", ["ops", "pipe_bytes", "elapsed", "recorded", "mismatches"])
+
+
+class TransactionRecorder:
+    """
+    FrontPanel device proxy appending every endpoint operation, with its completion time, to a binary log.
+    Other calls (device management, configuration) are forwarded without being recorded.
+    """
+
+    def __init__(self, device, path):
+        """
+        :param device: FrontPanel-like device to record (`okCFrontPanel` or `SimFrontPanel`).
+        :param path: path of the binary log, overwritten.
+        """
+        self.device = device
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.start = None  # Times are relative to the first recorded operation
+        self.last_us = 0
+        self.ops = 0
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def _record(self, op, addr=0, arg=0, value=0, data=None):
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        now_us = int((now - self.start) * 1e6)
+        self.file.write(RECORD.pack(op, now_us - self.last_us, addr, arg & 0xFFFFFFFF, value & 0xFFFFFFFF))
+        if data is not None:
+            self.file.write(data)
+        self.last_us = now_us
+        self.ops += 1
+
+    def close(self):
+        """Flush and close the log, the device itself stays open."""
+        if not self.file.closed:
+            self.file.close()
+            logging.getLogger('CIM_Process').info('Recorded {} endpoint operations into {}'.format(
+                self.ops, self.path))
+
+    # ------------------------------------------------------------- #
+    #    Recorded endpoint operations
+    # ------------------------------------------------------------- #
+    def SetWireInValue(self, addr, value, mask=0xFFFFFFFF):
+        result = self.device.SetWireInValue(addr, value, mask)
+        self._record(SET_WIRE_IN, addr, mask, value)
+        return result
+
+    def UpdateWireIns(self):
+        result = self.device.UpdateWireIns()
+        self._record(UPDATE_WIRE_INS)
+        return result
+
+    def UpdateWireOuts(self):
+        result = self.device.UpdateWireOuts()
+        self._record(UPDATE_WIRE_OUTS)
+        return result
+
+    def GetWireOutValue(self, addr):
+        value = self.device.GetWireOutValue(addr)
+        self._record(GET_WIRE_OUT, addr, 0, value)
+        return value
+
+    def ActivateTriggerIn(self, addr, bit):
+        result = self.device.ActivateTriggerIn(addr, bit)
+        self._record(ACTIVATE_TRIGGER_IN, addr, bit)
+        return result
+
+    def UpdateTriggerOuts(self):
+        result = self.device.UpdateTriggerOuts()
+        self._record(UPDATE_TRIGGER_OUTS)
+        return result
+
+    def IsTriggered(self, addr, mask):
+        triggered = self.device.IsTriggered(addr, mask)
+        self._record(IS_TRIGGERED, addr, mask, int(bool(triggered)))
+        return triggered
+
+    def WriteToPipeIn(self, addr, data):
+        result = self.device.WriteToPipeIn(addr, data)
+        self._record(PIPE_IN, addr, 0, len(data), data)
+        return result
+
+    def ReadFromPipeOut(self, addr, data):
+        result = self.device.ReadFromPipeOut(addr, data)
+        self._record(PIPE_OUT, addr, 0, len(data), data)
+        return result
+
+    def WriteToBlockPipeIn(self, addr, block_size, data):
+        result = self.device.WriteToBlockPipeIn(addr, block_size, data)
+        self._record(PIPE_IN, addr, block_size, len(data), data)
+        return result
+
+    def ReadFromBlockPipeOut(self, addr, block_size, data):
+        result = self.device.ReadFromBlockPipeOut(addr, block_size, data)
+        self._record(PIPE_OUT, addr, block_size, len(data), data)
+        return result
+
+    def WriteToPipeInThr(self, addr, data):
+        result = self.device.WriteToPipeInThr(addr, data)
+        self._record(PIPE_IN, addr, 0, len(data), data)
+        return result
+
+    def ReadFromPipeOutThr(self, addr, data):
+        result = self.device.ReadFromPipeOutThr(addr, data)
+        self._record(PIPE_OUT, addr, 0, len(data), data)
+        return result
+
+    def WriteToBlockPipeInThr(self, addr, block_size, data):
+        result = self.device.WriteToBlockPipeInThr(addr, block_size, data)
+        self._record(PIPE_IN, addr, block_size, len(data), data)
+        return result
+
+    def ReadFromBlockPipeOutThr(self, addr, block_size, data):
+        result = self.device.ReadFromBlockPipeOutThr(addr, block_size, data)
+        self._record(PIPE_OUT, addr, block_size, len(data), data)
+        return result
+
+
+class TransactionReplay:
+    """Replay engine: re-issue a recorded log as fast as possible, without any host-side processing."""
+
+    def __init__(self, path):
+        """
+        :param path: path of a log written by `TransactionRecorder`.
+        """
+        self.logger = logging.getLogger('CIM_Process')
+        self.path = path
+        self.transactions = self.read(path)
+
+    @classmethod
+    def read(cls, path):
+        """Parse a log into a list of `Transaction`, with `time` in seconds since the start of the recording."""
+        with open(path, "rb") as log:
+            content = log.read()
+        assert content[:len(MAGIC)] == MAGIC, "{} is not a transaction log.".format(path)
+        transactions = []
+        offset, now_us = len(MAGIC), 0
+        while offset < len(content):
+            op, delta_us, addr, arg, value = RECORD.unpack_from(content, offset)
+            offset += RECORD.size
+            now_us += delta_us
+            data = None
+            if op in PIPE_OPS:
+                data = bytearray(content[offset:offset + value])
+                offset += value
+            transactions.append(Transaction(op, now_us * 1e-6, addr, arg, value, data))
+        return transactions
+
+    def events(self):
+        """Flags of the status reads a recorded wait ended on: a wire-out reading a new value, a trigger fired."""
+        last = {}
+        flags = []
+        for trans in self.transactions:
+            if trans.op == GET_WIRE_OUT:
+                flags.append(last.get(trans.addr, trans.value) != trans.value)
+                last[trans.addr] = trans.value
+            else:
+                flags.append(trans.op == IS_TRIGGERED and trans.value == 1)
+        return flags
+
+    def replay(self, device, sync=False, timeout=0.1):
+        """
+        Re-issue every operation of the log on `device` (already opened and configured).
+        Wire-out values, trigger states and pipe-out payloads differing from the recording are counted
+        as mismatches: status polls recorded while waiting replay the same number of times, whatever they read.
+        :param sync: repeat the status reads a recorded wait ended on (see `events`) until they read the
+                     recorded value again, so the device is in the recorded state for the following operations.
+        :param timeout: seconds to repeat such a status read before counting a mismatch.
+        :return: `ReplayResult` with the replay and recording durations in seconds.
+        """
+        mismatches = 0
+        pipe_bytes = 0
+        # Pipe-out buffers and wait flags prepared outside of the timed loop
+        buffers = [bytearray(len(trans.data)) if trans.op == PIPE_OUT else None for trans in self.transactions]
+        events = self.events() if sync else [False] * len(self.transactions)
+        start = time.perf_counter()
+        for trans, buffer, event in zip(self.transactions, buffers, events):
+            op = trans.op
+            if event:
+                self._sync(device, trans, timeout)
+            if op == SET_WIRE_IN:
+                device.SetWireInValue(trans.addr, trans.value, trans.arg)
+            elif op == UPDATE_WIRE_INS:
+                device.UpdateWireIns()
+            elif op == UPDATE_WIRE_OUTS:
+                device.UpdateWireOuts()
+            elif op == GET_WIRE_OUT:
+                mismatches += device.GetWireOutValue(trans.addr) != trans.value
+            elif op == ACTIVATE_TRIGGER_IN:
+                device.ActivateTriggerIn(trans.addr, trans.arg)
+            elif op == UPDATE_TRIGGER_OUTS:
+                device.UpdateTriggerOuts()
+            elif op == IS_TRIGGERED:
+                mismatches += bool(device.IsTriggered(trans.addr, trans.arg)) != bool(trans.value)
+            elif op == PIPE_IN:
+                if trans.arg:
+                    device.WriteToBlockPipeIn(trans.addr, trans.arg, trans.data)
+                else:
+                    device.WriteToPipeIn(trans.addr, trans.data)
+                pipe_bytes += trans.value
+            elif op == PIPE_OUT:
+                if trans.arg:
+                    device.ReadFromBlockPipeOut(trans.addr, trans.arg, buffer)
+                else:
+                    device.ReadFromPipeOut(trans.addr, buffer)
+                mismatches += buffer != trans.data
+                pipe_bytes += trans.value
+        elapsed = time.perf_counter() - start
+        recorded = self.transactions[-1].time if self.transactions else 0.0
+        result = ReplayResult(len(self.transactions), pipe_bytes, elapsed, recorded, mismatches)
+        self.logger.info('Replayed {} operations ({} pipe bytes) of {} in {:.3f} ms, recorded in {:.3f} ms, '
+                         '{} mismatches'.format(result.ops, result.pipe_bytes, self.path, result.elapsed * 1e3,
+                                                result.recorded * 1e3, result.mismatches))
+        return result
+
+    @classmethod
+    def _sync(cls, device, trans, timeout):
+        """Poll the status read by `trans` until it holds the recorded value, or `timeout` seconds."""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if trans.op == GET_WIRE_OUT:
+                device.UpdateWireOuts()
+                if device.GetWireOutValue(trans.addr) == trans.value:
+                    return
+            else:
+                device.UpdateTriggerOuts()
+                if device.IsTriggered(trans.addr, trans.arg):
+                    return
@@ -4,34 +4,75 @@
 import time
 import logging
 import numpy as np
+from fpga_host.chip_shadow import ChipShadow
 from fpga_host.data_gen import DataGen
+from fpga_host.fifo_program import FifoProgram
 from fpga_host.logger import setup_logger
+from fpga_host.stream_cache import StreamCache
+from fpga_host.theory_tracker import TheoryTracker
+from fpga_host.wait_policy import EwmaPolicy
 class TransData:
-    def __init__(self, fpga_tester):
+    MAC_TRIGGER_TIMEOUT = 0.01  # Seconds without MAC_DONE trigger before checking STA_CHIP instead
+    # Measured offset of each output column, from [0] to [63]
+    OFFSET_DATA = (14, 30, 0, 0, 14, -8, 14, 0, 0, 0, -8, -14, 0, -24, 0, -34, -14,
+                   -14, 14, 2, -4, -36, 0, -22, -14, -2, 0, 2, 0, -6, 8, -10, 14, 0,
+                   -2, -14, 0, 0, 0, 0, 0, -6, 14, 0, 0, -12, 0, 0, 6, -12, 0, 0, 0,
+                   2, 14, 42, 0, -12, 0, 30, -12, -12, 0, 0)
+    OFFSET_ARRAY = np.array(OFFSET_DATA, dtype=np.int16)
+    DECODE_WEIGHTS = 1 << np.arange(8, -1, -1, dtype=np.int16)  # Place values of the 9 magnitude bits
+    READBACK_SLOTS = 2          # Readback buffers per size, a returned view stays valid until the next-but-one read
+    FIFO_DEPTH = 2048           # 32-bit words of FIFOA and FIFOB (FIFO_IN/FIFO_OUT cores of fpga_control)
+    OUTPUT_WORDS = 80           # FIFOB words of one MAC output: 40 reads of 2 words
+
+    def __init__(self, fpga_tester, wait_policy=None, weight_cache_bytes=4 << 20):
+        """
+        :param fpga_tester: `FPGATester` driving the board.
+        :param wait_policy: `WaitPolicy` shared by all wait loops (`EwmaPolicy` by default).
+        :param weight_cache_bytes: memory cap of the cache of encoded weight streams, 0 disables it.
+        """
         self.fpga_tester = fpga_tester
         self.logger = logging.getLogger('CIM_Process')
+        self.wait_policy = EwmaPolicy() if wait_policy is None else wait_policy  # Shared by all wait loops
+        self.mac_trigger = None      # MAC_DONE trigger-out provided by bitstream: None (unknown), True or False
+        self.mac_trigger_stale = False  # MAC_DONE fired by fused or batched cycles, not consumed yet
+        self.mac_latency = 0.0       # Observed MAC completion latency of the last cycle (seconds)
+        self._readback = {}          # Preallocated FIFOB readback buffers: {size: [next slot, buffers]}
+        self.weight_cache = StreamCache(weight_cache_bytes, "weights")  # Encoded weight streams by content
+        self._theory_weights = None  # (weights, +1/-1 matrix) of the last theory computation
+        self.theory_tracker = None   # `TheoryTracker` of the weights of the last `output_theory`
+        self._theory_tracker_key = None
+        self.shadow = ChipShadow()   # Chip registers known to the host, to drop no-op writes
+        self.fifoa_bytes = 0         # Bytes piped into FIFOA so far
+        self.offsets = self.OFFSET_ARRAY  # Column offsets subtracted by the decoder (see `load_offsets`)
+        # Status clearing sequences, the W1C flags patched in place for every call: a single write,
+        # and the historical double write kept for forced clears
+        self._clear_status = FifoProgram().write(0x00, 0x0003, slot="flags")
+        self._clear_status_twice = FifoProgram().write(0x00, 0x0003, slot="flags").write(0x00, 0x0003, slot="flags_again")
     # ----------------------------------------------------#  
     # Reset FPGA Host and logic
     # ----------------------------------------------------#  
     def reset_host(self):
         """Call the functions to do reset and do the configuration."""
-        self.fpga_tester.reset()
-        self.fpga_tester.config_spimaster()
-        self.fpga_tester.itf_selection(1)        # 0 means select I2C and 1 means SPI
-        self.fpga_tester.led_cntl(0x3E)          # LED Mask is 3E
-        self.fpga_tester.fifob_fullthresh(0x50)  # Threshold is 80: 80(depth)x32 = 320x8 = 320 byte
-        self.fpga_tester.fifob_empty()           # Check if FIFOB is empty
-        self.fpga_tester.sta_chip()              # Check the status of chip: weight writing and MAC
+        with self.fpga_tester.stats.scope("reset_host"):
+            with self.fpga_tester.wire_in_batch():
+                self.fpga_tester.reset()
+                self.fpga_tester.config_spimaster()
+                self.fpga_tester.itf_selection(1)        # 0 means select I2C and 1 means SPI
+                self.fpga_tester.led_cntl(0x3E)          # LED Mask is 3E
+                self.fpga_tester.fifob_fullthresh(0x50)  # Threshold is 80: 80(depth)x32 = 320x8 = 320 byte
+            # Check if FIFOB is empty and the status of chip (weight writing and MAC) in one update
+            return self.fpga_tester.snapshot_wire_outs()
 
     def update_wires(self):
         """Update signals"""
         self.fpga_tester.fifob_fullthresh(0x50) 
-        self.fpga_tester.fifob_empty()           
-        self.fpga_tester.sta_chip()
+        return self.fpga_tester.snapshot_wire_outs()
         
     def reset_chip(self):
         """Reset the chip"""
-        self.fpga_tester.chip_reset()
+        with self.fpga_tester.wire_in_batch():
+            self.fpga_tester.chip_reset()
+        self.shadow.reset()
         
     # ----------------------------------------------------#
     # Indirect write and read of ONE inner register
@@ -48,13 +89,32 @@ class TransData:
         r_pattern_16byte = DataGen.indir_read(ind_addr)
         w_pattern.extend(r_pattern_16byte)
 
-    def pipe_data_in(self, data_to_fifoa):
+    def pipe_data_in(self, data_to_fifoa, wait=True):
+        """Pipe raw data into FIFOA, with `wait=False` queue it on the USB worker and return its future.
+        The indirect writes it holds are applied to the shadow, none is elided"""
+        self.shadow.observe(data_to_fifoa)
+        return self._pipe(data_to_fifoa, wait)
+
+    def _pipe(self, data_to_fifoa, wait=True):
+        """Pipe data into FIFOA, the caller keeps the shadow up to date"""
+        self.fifoa_bytes += len(data_to_fifoa)
+        if not wait:
+            return self.fpga_tester.submit_fifo_write(data_to_fifoa)
         self.fpga_tester.fifo_write(data_to_fifoa)
 
+    def readback_buffer(self, size):
+        """Reusable buffer of `size` bytes for the pipe out, rotating over READBACK_SLOTS buffers per size"""
+        if size not in self._readback:
+            self._readback[size] = [0, [bytearray(size) for _ in range(self.READBACK_SLOTS)]]
+        entry = self._readback[size]
+        slot, buffers = entry
+        entry[0] = (slot + 1) % self.READBACK_SLOTS
+        return buffers[slot]
+
     def pipe_data_out(self, num:int):
-        dataout = bytearray(num*8) # 2x32bit/8 = 8 byte
-        while self.fpga_tester.fifob_empty():
-            time.sleep(0.1)
+        dataout = self.readback_buffer(num*8) # 2x32bit/8 = 8 byte
+        self.wait_policy.wait('fifob_data',
+                              lambda: not self.fpga_tester.fifob_empty(self.fpga_tester.snapshot_wire_outs()))
         self.fpga_tester.fifo_read(dataout)
         # print(dataout)
         # Every 8 byte, there is a 2-byte data
@@ -64,28 +124,68 @@ class TransData:
     # ----------------------------------------------------#
     # Data transmission for MAC operation
     # ----------------------------------------------------#
-    def write_weights(self, weights:bytearray):
-        """"Input: 4096-bit, 1-bit/w, in Bytearray type (one iterm stores 8 weights)"""
+    def write_weights(self, weights:bytearray, wait=True, force=False):
+        """"Input: 4096-bit, 1-bit/w, in Bytearray type (one iterm stores 8 weights)
+        Skipped (None returned) when the same weights are loaded and sta_wei is still set, unless `force`"""
+        key = StreamCache.digest(weights)
+        if not force and self.shadow.weights_loaded(key):
+            self.shadow.elide(len(weights) * 8)
+            self.logger.warning('Weights already loaded in chip, not sent again')
+            return None
         self.logger.warning('Start Sending 4096 bit weight data to chip...')
-        all_weights = bytearray(0)
-        for i in range(0, 512, 2):
-            weights_2byte = int.from_bytes(weights[i:i+2], "big")
-            self.wdata_fifoa_append(0x30, weights_2byte, all_weights)
-        self.pipe_data_in(all_weights)
+        # 256 indirect writes of 2 bytes, encoded only the first time these weights are seen
+        all_weights = self.weight_cache.get(key, weights, lambda data: DataGen.indir_write_stream(0x30, data))
+        self.shadow.load_weights(key)
+        return self._pipe(all_weights, wait)
 
-    def write_activations(self, activations:bytearray):
+    def write_activations(self, activations:bytearray, wait=True):
         """Input: 256-bit, 4-bit/act, in Bytearray type (one iterm stores 2 activations)"""
         self.logger.warning('Start Sending 256 bit activation data to chip...')
-        all_acts = bytearray(0)
-        for j in range(0, 32, 2):
-            act_2bytes =int.from_bytes(activations[j:j+2], "big")
-            self.wdata_fifoa_append(0x34, act_2bytes, all_acts)
-        self.pipe_data_in(all_acts)
+        all_acts = DataGen.indir_write_stream(0x34, activations)  # 16 indirect writes of 2 bytes
+        self.shadow.load_activations()
+        return self._pipe(all_acts, wait)
+
+    def write_fused(self, activations:bytearray, weights:bytearray, wait=True, force=False):
+        """Fused MAC cycle: the weights (when not already loaded, see `write_weights`), the activations and
+        the 40 output reads in ONE FIFOA payload, drained afterwards by `read_640b_out`.
+        The FPGA executes the FIFOA words in order: the output reads follow the last activation write, the
+        MAC completing within the SPI accesses of the first read. No status polling in between."""
+        parts = []
+        if len(weights) != 0:
+            key = StreamCache.digest(weights)
+            if not force and self.shadow.weights_loaded(key):
+                self.shadow.elide(len(weights) * 8)
+            else:
+                parts.append(self.weight_cache.get(key, weights, lambda data: DataGen.indir_write_stream(0x30, data)))
+                self.shadow.load_weights(key)
+        parts.append(DataGen.indir_write_stream(0x34, activations))
+        self.shadow.load_activations()
+        parts.append(self._fetch_output_program().data)
+        return self._pipe(bytearray().join(parts), wait)
     
     def mac_assert_finish(self):
-        while not self.fpga_tester.sta_chip() == 3:
-            time.sleep(0.0000001)
-        self.logger.warning('MAC assert finish')
+        """Wait for the MAC_DONE trigger, or poll STA_CHIP when the bitstream does not provide it"""
+        start = time.perf_counter()
+        if not (self.mac_trigger and self.wait_mac_trigger(start)):
+            self.wait_policy.wait('mac', lambda: self.fpga_tester.sta_chip(self.fpga_tester.snapshot_wire_outs()) == 3,
+                                  start=start)
+            if self.mac_trigger is None:
+                self.check_mac_trigger()
+            elif self.mac_trigger:
+                self.fpga_tester.mac_done()   # Consume the trigger firing after the timeout
+        self.mac_latency = time.perf_counter() - start
+        self.logger.warning('MAC assert finish after {:.1f} us'.format(self.mac_latency * 1e6))
+
+    def wait_mac_trigger(self, start):
+        """Wait for the MAC_DONE trigger-out, return False if it did not fire within MAC_TRIGGER_TIMEOUT"""
+        return self.wait_policy.wait('mac', self.fpga_tester.mac_done, timeout=self.MAC_TRIGGER_TIMEOUT, start=start)
+
+    def check_mac_trigger(self):
+        """After the first MAC finished on STA_CHIP, find out once if the bitstream provides the MAC_DONE trigger:
+        the trigger has fired by then if it exists, no timeout is spent on a missing endpoint"""
+        self.mac_trigger = bool(self.fpga_tester.mac_done())
+        if not self.mac_trigger:
+            self.logger.warning('MAC_DONE trigger not provided by the bitstream, polling STA_CHIP instead')
     # ----------------------------------------------------#
     # Output: 640 bit = 80 byte
     # Read out 1 byte from FIFOB: 32 bit contains 1 byte data
@@ -93,70 +193,240 @@ class TransData:
     # That is: 80 depth of data from FIFOB
     # ----------------------------------------------------#
     def get_640b_out(self):
+        """Return the 80 output bytes as a strided memoryview on the readback buffer filled in place (no copy),
+        valid until the buffer is reused (see READBACK_SLOTS)"""
         self.fetch_output()
-        outputdata = bytearray(0)
-        while self.fpga_tester.fifob_progfull() == False:
-            time.sleep(0.0000001)
-        data_received = bytearray(320)
+        return self.read_640b_out()
+
+    def read_640b_out(self):
+        """Drain the 80 output words requested by `fetch_output` or `write_fused` once FIFOB holds them all,
+        returned as in `get_640b_out`"""
+        self.wait_policy.wait('fifob_full', lambda: self.fpga_tester.fifob_progfull(self.fpga_tester.snapshot_wire_outs()))
+        data_received = self.readback_buffer(320)
         self.fpga_tester.fifo_read(data_received)
-        for i in range(0, 320, 4):
-            outputdata.append(data_received[i])
-        # print(outputdata)
+        # Every 32-bit FIFOB word holds one output byte in [7:0]
+        outputdata = memoryview(data_received)[::4]
+        # print(outputdata.tobytes())
         return outputdata
         
     def fetch_output(self):
-        askdata = bytearray(0)
-        for _ in range(40): # Read address of the 16-bit data for 40 times
-            self.rdata_fifob_append(0x38, askdata)
-        self.pipe_data_in(askdata)
+        self._pipe(self._fetch_output_program().data)
+
+    @classmethod
+    def _fetch_output_program(cls):
+        """Interned program reading the address of the 16-bit output data 40 times (the 80 output bytes),
+        shared by `fetch_output`, `write_fused` and `mac_batch`"""
+        return FifoProgram.constant("fetch_output", lambda: FifoProgram().read(0x38, 40))
+
+    # ----------------------------------------------------#
+    # One MAC cycle, shared by `FpgaFunc` and the device pool workers
+    # ----------------------------------------------------#
+    def mac_cycle(self, activations:bytearray, weights:bytearray, fused=False, host_work=None):
+        """
+        Board side of one MAC cycle: weights (when not empty), activations, MAC completion and output read.
+        :param activations: activations as sent to the chip (see `DataGen.act_encode`).
+        :param fused: send everything in one pipe write and drain the outputs by one pipe read (`write_fused`).
+        :param host_work: optional callable (e.g. theory computation) run while the pipe transfers are in
+                          flight, its result is returned.
+        :return: (output bytes as returned by `get_640b_out`, host_work result).
+        """
+        self.update_wires()
+        if fused:
+            # Weights (when new), activations and output fetch in one pipe write, drained by one pipe read
+            self.write_fused(activations, weights, wait=False)
+            result = host_work() if host_work is not None else None
+            outdata = self.read_640b_out()
+            self.mac_trigger_stale = self.mac_trigger_stale or bool(self.mac_trigger)
+        else:
+            if self.mac_trigger_stale:
+                self.fpga_tester.mac_done()  # Consume the MAC_DONE triggers no wait has seen, before a new MAC
+                self.mac_trigger_stale = False
+            if len(weights) != 0:
+                self.write_weights(weights, wait=False)   # Write weights only when new weight data is avaliable
+            self.write_activations(activations, wait=False)
+            result = host_work() if host_work is not None else None
+            self.mac_assert_finish()
+            outdata = self.get_640b_out()
+        return outdata, result
+
+    def decode_cycle(self, data, scale_factor=None):
+        """Outputs of one MAC cycle as a list from [0] to [63], divided by the scaling factor of scaled
+        activations (see `DataGen.act_encode`)"""
+        outputs = self.decode_batch(data)[0].tolist()
+        if scale_factor is not None:
+            outputs = [output / scale_factor for output in outputs]
+        return outputs
+
+    def clear_act_reg(self):
+        """Clear the activation flag after a MAC cycle"""
+        with self.fpga_tester.stats.scope("clear_act_reg"):
+            self.reset_host()
+            self.clear_status(0x0001)     # Clear status of Activation ready
+
+    # ----------------------------------------------------#
+    # Batched MAC: K outputs accumulated in FIFOB, one drain
+    # ----------------------------------------------------#
+    @classmethod
+    def batch_size(cls):
+        """Largest number of MAC outputs FIFOB holds at once (25)"""
+        return cls.FIFO_DEPTH // cls.OUTPUT_WORDS
+
+    def mac_batch(self, activations_list:list, weights:bytearray=None, host_work=None):
+        """
+        Run up to `batch_size()` MAC cycles back to back: every activation vector is followed by its 40 output
+        reads and the clearing of sta_act, FIFOB prog-full threshold set to K x 80 words, all K outputs
+        drained by one pipe read.
+        FIFOA (plain pipe, no flow control) cannot hold K vectors: it is written by chunks of half its depth,
+        a chunk waiting, on the FIFOB threshold, for the earlier vectors whose words must leave FIFOA first.
+        :param activations_list: K activation vectors, already compensated (`DataGen.act_pulsecompen`).
+        :param weights: written before the first vector when given and not empty (see `write_weights`).
+        :param host_work: optional callable run while the last vectors are processed, its result is returned.
+        :return: (strided memoryview of the K x 80 output bytes, vector i at [80*i:80*(i+1)], host_work result),
+                 valid as the view of `get_640b_out`.
+        """
+        weights = bytearray() if weights is None else weights
+        count = len(activations_list)
+        assert 0 < count <= self.batch_size(), "A batch holds 1 to {} vectors.".format(self.batch_size())
+        # Per vector: 16 activation writes, 40 output reads, STATUS clear of sta_act
+        fetch = self._fetch_output_program().data
+        clear = FifoProgram.constant("clear_act", lambda: FifoProgram().write(0x00, 0x0001)).data
+        acts = DataGen.indir_write_batch(0x34, activations_list)
+        stream = np.empty((count, acts.shape[1] + len(fetch) + len(clear)), dtype=np.uint8)
+        stream[:, :acts.shape[1]] = acts
+        stream[:, acts.shape[1]:-len(clear)] = np.frombuffer(fetch, dtype=np.uint8)
+        stream[:, -len(clear):] = np.frombuffer(clear, dtype=np.uint8)
+        vector_words = stream.shape[1] // 4
+        chunk = max(1, self.FIFO_DEPTH // 2 // vector_words)
+        # FIFOA words piped so far: once n outputs are in FIFOB, the words up to the output reads of vector n
+        # (weights included) have left FIFOA
+        piped = self.fifoa_bytes
+        if len(weights) != 0:
+            self.write_weights(weights)
+        written = (self.fifoa_bytes - piped) // 4  # Nothing when the shadow elided the weights
+        weight_words, clear_words = written, len(clear) // 4
+        result = None
+        for begin in range(0, count, chunk):
+            end = min(begin + chunk, count)
+            words = (end - begin) * vector_words
+            overflow = written + words - self.FIFO_DEPTH
+            if overflow > 0:
+                # Vectors to complete before this chunk fits
+                done = max(1, -(-(overflow - weight_words + clear_words) // vector_words))
+                self.fpga_tester.fifob_fullthresh(done * self.OUTPUT_WORDS)
+                self.wait_policy.wait('fifob_batch',
+                                      lambda: self.fpga_tester.fifob_progfull(self.fpga_tester.snapshot_wire_outs()))
+            self._pipe(bytearray(stream[begin:end]))
+            for _ in range(begin, end):
+                self.shadow.load_activations()
+                self.shadow.write(0x00, 0x0001)
+            written += words
+        self.fpga_tester.fifob_fullthresh(count * self.OUTPUT_WORDS)
+        if host_work is not None:
+            result = host_work()
+        self.wait_policy.wait('fifob_full', lambda: self.fpga_tester.fifob_progfull(self.fpga_tester.snapshot_wire_outs()))
+        data_received = self.readback_buffer(count * self.OUTPUT_WORDS * 4)
+        self.fpga_tester.fifo_read(data_received)
+        self.fpga_tester.fifob_fullthresh(self.OUTPUT_WORDS)
+        self.mac_trigger_stale = self.mac_trigger_stale or bool(self.mac_trigger)  # Consumed by the next `mac_cycle`
+        return memoryview(data_received)[::4], result
+
+    def clear_status(self, flags:int, force=False):
+        """Clear the chip status bits `flags` (bit0 sta_act, bit1 sta_wei) of the W1C STATUS register.
+        Nothing is sent when the shadow knows these bits are clear, `force` writes them twice regardless"""
+        if force:
+            self._clear_status_twice.patch("flags", flags).patch("flags_again", flags)
+            self.shadow.write(0x00, flags)
+            self._pipe(self._clear_status_twice.data)
+        elif self.shadow.redundant(0x00, flags):
+            self.shadow.elide()
+        else:
+            self._clear_status.patch("flags", flags)
+            self.shadow.write(0x00, flags)
+            self._pipe(self._clear_status.data)
+
+    def write_regs(self, writes, force=False):
+        """Indirect writes of the (address, 16-bit data) pairs `writes` in one pipe, in order.
+        Writes the shadow proves to be no-ops are dropped, unless `force`"""
+        program = FifoProgram()
+        for ind_addr, ind_data in writes:
+            if not force and self.shadow.redundant(ind_addr, ind_data):
+                self.shadow.elide()
+                continue
+            program.write(ind_addr, ind_data)
+            self.shadow.write(ind_addr, ind_data)
+        if len(program):
+            self._pipe(program.data)
 
     # ----------------------------------------------------#
     #    Functions: pre-processing and post processing    #
     # ----------------------------------------------------#
-    def decode_out(self, data: bytearray, decode_data:list):
-        """Decode CIM output bytearray into raw data list."""
-        NUMS = 64
-        BITS = 10
+    def decode_out(self, data, decode_data:list):
+        """Decode CIM output bytes (bytearray or the memoryview of `get_640b_out`) into raw data list."""
         decode_data.clear()
-        for i in range(NUMS):  # Decode i-th number
-            int_data, negative = 0, False
-            for j in range(BITS):  # Decode j-th bit
-                bit_loc = j * NUMS + i
-                byte_idx, byte_offset = int(bit_loc // 8), 7 - int(bit_loc % 8)
-                bit = (data[byte_idx] >> byte_offset) & 1
-                if j == 0:  # MSB: sign bit
-                    negative = bit == 1
-                # elif j in [1,2,3]:   ## Skip 3 MSB if output is 7 bit (1 means 9, 2 means 8, 3 means 7)
-                #     continue
-                else:
-                    # negate bit when positive
-                    int_data = int_data * 2 - bit if negative else int_data * 2 + (1^bit)
-                if j == BITS - 1:
-                    int_data *= 2               # Double decoding data in custom format
-            decode_data.append(int_data) 
-        decode_data.reverse()                   # From [0] to [63]
-        # Substract by offset
-        offset_data = [14, 30, 0, 0, 14, -8, 14, 0, 0, 0, -8, -14, 0, -24, 0, -34, -14, 
-                       -14, 14, 2, -4, -36, 0, -22, -14, -2, 0, 2, 0, -6, 8, -10, 14, 0, 
-                       -2, -14, 0, 0, 0, 0, 0, -6, 14, 0, 0, -12, 0, 0, 6, -12, 0, 0, 0, 
-                       2, 14, 42, 0, -12, 0, 30, -12, -12, 0, 0]
-        for i in range(64):
-            decode_data[i] -= offset_data[i]
+        decode_data.extend(self.decode_batch(data)[0].tolist())
         return None 
+
+    def decode_batch(self, data):
+        """
+        Decode N raw outputs at once (see `decode_raw`), the column offsets subtracted.
+        :return: (N, 64) int16 array from [0] to [63].
+        """
+        return self.decode_raw(data) - self.offsets
+
+    @classmethod
+    def decode_raw(cls, data):
+        """
+        Decode N raw outputs at once: 64 numbers x 10 bit-planes of 64 bits, bit plane j of number i at bit
+        j*64+i (MSB first in every byte). Plane 0 is the sign, 1 for negative numbers, whose 9 magnitude bits
+        are plain, while those of positive numbers are inverted. The LSB weighs 2 (custom format).
+        :param data: N x 80 output bytes, as a bytes-like object (e.g. the memoryviews of `get_640b_out` or
+                     `mac_batch`) or an (N, 80) uint8 array.
+        :return: (N, 64) int16 array from [0] to [63], without offset compensation.
+        """
+        raw = np.asarray(data, dtype=np.uint8).reshape(-1, 80)
+        planes = np.unpackbits(raw, axis=1).reshape(-1, 10, 64)
+        magnitude = np.tensordot(cls.DECODE_WEIGHTS, planes[:, 1:, :], axes=([0], [1]))  # (N, 64)
+        decoded = np.where(planes[:, 0, :] == 1, -magnitude, 511 - magnitude) * 2
+        return decoded[:, ::-1].astype(np.int16)  # From [0] to [63]
+
+    def load_offsets(self, offsets=None):
+        """Column offsets of the decoder, 64 values from [0] to [63] (e.g. `CalibrationTable.lookup`),
+        the built-in OFFSET_DATA if None"""
+        if offsets is None:
+            self.offsets = self.OFFSET_ARRAY
+            return
+        assert len(offsets) == len(self.OFFSET_DATA), "invalid inputs"
+        self.offsets = np.array(offsets, dtype=np.int16)
     # ----------------------------------------------------#
     def output_theory(self, activations: bytearray, weights: bytearray):
-        weight_binary =  [self.access_bit(weights,i) for i in range(len(weights)*8)] # i starts from left to right
-        for j in range(len(weight_binary)):
-            if weight_binary[j] == 0:
-                weight_binary[j] = -1  # 0 representing -1 weight 
-        weight_cal_a = np.array(weight_binary)
-        weight_cal=np.reshape(weight_cal_a, (64,64))  # 64 by 64 weight array
-        activation_int = [self.access_halfbyte(activations,i) for i in range(0, len(activations)*8, 4)]
-        activation_cal = np.array(activation_int)
-        output_theory = np.dot(weight_cal.T, activation_cal)
-        output_theory_list = list(output_theory)
-        output_theory_list.reverse()   # From [0] to [63]
-        return output_theory_list
+        """Theory outputs of one MAC cycle, as a list from [0] to [63] (see `theory_batch`).
+        Updated incrementally from the previous call with the same weights (see `TheoryTracker`)"""
+        key = bytes(weights)
+        if self.theory_tracker is None or self._theory_tracker_key != key:
+            self.theory_tracker = TheoryTracker(self.theory_weights(weights))
+            self._theory_tracker_key = key
+        return list(self.theory_tracker.update(activations))
+
+    def theory_batch(self, activations_list, weights: bytearray):
+        """
+        Theory outputs of N MAC cycles with the same weights in one matrix product.
+        :param activations_list: N activation vectors of 32 bytes (2 activations per byte, high nibble first),
+                                 as a sequence of bytes-like vectors or an (N, 32) uint8 array.
+        :param weights: 512 bytes, 1 bit per weight from left to right, 0 representing -1.
+        :return: (N, 64) int64 array, row i the outputs of cycle i from [0] to [63].
+        """
+        activation_cal = DataGen.unpack_nibbles(activations_list)
+        # Exact in float32 (|output| <= 64 x 15), where the product runs on BLAS
+        output_theory = np.dot(activation_cal.astype(np.float32), self.theory_weights(weights).astype(np.float32))
+        return output_theory[:, ::-1].astype(np.int64)   # From [0] to [63]
+
+    def theory_weights(self, weights: bytearray):
+        """64 by 64 weight array of +1/-1 (int8), unpacked only when the weights change"""
+        key = bytes(weights)
+        if self._theory_weights is None or self._theory_weights[0] != key:
+            weight_binary = np.unpackbits(np.frombuffer(key, dtype=np.uint8)).reshape(64, 64)  # Left to right
+            self._theory_weights = (key, weight_binary.astype(np.int8) * 2 - 1)               # 0 representing -1
+        return self._theory_weights[1]
 
     def access_bit(self, data, num):
         """Access bit in bytes, for each byte, from left to right
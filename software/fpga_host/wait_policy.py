@@ -0,0 +1,137 @@
+"""
+This module exports the polling policies shared by the wait loops on FPGA status (MAC done, FIFOB fill).
+"""
+
+import logging
+import math
+import time
+
+
+class WaitStats:
+    """Statistics of one named wait: completion time and number of polls."""
+
+    def __init__(self, alpha):
+        self.alpha = alpha    # Weight of the newest sample in the EWMA
+        self.count = 0
+        self.polls = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.last = 0.0
+        self.ewma = None      # Exponentially weighted moving average of the completion time
+
+    def record(self, elapsed, polls):
+        self.count += 1
+        self.polls += polls
+        self.total += elapsed
+        self.min = min(self.min, elapsed)
+        self.max = max(self.max, elapsed)
+        self.last = elapsed
+        self.ewma = elapsed if self.ewma is None else self.alpha * elapsed + (1 - self.alpha) * self.ewma
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class WaitPolicy:
+    """
+    Base policy polling a condition until it holds, sleeping `next_delay` seconds between two polls.
+    Subclasses only decide the delays, statistics are kept per wait name.
+    """
+
+    def __init__(self, alpha=0.2):
+        self.logger = logging.getLogger('CIM_Process')
+        self.alpha = alpha
+        self.stats = {}
+
+    def get_stats(self, name):
+        if name not in self.stats:
+            self.stats[name] = WaitStats(self.alpha)
+        return self.stats[name]
+
+    def first_delay(self, stats):
+        """Seconds after the start of the wait to sleep until before the first poll."""
+        return 0.0
+
+    def next_delay(self, stats, polls):
+        """Seconds to sleep after `polls` unsuccessful polls."""
+        return 0.0
+
+    def wait(self, name, ready, timeout=None, start=None):
+        """
+        Poll `ready()` until it returns True.
+        :param name: name of the wait, statistics are kept per name.
+        :param ready: callable returning True when the awaited event happened.
+        :param timeout: optional timeout in seconds.
+        :param start: optional `time.perf_counter()` value the wait (and its timeout) started at.
+        :return: True when the event happened, False on timeout (not recorded in the statistics).
+        """
+        start = time.perf_counter() if start is None else start
+        stats = self.get_stats(name)
+        delay = self.first_delay(stats) - (time.perf_counter() - start)
+        polls = 0
+        while True:
+            if delay > 0:
+                time.sleep(delay)
+            polls += 1
+            if ready():
+                break
+            if timeout is not None and time.perf_counter() - start >= timeout:
+                return False
+            delay = self.next_delay(stats, polls)
+        self.learn(stats, time.perf_counter() - start, polls)
+        return True
+
+    def learn(self, stats, elapsed, polls):
+        """Update the statistics with a completed wait."""
+        stats.record(elapsed, polls)
+
+    def log_stats(self):
+        """Log the statistics of every wait."""
+        for name, stats in sorted(self.stats.items()):
+            self.logger.info('Wait {}: {} times, mean {:.1f} us, min {:.1f} us, max {:.1f} us, {:.1f} polls/wait'.format(
+                name, stats.count, stats.mean() * 1e6, stats.min * 1e6, stats.max * 1e6,
+                stats.polls / stats.count if stats.count else 0.0))
+
+
+class SpinPolicy(WaitPolicy):
+    """Poll again immediately: lowest latency, one USB transaction per poll."""
+
+
+class BackoffPolicy(WaitPolicy):
+    """Exponential backoff between polls, from `initial` seconds multiplied by `factor` up to `cap` seconds."""
+
+    def __init__(self, initial=20e-6, factor=2.0, cap=1e-3, alpha=0.2):
+        super().__init__(alpha)
+        self.initial = initial
+        self.factor = factor
+        self.cap = cap
+        # Polls after which the delay stays at `cap`: the exponent is clamped there, as
+        # factor ** (polls - 1) overflows a float after ~1000 polls
+        self.cap_polls = int(math.ceil(math.log(cap / initial, factor))) if factor > 1 and cap > initial else 0
+
+    def next_delay(self, stats, polls):
+        return min(self.initial * self.factor ** min(polls - 1, self.cap_polls), self.cap)
+
+
+class EwmaPolicy(BackoffPolicy):
+    """
+    Sleep until a `margin` fraction of the EWMA-predicted completion time before the first poll,
+    then fall back to exponential backoff. Learns the typical MAC and FIFOB fill time of every wait.
+    """
+
+    def __init__(self, margin=0.8, initial=20e-6, factor=2.0, cap=1e-3, alpha=0.2):
+        super().__init__(initial, factor, cap, alpha)
+        self.margin = margin
+
+    def first_delay(self, stats):
+        return self.margin * stats.ewma if stats.ewma is not None else 0.0
+
+    def learn(self, stats, elapsed, polls):
+        predicted = stats.ewma is not None
+        stats.record(elapsed, polls)
+        if predicted and polls == 1:  # Ready at the first poll: slept past the event, the prediction is too long
+            stats.ewma *= 0.5
+
+
+POLICIES = {"spin": SpinPolicy, "backoff": BackoffPolicy, "ewma": EwmaPolicy}
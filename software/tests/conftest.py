@@ -0,0 +1,8 @@
+"""
+Shared setup of the tests: the host modules are imported as `fpga_host.*`, from the `software` directory.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
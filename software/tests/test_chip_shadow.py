@@ -0,0 +1,81 @@
+"""
+Tests of the chip register shadow: which indirect writes it proves to be no-ops.
+"""
+
+import unittest
+
+from fpga_host.chip_shadow import ChipShadow
+from fpga_host.data_gen import DataGen
+
+
+class TestChipShadow(unittest.TestCase):
+
+    def setUp(self):
+        self.shadow = ChipShadow()
+        self.shadow.reset()
+
+    def test_unknown_before_reset(self):
+        shadow = ChipShadow()
+        self.assertFalse(shadow.redundant(ChipShadow.CONFIG_R, 0x0090))
+        self.assertFalse(shadow.redundant(ChipShadow.STATUS, 0x0003))
+        shadow.load_weights(b"key")
+        self.assertFalse(shadow.weights_loaded(b"key"))  # loadw_vld unknown
+
+    def test_rw_registers(self):
+        self.assertTrue(self.shadow.redundant(ChipShadow.CONFIG_R, 0x0090))        # Reset value
+        self.assertTrue(self.shadow.redundant(ChipShadow.CONFIG_R, 0x8090))        # Read-only bit
+        self.assertFalse(self.shadow.redundant(ChipShadow.CONFIG_R, 0x0091))
+        self.shadow.write(ChipShadow.CONFIG_R, 0x0091)
+        self.assertTrue(self.shadow.redundant(ChipShadow.CONFIG_R, 0x0091))
+
+    def test_status_clear(self):
+        self.assertTrue(self.shadow.redundant(ChipShadow.STATUS, 0x0003))
+        self.shadow.write(ChipShadow.ACTIVATION, 0x1234)
+        self.assertFalse(self.shadow.redundant(ChipShadow.STATUS, 0x0001))
+        self.assertTrue(self.shadow.redundant(ChipShadow.STATUS, 0x0002))
+        self.shadow.write(ChipShadow.STATUS, 0x0001)
+        self.assertTrue(self.shadow.redundant(ChipShadow.STATUS, 0x0003))
+
+    def test_never_redundant(self):
+        for addr in (ChipShadow.WEIGHT, ChipShadow.ACTIVATION, 0x3C):
+            self.assertFalse(self.shadow.redundant(addr, 0))
+
+    def test_enables_keep_the_next_status_clear(self):
+        # `FpgaFunc.access_reg`: the STATUS clear after enabling the loads must be sent
+        self.assertTrue(self.shadow.redundant(ChipShadow.STATUS, 0x0003))
+        self.shadow.write(ChipShadow.CTRL_IN, 0x0003)
+        self.assertFalse(self.shadow.redundant(ChipShadow.STATUS, 0x0003))
+        self.shadow.write(ChipShadow.STATUS, 0x0003)
+        self.shadow.write(ChipShadow.CTRL_TEST, 0x0000)
+        self.assertFalse(self.shadow.redundant(ChipShadow.STATUS, 0x0003))
+
+    def test_load_weights(self):
+        self.shadow.load_weights(b"key")
+        self.assertFalse(self.shadow.weights_loaded(b"key"))  # loadw_vld low after reset
+        self.shadow.write(ChipShadow.CTRL_IN, 0x0003)
+        self.shadow.load_weights(b"key")
+        self.assertTrue(self.shadow.weights_loaded(b"key"))
+        self.assertFalse(self.shadow.weights_loaded(b"other"))
+        self.assertFalse(self.shadow.weights_loaded(None))
+        self.assertFalse(self.shadow.redundant(ChipShadow.STATUS, 0x0002))
+        self.shadow.load_activations()
+        self.assertTrue(self.shadow.weights_loaded(b"key"))
+
+    def test_weights_forgotten(self):
+        self.shadow.write(ChipShadow.CTRL_IN, 0x0003)
+        for addr, data in ((ChipShadow.STATUS, 0x0002), (ChipShadow.WEIGHT, 0x0000),
+                           (ChipShadow.CTRL_TEST, 0x0001), (0x3C, 0x0000)):
+            self.shadow.load_weights(b"key")
+            self.shadow.write(addr, data)
+            self.assertFalse(self.shadow.weights_loaded(b"key"), hex(addr))
+
+    def test_observe(self):
+        data = DataGen.indir_write(ChipShadow.CONFIG_R, 0x0091) + DataGen.indir_read(ChipShadow.STATUS)
+        self.shadow.observe(data)
+        self.assertTrue(self.shadow.redundant(ChipShadow.CONFIG_R, 0x0091))
+        self.shadow.observe(data[4:])  # Address written by earlier data
+        self.assertFalse(self.shadow.redundant(ChipShadow.CONFIG_R, 0x0091))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Tests of the configuration cache: a simulated board is configured only when it does not provably run the bitstream.
+"""
+
+import logging
+import os
+import tempfile
+import unittest
+
+from fpga_host.config_cache import ConfigCache
+from fpga_host.fpga_tester import FPGATester
+from fpga_host.sim_device import SimFrontPanel
+
+
+class TestConfigCache(unittest.TestCase):
+
+    STARTS = 3
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.bitfile = os.path.join(self.directory.name, "fpga_top_w_chip.bit")
+        with open(self.bitfile, "wb") as bit:
+            bit.write(b"bitstream")
+        self.cache = os.path.join(self.directory.name, "config_cache.json")
+        logging.getLogger('CIM_Process').disabled = True
+
+    def tearDown(self):
+        logging.getLogger('CIM_Process').disabled = False
+        self.directory.cleanup()
+
+    def start(self, device):
+        """One program start on the board: the wire-out reads it made"""
+        reads = device.calls["UpdateWireOuts"]
+        fpga_tester = FPGATester(self.bitfile, device=device, config_cache=ConfigCache(self.cache))
+        self.assertTrue(fpga_tester.initialize_device())
+        return device.calls["UpdateWireOuts"] - reads
+
+    def test_build_id(self):
+        device = SimFrontPanel(build_id=0x1234)
+        reads = [self.start(device) for _ in range(self.STARTS)]
+        self.assertEqual(device.calls["ConfigureFPGA"], 1)
+        self.assertEqual(reads, [1] * self.STARTS)  # BUILD_ID read back after configuring, then verified
+
+    def test_no_build_id(self):
+        device = SimFrontPanel(build_id=0)
+        reads = [self.start(device) for _ in range(self.STARTS)]
+        self.assertEqual(device.calls["ConfigureFPGA"], self.STARTS)
+        self.assertEqual(reads, [1] + [0] * (self.STARTS - 1))  # Known to be 0 after the first start
+
+    def test_other_bitstream(self):
+        device = SimFrontPanel(build_id=0x1234)
+        self.start(device)
+        with open(self.bitfile, "wb") as bit:
+            bit.write(b"other bitstream")
+        self.start(device)
+        self.assertEqual(device.calls["ConfigureFPGA"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Tests of the vectorized nibble codec of DataGen, against the per-activation implementations it replaced.
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+from fpga_host.data_gen import DataGen
+
+
+def array_to_list(in_array):
+    """Per-nibble `DataGen.array_to_list`, high nibble first"""
+    return [(byte >> shift) & 0xF for byte in in_array for shift in (4, 0)]
+
+
+def list_to_array(in_list):
+    return bytearray(in_list[i] * 16 + in_list[i + 1] for i in range(0, len(in_list), 2))
+
+
+def act_scale(act_array):
+    act_list = array_to_list(act_array)
+    act_max = max(act_list)
+    scale_value = 1 if act_max == 0 else max(int(15 / act_max), 1)
+    act_list = [act * scale_value for act in act_list]
+    return list_to_array([act - 1 if act > 6 else act for act in act_list]), scale_value
+
+
+def act_pulsecompen(act_array):
+    return list_to_array([act - 1 if act > 6 else act for act in array_to_list(act_array)])
+
+
+class TestNibbleCodec(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.vectors = [DataGen.array_fullzeros(32), DataGen.array_fullff(32), DataGen.array_constant(32, 0x12)]
+        self.vectors += [bytearray(rng.randint(0, 255) for _ in range(32)) for _ in range(20)]
+        self.vectors += [bytearray(rng.randint(0, 5) * 17 for _ in range(32)) for _ in range(5)]
+
+    def test_unpack_nibbles(self):
+        activations = DataGen.unpack_nibbles(self.vectors)
+        self.assertEqual(activations.shape, (len(self.vectors), 64))
+        self.assertEqual(activations.tolist(), [array_to_list(vector) for vector in self.vectors])
+        self.assertEqual(DataGen.unpack_nibbles(np.array(self.vectors, dtype=np.uint8)).tolist(),
+                         activations.tolist())
+
+    def test_unpack_empty_batch(self):
+        self.assertEqual(DataGen.unpack_nibbles([]).shape, (0, 0))
+
+    def test_pack_round_trip(self):
+        packed = DataGen.pack_nibbles(DataGen.unpack_nibbles(self.vectors))
+        self.assertEqual([bytearray(vector.tobytes()) for vector in packed], self.vectors)
+
+    def test_array_list_conversions(self):
+        for vector in self.vectors:
+            act_list = DataGen.array_to_list(vector)
+            self.assertEqual(act_list, array_to_list(vector))
+            self.assertEqual(DataGen.list_to_array(act_list), vector)
+            self.assertIsInstance(DataGen.list_to_array(act_list), bytearray)
+
+    def test_act_scale(self):
+        for vector in self.vectors:
+            self.assertEqual(DataGen.act_scale(vector), act_scale(vector))
+        scaled, factors = DataGen.act_scale_batch(self.vectors)
+        self.assertEqual([(bytearray(row.tobytes()), int(factor)) for row, factor in zip(scaled, factors)],
+                         [act_scale(vector) for vector in self.vectors])
+
+    def test_act_pulsecompen(self):
+        for vector in self.vectors:
+            self.assertEqual(DataGen.act_pulsecompen(vector), act_pulsecompen(vector))
+        self.assertEqual([bytearray(row.tobytes()) for row in DataGen.act_pulsecompen_batch(self.vectors)],
+                         [act_pulsecompen(vector) for vector in self.vectors])
+
+    def test_act_encode(self):
+        vector = self.vectors[5]
+        self.assertEqual(DataGen.act_encode(vector), (act_pulsecompen(vector), None))
+        self.assertEqual(DataGen.act_encode(vector, scaled=True), act_scale(vector))
+
+    def test_random_vectors(self):
+        vectors = [bytearray(row.tobytes()) for row in np.random.default_rng(13).integers(0, 256, (200, 32),
+                                                                                             dtype=np.uint8)]
+        packed = np.array(vectors, dtype=np.uint8)
+        act_lists = [array_to_list(vector) for vector in vectors]
+        self.assertEqual(DataGen.unpack_nibbles(packed).tolist(), act_lists)
+        self.assertEqual(DataGen.pack_nibbles(act_lists).tolist(), packed.tolist())
+        self.assertEqual([bytearray(row.tobytes()) for row in DataGen.act_pulsecompen_batch(packed)],
+                         [act_pulsecompen(vector) for vector in vectors])
+        for vector in vectors:
+            self.assertEqual(DataGen.act_encode(vector), (act_pulsecompen(vector), None))
+            self.assertEqual(DataGen.act_encode(vector, scaled=True), act_scale(vector))
+
+
+class TestFifoaEncoder(unittest.TestCase):
+    """Vectorized indirect writes, against appending `indir_write` word by word"""
+
+    def setUp(self):
+        rng = np.random.default_rng(17)
+        self.weights = [bytearray(row.tobytes()) for row in rng.integers(0, 256, (4, 512), dtype=np.uint8)]
+        self.activations = [bytearray(row.tobytes()) for row in rng.integers(0, 256, (50, 32), dtype=np.uint8)]
+
+    def indir_write_loop(self, ind_addr, data):
+        stream = bytearray()
+        for i in range(0, len(data), 2):
+            stream.extend(DataGen.indir_write(ind_addr, (data[i] << 8) | data[i + 1]))
+        return stream
+
+    def test_indir_write_stream(self):
+        for weights in self.weights + [DataGen.array_fullff(512), DataGen.array_fullzeros(512)]:
+            stream = DataGen.indir_write_stream(0x30, weights)
+            self.assertIsInstance(stream, bytearray)
+            self.assertEqual(len(stream), 4096)
+            self.assertEqual(stream, self.indir_write_loop(0x30, weights))
+
+    def test_indir_write_batch(self):
+        reference = [self.indir_write_loop(0x34, vector) for vector in self.activations]
+        for batch in (self.activations, np.array(self.activations, dtype=np.uint8)):
+            self.assertEqual([bytearray(row.tobytes()) for row in DataGen.indir_write_batch(0x34, batch)], reference)
+
+    def test_invalid_batches(self):
+        with self.assertRaises(AssertionError):
+            DataGen.indir_write_batch(0x100, self.activations)
+        with self.assertRaises(AssertionError):
+            DataGen.indir_write_batch(0x34, [bytearray(3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
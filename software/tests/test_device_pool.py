@@ -0,0 +1,97 @@
+"""
+Tests of the device pool on simulated boards: the outputs of a sweep must not depend on the number of boards,
+and a failing board must make the pool raise instead of hanging.
+"""
+
+import os
+import unittest
+
+from fpga_host.cmd_parser import CmdlineParser
+from fpga_host.data_gen import DataGen
+from fpga_host.device_pool import BoardWorker, DevicePool, sim_device
+from fpga_host.sim_device import SimFrontPanel
+
+
+class FailingFrontPanel(SimFrontPanel):
+    """Simulated board whose USB link fails after `WRITES` pipe writes, or whose worker process dies."""
+
+    WRITES = 4
+
+    def __init__(self, serial, exit_process=False):
+        super().__init__(serial=serial)
+        self.exit_process = exit_process
+        self.writes = 0
+
+    def WriteToPipeIn(self, addr, data):
+        self.writes += 1
+        if self.writes > self.WRITES:
+            if self.exit_process:
+                os._exit(1)
+            raise IOError("USB link lost")
+        return super().WriteToPipeIn(addr, data)
+
+
+def failing_device(serial):
+    """Device factory of the pool tests (module level: picklable), the second board fails"""
+    return FailingFrontPanel(serial) if serial == "SIM00001" else SimFrontPanel(serial=serial)
+
+
+def exiting_device(serial):
+    """Device factory of the pool tests, the worker of the second board exits without any result"""
+    return FailingFrontPanel(serial, exit_process=True) if serial == "SIM00001" else SimFrontPanel(serial=serial)
+
+
+class TestDevicePool(unittest.TestCase):
+
+    CYCLES = 24
+
+    def setUp(self):
+        self.args = CmdlineParser().parser.parse_args(["--sim", "--log_level", "CRITICAL"])
+        self.weights = DataGen.array_fullff(512)
+        self.activations = [DataGen.array_fullzeros(32)]
+        for _ in range(self.CYCLES - 1):
+            self.activations.append(DataGen.act_plus_one(self.activations[-1]))
+        self.scaled = [False, True] * (self.CYCLES // 2)
+
+    def serials(self, boards):
+        return ["SIM{:05d}".format(i) for i in range(boards)]
+
+    def reference(self):
+        """Outputs of the sweep on one board driven by the test process"""
+        board = BoardWorker("SIM00000", sim_device, self.args)
+        board.fpga_init()
+        return [board.cim_processing(activations, self.weights if index == 0 else b"", scaled)
+                for index, (activations, scaled) in enumerate(zip(self.activations, self.scaled))]
+
+    def test_boards_give_the_outputs_of_one_board(self):
+        reference = self.reference()
+        for boards in (1, 2, 3):
+            with DevicePool(self.serials(boards), sim_device, self.args) as pool:
+                outputs, host_result = pool.run(self.weights, self.activations, self.scaled, host_work=lambda: 5)
+            self.assertEqual(outputs, reference, "{} boards".format(boards))
+            self.assertEqual(host_result, 5)
+
+    def test_weights_each_cycle(self):
+        with DevicePool(self.serials(1), sim_device, self.args) as pool:
+            once, _ = pool.run(self.weights, self.activations, self.scaled)
+        with DevicePool(self.serials(2), sim_device, self.args) as pool:
+            each, _ = pool.run(self.weights, self.activations, self.scaled, weights_each_cycle=True)
+        self.assertEqual(each, once)
+
+    def test_failing_board_raises(self):
+        pool = DevicePool(self.serials(3), failing_device, self.args)
+        with pool:
+            with self.assertRaisesRegex(RuntimeError, "Board SIM00001 failed"):
+                pool.run(self.weights, self.activations)
+        self.assertEqual(pool.workers, [])
+
+    def test_exited_worker_raises(self):
+        pool = DevicePool(self.serials(3), exiting_device, self.args)
+        with pool:
+            with self.assertRaisesRegex(RuntimeError, "board-SIM00001"):
+                pool.run(self.weights, self.activations)
+        self.assertEqual(pool.workers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests of the streaming column statistics and of the per-chip calibration table.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from fpga_host.cmd_parser import CmdlineParser
+from fpga_host.offset_calibration import CalibrationTable, ColumnStats
+
+
+class TestColumnStats(unittest.TestCase):
+
+    def setUp(self):
+        self.outputs = np.random.default_rng(3).normal(10.0, 4.0, size=(500, 64)).round()
+
+    def accumulate(self, stats, sizes):
+        begin = 0
+        for size in sizes:
+            stats.update(self.outputs[begin:begin + size])
+            begin += size
+        return stats
+
+    def test_moments(self):
+        stats = self.accumulate(ColumnStats(), [1, 99, 0, 250, 150])
+        self.assertEqual(stats.count, 500)
+        np.testing.assert_allclose(stats.mean, self.outputs.mean(axis=0))
+        np.testing.assert_allclose(stats.variance(), self.outputs.var(axis=0, ddof=1))
+        np.testing.assert_allclose(stats.std(), self.outputs.std(axis=0, ddof=1))
+
+    def test_exact_median_below_reservoir(self):
+        stats = self.accumulate(ColumnStats(reservoir=1024), [200, 300])
+        np.testing.assert_array_equal(stats.median(), np.median(self.outputs, axis=0))
+
+    def test_reservoir(self):
+        stats = self.accumulate(ColumnStats(reservoir=64, seed=1), [10, 490])
+        again = self.accumulate(ColumnStats(reservoir=64, seed=1), [10, 490])
+        np.testing.assert_array_equal(stats.sample, again.sample)
+        rows = {tuple(row) for row in self.outputs}
+        self.assertTrue(all(tuple(row) in rows for row in stats.sample))  # Whole outputs kept
+        self.assertLess(np.abs(stats.median() - np.median(self.outputs, axis=0)).max(), 3.0)
+
+
+class TestCalibrationTable(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "calibration.json")
+        stats = ColumnStats()
+        stats.update(np.tile(np.arange(-64, 64, 2) + 0.6, (5, 1)))
+        self.stats = stats
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_and_lookup(self):
+        table = CalibrationTable(self.path)
+        self.assertIsNone(table.lookup("chip"))
+        offsets = table.store("chip", self.stats)
+        self.assertEqual(offsets.dtype, np.int16)
+        self.assertEqual(offsets.tolist(), list(range(-64, 64, 2)))  # Rounded to even values
+        np.testing.assert_array_equal(CalibrationTable(self.path).lookup("chip"), offsets)
+        table.store("chip", self.stats)
+        self.assertEqual(CalibrationTable(self.path).entries["chip"]["revision"], 2)
+
+    def test_save_merges_other_processes(self):
+        first, second = CalibrationTable(self.path), CalibrationTable(self.path)
+        first.store("chip0", self.stats)
+        second.store("chip1", self.stats)
+        self.assertEqual(sorted(CalibrationTable(self.path).entries), ["chip0", "chip1"])
+
+    def test_invalid_tables(self):
+        logging.getLogger('CIM_Process').disabled = True
+        try:
+            with open(self.path, "w") as table_file:
+                table_file.write("{")
+            self.assertEqual(CalibrationTable(self.path).entries, {})
+            with open(self.path, "w") as table_file:
+                json.dump({"chip": {"version": CalibrationTable.VERSION + 1, "offsets": [0] * 64}}, table_file)
+            self.assertIsNone(CalibrationTable(self.path).lookup("chip"))
+        finally:
+            logging.getLogger('CIM_Process').disabled = False
+
+    def test_default_table_next_to_program(self):
+        path = CmdlineParser().parser.parse_args([]).calibration
+        self.assertTrue(os.path.isabs(path))
+        software = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(os.path.dirname(path), software)
+        self.assertTrue(os.path.isfile(os.path.join(software, "fpga_func.py")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of the LRU cache of encoded FIFOA streams.
+"""
+
+import unittest
+
+from fpga_host.stream_cache import StreamCache
+
+
+def get(cache, data, encode):
+    return cache.get(StreamCache.digest(data), data, encode)
+
+
+class CountingEncoder:
+    """Encoder doubling every byte, counting its calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        return bytearray(bytes(data) * 2)
+
+
+class TestStreamCache(unittest.TestCase):
+
+    def setUp(self):
+        self.encode = CountingEncoder()
+
+    def test_hits_encode_once(self):
+        cache = StreamCache(max_bytes=1024)
+        first = get(cache, bytearray(b"abcd"), self.encode)
+        self.assertEqual(first, bytearray(b"abcdabcd"))
+        self.assertIs(get(cache, b"abcd", self.encode), first)  # Keyed by content, not by object
+        self.assertEqual((self.encode.calls, cache.hits, cache.misses), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        cache = StreamCache(max_bytes=24)  # Three 8-byte streams
+        for data in (b"aaaa", b"bbbb", b"cccc"):
+            get(cache, data, self.encode)
+        get(cache, b"aaaa", self.encode)    # Most recently used
+        get(cache, b"dddd", self.encode)    # Evicts b"bbbb"
+        self.assertEqual(cache.nbytes, 24)
+        calls = self.encode.calls
+        get(cache, b"aaaa", self.encode)
+        self.assertEqual(self.encode.calls, calls)
+        get(cache, b"bbbb", self.encode)
+        self.assertEqual(self.encode.calls, calls + 1)
+
+    def test_disabled_and_oversized(self):
+        for cache, data in ((StreamCache(max_bytes=0), b"ab"), (StreamCache(max_bytes=8), b"abcdefgh")):
+            self.assertEqual(get(cache, data, self.encode), bytearray(bytes(data) * 2))
+            self.assertEqual((len(cache.streams), cache.nbytes), (0, 0))
+
+    def test_clear(self):
+        cache = StreamCache(max_bytes=1024)
+        get(cache, b"abcd", self.encode)
+        cache.clear()
+        self.assertEqual((len(cache.streams), cache.nbytes), (0, 0))
+        get(cache, b"abcd", self.encode)
+        self.assertEqual(self.encode.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
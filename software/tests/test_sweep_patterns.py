@@ -0,0 +1,72 @@
+"""
+Tests of the lazy sweep patterns, against the cycle-by-cycle DataGen increments they generate.
+"""
+
+import unittest
+
+from fpga_host.data_gen import DataGen
+from fpga_host.sweep_patterns import AppendRandom, PlusF, PlusOne, PlusOneEach, ShiftAppendPattern, SweepPattern
+
+
+def iterate(increment, cycles, start=None):
+    """Vectors of `cycles` cycles, each one the increment of the previous one"""
+    vectors = [DataGen.array_fullzeros(32) if start is None else bytearray(start)]
+    for _ in range(cycles - 1):
+        vectors.append(bytearray(increment(bytearray(vectors[-1]))))
+    return vectors
+
+
+class TestSweepPatterns(unittest.TestCase):
+
+    def test_plus_f(self):
+        self.assertEqual(PlusF(70, chunk=16).to_list(), iterate(DataGen.act_plus_f, 70))
+
+    def test_plus_f_start(self):
+        start = DataGen.array_constant(32, 0x12)
+        self.assertEqual(PlusF(40, start=start).to_list(), iterate(DataGen.act_plus_f, 40, start))
+
+    def test_plus_one(self):
+        self.assertEqual(PlusOne(961).to_list(), iterate(DataGen.act_plus_one, 961))
+
+    def test_plus_one_each(self):
+        self.assertEqual(PlusOneEach(20, chunk=7).to_list(), iterate(DataGen.act_plusone_each, 20))
+        start = DataGen.array_constant(32, 0x33)
+        self.assertEqual(PlusOneEach(20, start=start).to_list(), iterate(DataGen.act_plusone_each, 20, start))
+
+    def test_append_random(self):
+        pattern = AppendRandom(300, seed=7, high=5)
+        vectors = pattern.to_list()
+        self.assertEqual(vectors[0], DataGen.array_fullzeros(32))
+        for previous, vector in zip(vectors, vectors[1:]):
+            previous_list, vector_list = DataGen.array_to_list(previous), DataGen.array_to_list(vector)
+            self.assertEqual(vector_list[:-1], previous_list[1:])
+            self.assertLessEqual(vector_list[-1], 5)
+        self.assertEqual(AppendRandom(300, seed=7, high=5, chunk=13).to_list(), vectors)
+        self.assertNotEqual(AppendRandom(300, seed=8, high=5).to_list(), vectors)
+
+    def test_random_access(self):
+        for pattern in (PlusF(100), PlusOne(100), PlusOneEach(100), AppendRandom(600, seed=3)):
+            vectors = pattern.to_list()
+            self.assertEqual(len(vectors), len(pattern))
+            self.assertEqual(list(pattern.vectors(37)), vectors[37:])
+            self.assertEqual(pattern.vector(61), vectors[61])
+            self.assertEqual(bytearray(pattern.block(10, 20).tobytes()), b"".join(vectors[10:20]))
+
+    def test_first_cycle(self):
+        start = DataGen.array_constant(32, 0x12)
+        for pattern in (PlusF(60, start=start), AppendRandom(60, start=start, seed=2)):
+            self.assertEqual(pattern.vector(0), start)
+            self.assertEqual(bytearray(pattern.block(0, 1).tobytes()), start)
+
+    def test_empty(self):
+        self.assertEqual(PlusOne(0).to_list(), [])
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            SweepPattern(10)
+        with self.assertRaises(TypeError):
+            ShiftAppendPattern(10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Tests of the incremental theory tracker, against the full product of every cycle.
+"""
+
+import logging
+import unittest
+
+import numpy as np
+
+from fpga_host.data_gen import DataGen
+from fpga_host.sweep_patterns import AppendRandom, PlusOne
+from fpga_host.theory_tracker import TheoryTracker
+
+
+def theory(activations, weight_matrix):
+    """Full product of one cycle, from [0] to [63]"""
+    return np.dot(DataGen.unpack_nibbles([activations])[0].astype(np.int64), weight_matrix)[::-1]
+
+
+class TestTheoryTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.weights = np.random.default_rng(5).choice([-1, 1], size=(64, 64))
+
+    def check(self, tracker, vectors):
+        for vector in vectors:
+            self.assertEqual(tracker.update(vector).tolist(), theory(vector, self.weights).tolist())
+
+    def test_few_changes_are_incremental(self):
+        tracker = TheoryTracker(self.weights)
+        self.check(tracker, PlusOne(100).vectors())
+        self.assertEqual(tracker.full, 1)  # Only the first cycle
+        self.assertEqual(tracker.incremental, 99)
+        self.assertEqual(tracker.mismatches, 0)
+
+    def test_shifts_are_full_products(self):
+        tracker = TheoryTracker(self.weights)
+        self.check(tracker, AppendRandom(100, seed=1, high=15).vectors(64))  # Every random nibble shifted
+        self.assertEqual((tracker.full, tracker.incremental), (36, 0))
+
+    def test_resync(self):
+        tracker = TheoryTracker(self.weights, resync_every=8)
+        self.check(tracker, PlusOne(50).vectors())
+        self.assertEqual(tracker.full, 1 + 49 // 8)
+        self.assertEqual(tracker.mismatches, 0)
+
+    def test_drift_is_detected(self):
+        tracker = TheoryTracker(self.weights, resync_every=4)
+        vectors = PlusOne(8).to_list()
+        tracker.update(vectors[0])
+        tracker.outputs[3] += 1  # Incremental outputs out of sync
+        logging.getLogger('CIM_Process').disabled = True
+        try:
+            for vector in vectors[1:5]:
+                tracker.update(vector)
+        finally:
+            logging.getLogger('CIM_Process').disabled = False
+        self.assertEqual(tracker.mismatches, 1)
+        self.check(tracker, vectors[5:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests of the transaction log: a session recorded on a simulated board replays without mismatches.
+"""
+
+import os
+import tempfile
+import unittest
+
+from fpga_host.data_gen import DataGen
+from fpga_host.fpga_tester import FPGATester
+from fpga_host.sim_device import SimChip, SimFrontPanel
+from fpga_host.transaction_log import (GET_WIRE_OUT, MAGIC, PIPE_IN, PIPE_OUT, TransactionRecorder,
+                                       TransactionReplay)
+from fpga_host.transmission_data import TransData
+from fpga_host.wait_policy import POLICIES
+
+
+class TestTransactionLog(unittest.TestCase):
+
+    CYCLES = 4
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "session.oklog")
+        fpga_tester = FPGATester("fpga_top_w_chip.bit", device=SimFrontPanel(), record=self.path)
+        self.assertIsNotNone(fpga_tester.initialize_device())
+        trans = TransData(fpga_tester, POLICIES["ewma"]())
+        # Board setup of `BoardWorker.fpga_init`, then a few MAC cycles
+        trans.reset_host()
+        trans.reset_chip()
+        trans.reset_host()
+        trans.write_regs([(0x14, 0x0090), (0x00, 0x0003), (0x2C, 0x0003), (0x00, 0x0003)])
+        activations = DataGen.array_fullzeros(32)
+        self.outputs = []
+        for cycle in range(self.CYCLES):
+            outdata, _ = trans.mac_cycle(DataGen.act_pulsecompen(activations),
+                                         DataGen.array_fullff(512) if cycle == 0 else bytearray(0))
+            self.outputs.append(bytes(outdata))
+            trans.clear_act_reg()
+            activations = DataGen.act_plus_one(activations)
+        self.recorder = fpga_tester.device
+        fpga_tester.stop_recording()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def replay_device(self, chip=None):
+        fpga_tester = FPGATester("fpga_top_w_chip.bit", device=SimFrontPanel(chip=chip))
+        self.assertIsNotNone(fpga_tester.initialize_device())
+        return fpga_tester.device
+
+    def test_read(self):
+        self.assertIsInstance(self.recorder, TransactionRecorder)
+        with open(self.path, "rb") as log:
+            self.assertEqual(log.read(len(MAGIC)), MAGIC)
+        transactions = TransactionReplay.read(self.path)
+        self.assertEqual(len(transactions), self.recorder.ops)
+        times = [trans.time for trans in transactions]
+        self.assertEqual(times, sorted(times))
+        self.assertTrue(all(len(trans.data) == trans.value for trans in transactions if trans.op in (PIPE_IN,
+                                                                                                      PIPE_OUT)))
+        self.assertTrue(any(trans.op == GET_WIRE_OUT for trans in transactions))
+        reads = [bytes(trans.data[::4]) for trans in transactions if trans.op == PIPE_OUT and trans.value == 320]
+        self.assertEqual(reads, self.outputs)  # One byte of output per FIFOB word
+
+    def test_replay(self):
+        result = TransactionReplay(self.path).replay(self.replay_device(), sync=True)
+        self.assertEqual(result.mismatches, 0)
+        self.assertEqual(result.ops, self.recorder.ops)
+        self.assertEqual(result.pipe_bytes, sum(trans.value for trans in TransactionReplay.read(self.path)
+                                                if trans.op in (PIPE_IN, PIPE_OUT)))
+
+    def test_replay_detects_other_outputs(self):
+        chip = SimChip(column_offsets=[2] * 64)
+        result = TransactionReplay(self.path).replay(self.replay_device(chip), sync=True)
+        self.assertGreater(result.mismatches, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
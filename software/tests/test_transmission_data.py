@@ -0,0 +1,221 @@
+"""
+Tests of TransData: the batched MAC cycles against the per-cycle ones on simulated boards, and the vectorized
+decoder and theory engine against the per-bit and per-cycle ones.
+"""
+
+import random
+import unittest
+from functools import partial
+
+import numpy as np
+
+from fpga_host.cmd_parser import CmdlineParser
+from fpga_host.data_gen import DataGen
+from fpga_host.device_pool import BoardWorker, sim_device
+from fpga_host.sim_device import LatencyModel
+from fpga_host.transmission_data import TransData
+
+
+def decode_out(data):
+    """Per-bit decoder of one 80-byte output, the column offsets subtracted, from [0] to [63]"""
+    decode_data = []
+    for i in range(64):
+        int_data, negative = 0, False
+        for j in range(10):
+            bit_loc = j * 64 + i
+            bit = (data[bit_loc // 8] >> (7 - bit_loc % 8)) & 1
+            if j == 0:
+                negative = bit == 1
+            else:
+                int_data = int_data * 2 - bit if negative else int_data * 2 + (1 ^ bit)
+        decode_data.append(int_data * 2)
+    decode_data.reverse()
+    return [value - offset for value, offset in zip(decode_data, TransData.OFFSET_DATA)]
+
+
+def output_theory(activations, weights):
+    """Per-cycle theory outputs from the bits of the weights, from [0] to [63]"""
+    weight_binary = [1 if (weights[i // 8] >> (7 - i % 8)) & 1 else -1 for i in range(len(weights) * 8)]
+    activation_int = [(activations[i // 2] >> (4 if i % 2 == 0 else 0)) & 0xF for i in range(len(activations) * 2)]
+    return list(np.dot(np.reshape(weight_binary, (64, 64)).T, activation_int))[::-1]
+
+
+class TestMacBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.args = CmdlineParser().parser.parse_args(["--sim", "--log_level", "CRITICAL"])
+        rng = random.Random(11)
+        self.weights = bytearray(rng.randint(0, 255) for _ in range(512))
+        vectors = [bytearray(rng.randint(0, 255) for _ in range(32)) for _ in range(2 * TransData.batch_size() + 1)]
+        self.activations = DataGen.act_pulsecompen_batch(vectors)
+
+    def board(self):
+        """A board set up as the pool workers do, on the XEM6310 latency model (FIFOA drained at the SPI rate)"""
+        board = BoardWorker("SIM00000", partial(sim_device, latency=LatencyModel.xem6310()), self.args)
+        board.fpga_init()
+        return board
+
+    def per_cycle(self, count, weights):
+        trans = self.board().trans
+        outputs = []
+        for index in range(count):
+            outdata, _ = trans.mac_cycle(bytearray(self.activations[index].tobytes()),
+                                         weights if index == 0 else bytearray(0))
+            outputs.append(bytes(outdata))
+            trans.clear_act_reg()
+        return outputs
+
+    def batched(self, trans, count, weights):
+        """Outputs of `count` cycles by batches of at most `batch_size()` cycles"""
+        outputs = []
+        for begin in range(0, count, trans.batch_size()):
+            batch = self.activations[begin:min(begin + trans.batch_size(), count)]
+            outdata, _ = trans.mac_batch(batch, weights if begin == 0 else None)
+            outputs += [bytes(outdata[80 * i:80 * (i + 1)]) for i in range(len(batch))]
+        return outputs
+
+    def check(self, board, outputs, reference):
+        device = board.fpga_tester.device
+        self.assertEqual((device.fifoa_overflow, device.fifob_overflow), (0, 0))
+        self.assertEqual(outputs, reference)
+
+    def test_batches(self):
+        for count in (1, TransData.batch_size(), TransData.batch_size() + 1):
+            board = self.board()
+            self.check(board, self.batched(board.trans, count, self.weights), self.per_cycle(count, self.weights))
+
+    def test_batches_without_weights(self):
+        count = TransData.batch_size() + 1
+        reference = self.per_cycle(count + 1, self.weights)[1:]
+        board = self.board()
+        board.trans.mac_cycle(bytearray(self.activations[0].tobytes()), self.weights)  # Weights loaded beforehand
+        board.trans.clear_act_reg()
+        self.activations = self.activations[1:]
+        self.check(board, self.batched(board.trans, count, bytearray(0)), reference)
+
+    def test_elided_weights(self):
+        board = self.board()
+        count = TransData.batch_size()
+        piped = board.trans.fifoa_bytes
+        first = self.batched(board.trans, count, self.weights)
+        first_bytes, piped = board.trans.fifoa_bytes - piped, board.trans.fifoa_bytes
+        self.check(board, self.batched(board.trans, count, self.weights), first)  # Weights still loaded
+        self.assertEqual(board.trans.fifoa_bytes - piped, first_bytes - len(self.weights) * 8)
+
+    def test_batch_size(self):
+        with self.assertRaises(AssertionError):
+            self.board().trans.mac_batch(self.activations[:TransData.batch_size() + 1])
+
+
+class TestMacTrigger(unittest.TestCase):
+
+    CYCLES = 5
+
+    def setUp(self):
+        self.args = CmdlineParser().parser.parse_args(["--sim", "--log_level", "CRITICAL"])
+        self.activations = [DataGen.act_pulsecompen(DataGen.array_constant(32, 0x11 * i)) for i in range(self.CYCLES)]
+
+    def run_cycles(self, mac_trigger, fused=False):
+        """A board running CYCLES MAC cycles: (trans, its device)"""
+        board = BoardWorker("SIM00000", partial(sim_device, mac_trigger=mac_trigger), self.args)
+        board.fpga_init()
+        for index, activations in enumerate(self.activations):
+            board.trans.mac_cycle(activations, DataGen.array_fullff(512) if index == 0 else bytearray(0), fused)
+            board.trans.clear_act_reg()
+        return board.trans, board.fpga_tester.device
+
+    def test_missing_trigger_detected_once(self):
+        trans, device = self.run_cycles(mac_trigger=False)
+        self.assertIs(trans.mac_trigger, False)
+        self.assertEqual(device.calls["UpdateTriggerOuts"], 1)  # One check after the first MAC, no timeout
+
+    def test_trigger(self):
+        trans, device = self.run_cycles(mac_trigger=True)
+        self.assertIs(trans.mac_trigger, True)
+        self.assertEqual(device.calls["UpdateTriggerOuts"], self.CYCLES)  # One wait per MAC
+
+    def test_fused_cycles_consume_once(self):
+        trans, device = self.run_cycles(mac_trigger=True)
+        board_calls = device.calls["UpdateTriggerOuts"]
+        for activations in self.activations:
+            trans.mac_cycle(activations, bytearray(0), fused=True)
+            trans.clear_act_reg()
+        self.assertEqual(device.calls["UpdateTriggerOuts"], board_calls)  # No round trip per fused MAC
+        self.assertTrue(trans.mac_trigger_stale)
+        outdata, _ = trans.mac_cycle(self.activations[1], bytearray(0))
+        self.assertFalse(trans.mac_trigger_stale)
+        self.assertEqual(device.calls["UpdateTriggerOuts"], board_calls + 2)  # Consumed, then waited on
+        fused_trans, _ = self.run_cycles(mac_trigger=True, fused=True)
+        self.assertEqual(bytes(outdata), bytes(fused_trans.mac_cycle(self.activations[1], bytearray(0), True)[0]))
+
+
+class TestDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.trans = TransData(None)
+        rng = np.random.default_rng(19)
+        self.outputs = rng.integers(0, 256, (50, 80), dtype=np.uint8)
+        self.outputs[0], self.outputs[1] = 0x00, 0xFF  # Extreme values of every column
+        self.reference = [decode_out(output.tobytes()) for output in self.outputs]
+
+    def test_decode_batch(self):
+        self.assertEqual(self.trans.decode_batch(self.outputs).tolist(), self.reference)
+        buffer = bytearray(4 * self.outputs.size)
+        buffer[::4] = self.outputs.tobytes()
+        self.assertEqual(self.trans.decode_batch(memoryview(buffer)[::4]).tolist(), self.reference)  # FIFOB words
+
+    def test_decode_raw(self):
+        raw = TransData.decode_raw(self.outputs)
+        self.assertEqual(raw.dtype, np.int16)
+        self.assertEqual((raw - TransData.OFFSET_ARRAY).tolist(), self.reference)
+
+    def test_decode_cycle(self):
+        output = bytearray(self.outputs[7].tobytes())
+        decode_data = [1, 2]
+        self.trans.decode_out(output, decode_data)
+        self.assertEqual(decode_data, self.reference[7])
+        self.assertEqual(self.trans.decode_cycle(output), self.reference[7])
+        self.assertEqual(self.trans.decode_cycle(output, 3), [value / 3 for value in self.reference[7]])
+
+    def test_load_offsets(self):
+        self.trans.load_offsets([2] * 64)
+        self.assertEqual(self.trans.decode_batch(self.outputs[:1]).tolist(),
+                         [(TransData.decode_raw(self.outputs[:1])[0] - 2).tolist()])
+        self.trans.load_offsets()
+        self.assertEqual(self.trans.decode_batch(self.outputs[:1]).tolist(), self.reference[:1])
+
+
+class TestTheory(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(23)
+        self.weights = [bytearray(row.tobytes()) for row in rng.integers(0, 256, (3, 512), dtype=np.uint8)]
+        self.weights.append(DataGen.array_fullff(512))
+        self.activations = rng.integers(0, 256, (40, 32), dtype=np.uint8)
+        self.activations[0] = 0xFF  # Largest outputs: 64 x 15
+        self.vectors = [bytearray(row.tobytes()) for row in self.activations]
+
+    def test_theory_batch(self):
+        trans = TransData(None)
+        for weights in self.weights:
+            reference = [output_theory(vector, weights) for vector in self.vectors]
+            batch = trans.theory_batch(self.activations, weights)
+            self.assertEqual(batch.dtype, np.int64)
+            self.assertEqual(batch.tolist(), reference)
+            self.assertEqual(trans.theory_batch(self.vectors, weights).tolist(), reference)
+
+    def test_output_theory(self):
+        trans = TransData(None)
+        for weights in self.weights:
+            batch = trans.theory_batch(self.activations, weights).tolist()
+            self.assertEqual([trans.output_theory(vector, weights) for vector in self.vectors], batch)
+
+    def test_theory_weights_cached(self):
+        trans = TransData(None)
+        matrix = trans.theory_weights(self.weights[0])
+        self.assertIs(trans.theory_weights(bytearray(self.weights[0])), matrix)
+        self.assertIsNot(trans.theory_weights(self.weights[1]), matrix)
+
+
+if __name__ == "__main__":
+    unittest.main()
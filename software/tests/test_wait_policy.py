@@ -0,0 +1,34 @@
+"""
+Tests of the polling policies of the wait loops.
+"""
+
+import unittest
+
+from fpga_host.wait_policy import BackoffPolicy, EwmaPolicy, SpinPolicy
+
+
+class TestBackoffPolicy(unittest.TestCase):
+
+    def test_exponential_up_to_cap(self):
+        policy = BackoffPolicy(initial=20e-6, factor=2.0, cap=1e-3)
+        delays = [policy.next_delay(None, polls) for polls in range(1, 10)]
+        self.assertEqual(delays[:6], [20e-6 * 2 ** k for k in range(6)])
+        self.assertEqual(delays[6:], [1e-3] * 3)
+
+    def test_long_wait(self):
+        # factor ** (polls - 1) overflows a float after ~1000 polls
+        for policy in (BackoffPolicy(), EwmaPolicy(), BackoffPolicy(factor=1.0), BackoffPolicy(initial=2e-3)):
+            for polls in (1000, 1100, 10 ** 6):
+                self.assertLessEqual(policy.next_delay(None, polls), policy.cap)
+
+    def test_wait(self):
+        polls = iter(range(5))
+        for policy in (SpinPolicy(), BackoffPolicy(initial=1e-6, cap=1e-5)):
+            self.assertTrue(policy.wait("event", lambda: next(polls, 4) >= 4))
+            self.assertFalse(policy.wait("never", lambda: False, timeout=1e-3))
+            self.assertEqual(policy.get_stats("event").count, 1)
+            self.assertEqual(policy.get_stats("never").count, 0)  # Timeouts are not recorded
+
+
+if __name__ == "__main__":
+    unittest.main()